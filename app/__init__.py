@@ -1,20 +1,66 @@
-import os
 from flask import Flask
-from flask_migrate import Migrate
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 
 from config import Config
+from app.database import RoutingSession, EngineTuning, configure_pools
+from app.passwords import PasswordHasher
+from app.user_cache import UserCache
+from app.images import ImageProcessor
+from app.media import MediaStore
+from app.identicons import IdenticonService
+from app.assets import StaticAssets
+from app.fragments import FragmentCache
+from app.query_budget import QueryBudget
+from app.metrics import Metrics
+from app.notify import Notifier
 
-app = Flask(__name__)
-app.config.from_object(Config)
-if not os.path.exists(app.config['AVATAR_UPLOAD_FOLDER']):
-    os.makedirs(app.config['AVATAR_UPLOAD_FOLDER'])
-if not os.path.exists(app.config['IMAGE_UPLOAD_FOLDER']):
-    os.makedirs(app.config['IMAGE_UPLOAD_FOLDER'])
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-login = LoginManager(app)
-login.login_view = "login"
-
-from app import routes, models
\ No newline at end of file
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+engine_tuning = EngineTuning()
+login = LoginManager()
+login.login_view = "main.login"
+# The API answers 401 instead of redirecting to the login page.
+login.blueprint_login_views["api"] = None
+passwords = PasswordHasher()
+user_cache = UserCache()
+images = ImageProcessor()
+media = MediaStore()
+identicons = IdenticonService()
+assets = StaticAssets()
+fragments = FragmentCache()
+query_budget = QueryBudget()
+metrics = Metrics()
+notifier = Notifier()
+
+
+def create_app(config_class=Config):
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+    configure_pools(app)
+    db.init_app(app)
+    engine_tuning.init_app(app, db)
+    login.init_app(app)
+    passwords.init_app(app)
+    user_cache.init_app(app)
+    images.init_app(app)
+    media.init_app(app)
+    identicons.init_app(app)
+    assets.init_app(app)
+    fragments.init_app(app)
+    query_budget.init_app(app, db)
+    metrics.init_app(app, db)
+    notifier.init_app(app)
+
+    # Registers the tables on db.metadata before anything queries them.
+    from app import models  # noqa: F401
+
+    from app.routes import bp as main_bp
+    app.register_blueprint(main_bp)
+
+    from app.api import bp as api_bp
+    app.register_blueprint(api_bp)
+
+    from app.cli import bp as cli_bp
+    app.register_blueprint(cli_bp)
+
+    return app
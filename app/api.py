@@ -0,0 +1,235 @@
+import json
+import hashlib
+from enum import Enum
+from datetime import date, timezone
+import sqlalchemy as sa
+from flask import Blueprint, current_app, request, jsonify, abort, url_for
+from flask_login import current_user, login_required
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import is_resource_modified
+
+from app import db
+from app.models import User, Profile, Hospital, DonorApplication
+from app.enums import BloodGroupEnum, DonorApplicationStatusEnum
+from app.pagination import paginate_keyset
+
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# A user changes when either their account or their profile does.
+_user_version = sa.case((Profile.updated_at > User.updated_at, Profile.updated_at), else_=User.updated_at)
+
+# fields: what ?fields= can ask for, by public name; all of them by default.
+# key identifies one item, order is the keyset, version is the column the
+# ETag and Last-Modified are computed from.
+RESOURCES = {
+    'hospitals': {
+        'table': Hospital,
+        'fields': {
+            'hrn': Hospital.hrn, 'name': Hospital.name, 'address': Hospital.address,
+            'city_or_town': Hospital.city_or_town, 'state': Hospital.state, 'zip_code': Hospital.zip_code,
+            'phone': Hospital.phone, 'email': Hospital.email, 'latitude': Hospital.latitude,
+            'longitude': Hospital.longitude, 'updated_at': Hospital.updated_at,
+        },
+        'key': Hospital.hrn,
+        'order': [Hospital.name],
+        'version': Hospital.updated_at,
+        'filters': {'state': Hospital.state, 'city_or_town': Hospital.city_or_town, 'zip_code': Hospital.zip_code},
+    },
+    'users': {
+        'table': User,
+        'fields': {
+            'username': User.username, 'email': User.email, 'phone': User.phone, 'dob': Profile.dob,
+            'gender': Profile.gender, 'address': Profile.address, 'state': Profile.state,
+            'zip_code': Profile.zip_code, 'blood_group': Profile.blood_group, 'updated_at': _user_version,
+        },
+        'join': lambda stmt: stmt.outerjoin(Profile, Profile.user_id == User.id),
+        'key': User.username,
+        'order': [User.username],
+        'version': _user_version,
+        'filters': {'state': Profile.state, 'blood_group': Profile.blood_group},
+    },
+    'applications': {
+        'table': DonorApplication,
+        'fields': {
+            'id': DonorApplication.id, 'username': User.username, 'status': DonorApplication.status,
+            'height': DonorApplication.height, 'weight': DonorApplication.wight,
+            'habits': DonorApplication.habbits, 'submitted_at': DonorApplication.timestamp,
+            'note': DonorApplication.note, 'updated_at': DonorApplication.updated_at,
+        },
+        'join': lambda stmt: stmt.join(User, User.id == DonorApplication.user_id),
+        'key': DonorApplication.id,
+        'order': [DonorApplication.timestamp, DonorApplication.id],
+        'version': DonorApplication.updated_at,
+        'filters': {'status': DonorApplication.status},
+    },
+}
+FILTER_ENUMS = {'blood_group': BloodGroupEnum, 'status': DonorApplicationStatusEnum}
+RESERVED_ARGS = ('fields', 'cursor', 'limit')
+
+
+@bp.errorhandler(HTTPException)
+def _error(e):
+    return jsonify(error=e.description), e.code
+
+
+def _require_admin():
+    if not current_user.is_admin:
+        abort(403, 'Only administrators can read this resource.')
+
+
+def _fields(resource):
+    requested = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    if not requested:
+        return list(resource['fields'])
+    unknown = [name for name in requested if name not in resource['fields']]
+    if unknown:
+        abort(400, 'Unknown fields: {}'.format(', '.join(unknown)))
+    return list(dict.fromkeys(requested))
+
+
+def _filters(resource):
+    filters = {}
+    for name, value in request.args.items():
+        if name in RESERVED_ARGS or not value:
+            continue
+        if name not in resource['filters']:
+            abort(400, 'Cannot filter by {}'.format(name))
+        if name in FILTER_ENUMS:
+            try:
+                value = FILTER_ENUMS[name][value]
+            except KeyError:
+                abort(400, 'Unknown {} {!r}'.format(name, value))
+        filters[name] = value
+    return filters
+
+
+def _select(resource, *columns):
+    stmt = sa.select(*columns).select_from(resource['table'])
+    if 'join' in resource:
+        stmt = resource['join'](stmt)
+    return stmt
+
+
+def _plain(value):
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def _item(fields, row):
+    return {name: _plain(value) for name, value in zip(fields, row)}
+
+
+def _utc(value):
+    # SQLite hands back naive datetimes; they are stored in UTC.
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _conditional(validators, last_modified, body):
+    # validators: everything the representation depends on. They come from
+    # a query on the key and version columns only, so an unchanged resource
+    # is answered with a 304 before the requested fields are ever selected.
+    etag = hashlib.sha1(json.dumps(validators, default=str).encode('utf-8')).hexdigest()
+    last_modified = _utc(last_modified)
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = jsonify(body())
+    else:
+        response = current_app.response_class(status=304)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _collection(name):
+    resource = RESOURCES[name]
+    fields = _fields(resource)
+    filters = _filters(resource)
+    per_page = request.args.get('limit', current_app.config['API_PER_PAGE'], type=int)
+    if not 1 <= per_page <= current_app.config['API_MAX_PER_PAGE']:
+        abort(400, 'limit must be between 1 and {}'.format(current_app.config['API_MAX_PER_PAGE']))
+    cursor = request.args.get('cursor')
+
+    def page(*columns):
+        stmt = _select(resource, *columns)
+        for field, value in filters.items():
+            stmt = stmt.where(resource['filters'][field] == value)
+        return paginate_keyset(db.session, stmt, resource['order'], cursor=cursor, per_page=per_page, scalars=False)
+
+    versions = page(resource['key'], resource['version'])
+
+    def body():
+        found = page(*(resource['fields'][field].label(field) for field in fields))
+        next_url = None
+        if found.has_next:
+            next_url = url_for('api.' + name, _external=True, cursor=found.next_cursor, limit=per_page,
+                               fields=request.args.get('fields') or None,
+                               **{field: request.args[field] for field in filters})
+        return {'items': [_item(fields, row) for row in found], 'next_cursor': found.next_cursor, 'next': next_url}
+
+    return _conditional(
+        [fields, per_page, [list(row) for row in versions], versions.next_cursor],
+        max((version for _, version in versions), default=None),
+        body
+    )
+
+
+def _resource(name, key):
+    resource = RESOURCES[name]
+    fields = _fields(resource)
+    version = db.session.scalar(_select(resource, resource['version']).where(resource['key'] == key))
+    if version is None:
+        abort(404, 'No such {}.'.format(name[:-1]))
+
+    def body():
+        row = db.session.execute(
+            _select(resource, *(resource['fields'][field].label(field) for field in fields))
+            .where(resource['key'] == key)
+        ).one()
+        return _item(fields, row)
+
+    return _conditional([fields, key, version], version, body)
+
+
+@bp.route('/hospitals')
+@login_required
+def hospitals():
+    return _collection('hospitals')
+
+
+@bp.route('/hospitals/<hrn>')
+@login_required
+def hospital(hrn):
+    return _resource('hospitals', hrn)
+
+
+@bp.route('/users')
+@login_required
+def users():
+    _require_admin()
+    return _collection('users')
+
+
+@bp.route('/users/<username>')
+@login_required
+def user(username):
+    return _resource('users', username)
+
+
+@bp.route('/applications')
+@login_required
+def applications():
+    _require_admin()
+    return _collection('applications')
+
+
+@bp.route('/applications/<int:id>')
+@login_required
+def application(id):
+    _require_admin()
+    return _resource('applications', id)
@@ -0,0 +1,242 @@
+import time
+import logging
+import threading
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+from app import db
+from app import metrics
+from app.models import User, DonorApplication
+from app.enums import DonorApplicationStatusEnum
+from app.pagination import paginate_keyset
+from app.constants import (
+    DONOR_MIN_AGE,
+    DONOR_MAX_AGE,
+    DONOR_MIN_WEIGHT,
+    DONOR_MIN_HEIGHT,
+    DONOR_MAX_HEIGHT,
+    DONOR_DISQUALIFYING_HABITS
+)
+
+logger = logging.getLogger(__name__)
+
+REVIEW_BATCH_SIZE = 500
+# Statuses a reviewer decides on: new applications and the ones the
+# automated check gave up on.
+REVIEWABLE_STATUSES = (DonorApplicationStatusEnum.PENDING, DonorApplicationStatusEnum.FAILED)
+
+
+def application_queue(status, cursor=None, per_page=100):
+    # Oldest first within a status. ix_donor_application_status_timestamp
+    # serves both the filter and the (timestamp, id) seek, id being the
+    # tiebreaker the index already carries as its rowid / heap pointer.
+    stmt = (
+        sa.select(DonorApplication)
+        .where(DonorApplication.status == status)
+        .options(so.joinedload(DonorApplication.applicant).joinedload(User.profile))
+    )
+    return paginate_keyset(
+        db.session, stmt, [DonorApplication.timestamp, DonorApplication.id],
+        cursor=cursor, per_page=per_page
+    )
+
+
+def review_applications(ids, status, from_status=DonorApplicationStatusEnum.PENDING):
+    # One set-based UPDATE per batch of ids. The status guard makes a
+    # second reviewer (or a retried request) a no-op instead of overwriting
+    # a decision. Returns how many applications actually changed.
+    ids = sorted(set(ids))
+    changed = 0
+    for start in range(0, len(ids), REVIEW_BATCH_SIZE):
+        result = db.session.execute(
+            sa.update(DonorApplication)
+            .where(DonorApplication.id.in_(ids[start:start + REVIEW_BATCH_SIZE]),
+                   DonorApplication.status == from_status)
+            .values(status=status)
+            .execution_options(synchronize_session=False)
+        )
+        changed += result.rowcount
+    return changed
+
+
+def check_eligibility(application, profile, today):
+    # Returns the reasons the applicant cannot donate, empty if they can.
+    reasons = []
+    if profile is None:
+        reasons.append('No donor profile')
+    else:
+        dob = profile.dob
+        age = today.year - dob.year - ((today.month, today.day) < (dob.month, dob.day))
+        if not DONOR_MIN_AGE <= age <= DONOR_MAX_AGE:
+            reasons.append('Age {} is outside {}-{}'.format(age, DONOR_MIN_AGE, DONOR_MAX_AGE))
+    if application.wight < DONOR_MIN_WEIGHT:
+        reasons.append('Weight below {} kg'.format(DONOR_MIN_WEIGHT))
+    if not DONOR_MIN_HEIGHT <= application.height <= DONOR_MAX_HEIGHT:
+        reasons.append('Height outside {}-{} cm'.format(DONOR_MIN_HEIGHT, DONOR_MAX_HEIGHT))
+    habits = (application.habbits or '').lower()
+    if any(word in habits for word in DONOR_DISQUALIFYING_HABITS):
+        reasons.append('Disqualifying habits')
+    return reasons
+
+
+def _claimable(now, max_attempts, claim_timeout):
+    due = sa.or_(DonorApplication.next_attempt_at.is_(None), DonorApplication.next_attempt_at <= now)
+    return sa.or_(
+        sa.and_(DonorApplication.status == DonorApplicationStatusEnum.PENDING,
+                DonorApplication.attempts < max_attempts, due),
+        # Claimed by a worker that died before finishing.
+        sa.and_(_abandoned(now, claim_timeout), DonorApplication.attempts < max_attempts),
+    )
+
+
+def _abandoned(now, claim_timeout):
+    return sa.and_(DonorApplication.status == DonorApplicationStatusEnum.PROCESSING,
+                   DonorApplication.claimed_at < now - timedelta(seconds=claim_timeout))
+
+
+def fail_abandoned(max_attempts, claim_timeout, now=None):
+    # An application whose worker died on its last attempt is not claimed
+    # again; it goes to reviewers as FAILED. Returns how many were failed.
+    now = now or datetime.now(timezone.utc)
+    return db.session.execute(
+        sa.update(DonorApplication)
+        .where(_abandoned(now, claim_timeout), DonorApplication.attempts >= max_attempts)
+        .values(status=DonorApplicationStatusEnum.FAILED, claimed_at=None,
+                note='Automated check abandoned after {} attempts'.format(max_attempts))
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+
+def claim_applications(limit, max_attempts, claim_timeout, now=None):
+    # Same claim as inventory.allocate: Postgres skips rows another worker
+    # has locked, SQLite's write lock makes the single UPDATE atomic.
+    now = now or datetime.now(timezone.utc)
+    claimable = _claimable(now, max_attempts, claim_timeout)
+    candidates = (
+        sa.select(DonorApplication.id)
+        .where(claimable)
+        .order_by(DonorApplication.timestamp, DonorApplication.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return db.session.scalars(
+        sa.update(DonorApplication)
+        .where(DonorApplication.id.in_(candidates), claimable)
+        .values(status=DonorApplicationStatusEnum.PROCESSING, claimed_at=now,
+                attempts=DonorApplication.attempts + 1)
+        .returning(DonorApplication.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+def process_application(application_id, today=None):
+    application = db.session.get(
+        DonorApplication, application_id,
+        options=[so.joinedload(DonorApplication.applicant).joinedload(User.profile)]
+    )
+    applicant = application.applicant
+    reasons = check_eligibility(application, applicant.profile if applicant else None, today or date.today())
+    decision = DonorApplicationStatusEnum.REJECTED if reasons else DonorApplicationStatusEnum.APPROVED
+    db.session.execute(
+        sa.update(DonorApplication)
+        .where(DonorApplication.id == application_id,
+               DonorApplication.status == DonorApplicationStatusEnum.PROCESSING)
+        .values(status=decision, claimed_at=None, note='; '.join(reasons)[:256] or None)
+        .execution_options(synchronize_session=False)
+    )
+    return decision
+
+
+def release_application(application_id, error, max_attempts, backoff, now=None):
+    # Puts a failed application back as PENDING, to be retried after
+    # backoff * 2**(attempts - 1) seconds. After max_attempts it is marked
+    # FAILED and left for a reviewer in the admin queue.
+    now = now or datetime.now(timezone.utc)
+    attempts = db.session.scalar(sa.select(DonorApplication.attempts).where(DonorApplication.id == application_id))
+    retry = attempts < max_attempts
+    db.session.execute(
+        sa.update(DonorApplication)
+        .where(DonorApplication.id == application_id,
+               DonorApplication.status == DonorApplicationStatusEnum.PROCESSING)
+        .values(status=DonorApplicationStatusEnum.PENDING if retry else DonorApplicationStatusEnum.FAILED,
+                claimed_at=None,
+                next_attempt_at=now + timedelta(seconds=backoff * 2 ** (attempts - 1)) if retry else None,
+                note='Automated check failed ({} of {}): {}'.format(attempts, max_attempts, error)[:256])
+        .execution_options(synchronize_session=False)
+    )
+    return retry
+
+
+class ApplicationWorker:
+    # Claims batches of pending applications and checks them on a thread
+    # pool, each application in its own app context and transaction. The
+    # claimed rows are the queue: they survive restarts, and rows held by a
+    # worker that died are reclaimed after APPLICATION_WORKER_CLAIM_TIMEOUT.
+    def __init__(self, app, concurrency=None, batch_size=None):
+        self.app = app
+        self.concurrency = concurrency or app.config['APPLICATION_WORKER_CONCURRENCY']
+        self.batch_size = batch_size or app.config['APPLICATION_WORKER_BATCH_SIZE']
+        self.poll_interval = app.config['APPLICATION_WORKER_POLL_INTERVAL']
+        self.max_attempts = app.config['APPLICATION_WORKER_MAX_ATTEMPTS']
+        self.backoff = app.config['APPLICATION_WORKER_BACKOFF']
+        self.claim_timeout = app.config['APPLICATION_WORKER_CLAIM_TIMEOUT']
+        self._stopping = threading.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _process(self, application_id):
+        with self.app.app_context():
+            started = time.perf_counter()
+            try:
+                outcome = process_application(application_id).name.lower()
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.exception('Checking donor application %s failed', application_id)
+                try:
+                    retry = release_application(application_id, e, self.max_attempts, self.backoff)
+                    db.session.commit()
+                    outcome = 'retry' if retry else 'failed'
+                except Exception:
+                    # Still PROCESSING: reclaimed after the claim timeout.
+                    db.session.rollback()
+                    logger.exception('Releasing donor application %s failed', application_id)
+                    outcome = 'error'
+            metrics.observe('application_worker_duration_seconds', (), time.perf_counter() - started)
+            metrics.inc('application_worker_processed_total', (('outcome', outcome),))
+            return outcome
+
+    def run_batch(self, pool):
+        with self.app.app_context():
+            failed = fail_abandoned(self.max_attempts, self.claim_timeout)
+            ids = claim_applications(self.batch_size, self.max_attempts, self.claim_timeout)
+            db.session.commit()
+        if failed:
+            metrics.inc('application_worker_processed_total', (('outcome', 'abandoned'),), failed)
+        metrics.inc('application_worker_claimed_total', (), len(ids))
+        return list(pool.map(self._process, ids))
+
+    def run(self, once=False):
+        # With once=True, returns when nothing is left to claim.
+        totals = Counter()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='application-worker') as pool:
+            while not self._stopping.is_set():
+                batch_started = time.perf_counter()
+                outcomes = self.run_batch(pool)
+                totals.update(outcomes)
+                metrics.flush()
+                if outcomes:
+                    elapsed = time.perf_counter() - batch_started
+                    logger.info('Processed %d applications in %.2fs (%.1f/s)', len(outcomes), elapsed,
+                                len(outcomes) / elapsed)
+                elif once:
+                    break
+                else:
+                    self._stopping.wait(self.poll_interval)
+        elapsed = time.perf_counter() - started
+        return dict(totals, elapsed=elapsed, rate=sum(totals.values()) / elapsed if elapsed else 0.0)
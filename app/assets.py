@@ -0,0 +1,77 @@
+import os
+import hashlib
+from flask import current_app, request, send_from_directory
+
+from app.media import BLOB_PATTERN, CHUNK_SIZE
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+class StaticAssets:
+    # Fingerprints static files. A manifest of content hashes is built once
+    # at startup and url_for('static', ...) appends ?v=<hash>, so a request
+    # carrying the current hash can be cached forever. Uploads are already
+    # named after their SHA-256 and are not hashed again.
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        self.max_age = app.config['ASSET_MAX_AGE']
+        self.upload_folders = {app.config['AVATAR_UPLOAD_FOLDER'], app.config['IMAGE_UPLOAD_FOLDER']}
+        self.manifest = self.build_manifest()
+        app.extensions['static_assets'] = self
+        app.url_defaults(self.add_fingerprint)
+        app.view_functions['static'] = self.send_static
+
+    def build_manifest(self):
+        manifest = {}
+        for root, dirs, files in os.walk(self.static_folder):
+            dirs[:] = [d for d in dirs if os.path.join(root, d) not in self.upload_folders]
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+                manifest[filename] = (os.stat(path).st_mtime_ns, file_digest(path))
+        return manifest
+
+    def add_fingerprint(self, endpoint, values):
+        if endpoint == 'static' and 'filename' in values:
+            entry = self.manifest.get(values['filename'])
+            if entry is not None:
+                values.setdefault('v', entry[1])
+
+    def lookup(self, filename):
+        # Returns (etag, fingerprinted) for a static filename.
+        match = BLOB_PATTERN.match(os.path.basename(filename))
+        if match:
+            return match.group(1) + (match.group(2) or ''), True
+        entry = self.manifest.get(filename)
+        if entry is None:
+            return None, False
+        path = os.path.join(self.static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return None, False
+        if mtime != entry[0]:
+            # Edited since startup: serve the new content, but only cache it
+            # for good once pages link to the new hash.
+            entry = self.manifest[filename] = (mtime, file_digest(path))
+        return entry[1], request.args.get('v') == entry[1]
+
+    def send_static(self, filename):
+        etag, fingerprinted = self.lookup(filename)
+        max_age = self.max_age if fingerprinted else current_app.get_send_file_max_age(filename)
+        response = send_from_directory(self.static_folder, filename, etag=etag or True, max_age=max_age)
+        if fingerprinted:
+            response.cache_control.public = True
+            response.cache_control.immutable = True
+        return response
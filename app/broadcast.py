@@ -0,0 +1,245 @@
+import time
+import logging
+import sqlalchemy as sa
+from flask import current_app
+from datetime import date, datetime, timedelta, timezone
+
+from app import db
+from app import geo
+from app import metrics
+from app import notifier
+from app.notify import build_message, addressed
+from app.enums import BloodGroupEnum, NotificationStatusEnum
+from app.matching import COMPATIBLE_DONORS
+from app.models import User, Profile, Hospital, EmergencyRequest, EmergencyNotification
+from app.constants import DONOR_MIN_AGE, DONOR_MAX_AGE
+
+logger = logging.getLogger(__name__)
+
+
+def _years_before(today, years):
+    try:
+        return today.replace(year=today.year - years)
+    except ValueError:
+        return today.replace(year=today.year - years, day=28)
+
+
+def eligible_donors(hospital, blood_group, now, cooldown, radius):
+    # User ids of compatible donors within radius km of the hospital, old
+    # enough and young enough to give, who have not been sent any emergency
+    # notification within the cooldown. Each compatible group is one scan
+    # of ix_profile_blood_group_geohash per cell.
+    today = now.date() if isinstance(now, datetime) else date.today()
+    recent = (
+        sa.select(EmergencyNotification.id)
+        .where(EmergencyNotification.user_id == Profile.user_id,
+               EmergencyNotification.created_at > now - timedelta(seconds=cooldown))
+    )
+    where = [
+        Profile.dob <= _years_before(today, DONOR_MIN_AGE),
+        Profile.dob > _years_before(today, DONOR_MAX_AGE + 1),
+        ~recent.exists()
+    ]
+    donors = COMPATIBLE_DONORS[BloodGroupEnum(blood_group)]
+    if hospital.latitude is None or hospital.longitude is None:
+        # Not located yet (its zip code is not loaded): fall back to its
+        # state, a prefix of ix_profile_blood_group_state_zip_code.
+        return db.session.scalars(
+            sa.select(Profile.user_id).where(Profile.blood_group.in_(donors), Profile.state == hospital.state, *where)
+        ).all()
+    found = geo.within(
+        db.session, (Profile.user_id, Profile.latitude, Profile.longitude, Profile.geohash),
+        hospital.latitude, hospital.longitude, radius,
+        where=where, partitions=[[Profile.blood_group == donor] for donor in donors]
+    )
+    return [user_id for user_id, _ in found]
+
+
+def create_emergency(hospital, blood_group, quantity, message=None):
+    # Only the request itself: finding and queueing the recipients can
+    # mean tens of thousands of rows, so broadcast() does that off the
+    # request thread.
+    emergency = EmergencyRequest(hospital=hospital, blood_group=BloodGroupEnum(blood_group),
+                                 quantity=quantity, message=message)
+    db.session.add(emergency)
+    db.session.flush()
+    return emergency
+
+
+def fan_out(emergency, now=None):
+    # Queues one PENDING notification per recipient in one executemany;
+    # nothing is sent here. Setting fanned_out_at claims the request, so a
+    # second caller (`flask emergency send` after a restart, say) queues
+    # nothing. Returns the recipient count, or None if already fanned out.
+    now = now or datetime.now(timezone.utc)
+    claimed = db.session.execute(
+        sa.update(EmergencyRequest)
+        .where(EmergencyRequest.id == emergency.id, EmergencyRequest.fanned_out_at.is_(None))
+        .values(fanned_out_at=now)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not claimed:
+        return None
+    config = current_app.config
+    donors = eligible_donors(emergency.hospital, emergency.blood_group, now,
+                             config['EMERGENCY_COOLDOWN'], config['EMERGENCY_RADIUS_KM'])
+    if donors:
+        db.session.execute(sa.insert(EmergencyNotification), [
+            dict(request_id=emergency.id, user_id=user_id, status=NotificationStatusEnum.PENDING,
+                 attempts=0, created_at=now)
+            for user_id in donors
+        ])
+    emergency.fanned_out_at = now
+    emergency.recipients = len(donors)
+    metrics.inc('emergency_recipients_total', (), emergency.recipients)
+    return emergency.recipients
+
+
+def fan_out_pending(request_id=None):
+    # Emergencies whose fan-out never ran, e.g. the process died between
+    # the request and its background job. Returns how many were fanned out.
+    stmt = sa.select(EmergencyRequest).where(EmergencyRequest.fanned_out_at.is_(None))
+    if request_id is not None:
+        stmt = stmt.where(EmergencyRequest.id == request_id)
+    done = 0
+    for emergency in db.session.scalars(stmt).all():
+        if fan_out(emergency) is not None:
+            done += 1
+        db.session.commit()
+    return done
+
+
+def broadcast(request_id):
+    # The background half of an emergency: queue its recipients, then send.
+    emergency = db.session.get(EmergencyRequest, request_id)
+    fan_out(emergency)
+    db.session.commit()
+    return deliver(request_id)
+
+
+def claim_notifications(limit, claim_timeout, request_id=None, now=None):
+    # Same claim as the application worker: pending rows that are due,
+    # plus rows claimed by a sender that died before recording the outcome.
+    # Returns {id: attempts including this one}.
+    now = now or datetime.now(timezone.utc)
+    claimable = sa.or_(
+        sa.and_(EmergencyNotification.status == NotificationStatusEnum.PENDING,
+                sa.or_(EmergencyNotification.next_attempt_at.is_(None),
+                       EmergencyNotification.next_attempt_at <= now)),
+        sa.and_(EmergencyNotification.status == NotificationStatusEnum.SENDING,
+                EmergencyNotification.claimed_at < now - timedelta(seconds=claim_timeout)),
+    )
+    candidates = sa.select(EmergencyNotification.id).where(claimable)
+    if request_id is not None:
+        candidates = candidates.where(EmergencyNotification.request_id == request_id)
+    candidates = candidates.order_by(EmergencyNotification.id).limit(limit).with_for_update(skip_locked=True)
+    return dict(db.session.execute(
+        sa.update(EmergencyNotification)
+        .where(EmergencyNotification.id.in_(candidates), claimable)
+        .values(status=NotificationStatusEnum.SENDING, claimed_at=now,
+                attempts=EmergencyNotification.attempts + 1)
+        .returning(EmergencyNotification.id, EmergencyNotification.attempts)
+        .execution_options(synchronize_session=False)
+    ).all())
+
+
+def _messages(ids):
+    rows = db.session.execute(
+        sa.select(EmergencyNotification.id, EmergencyNotification.request_id, User.email)
+        .join(User, User.id == EmergencyNotification.user_id)
+        .where(EmergencyNotification.id.in_(ids))
+    ).all()
+    templates = {
+        row.id: build_message(
+            notifier.sender,
+            'Urgent: {} blood needed at {}'.format(row.blood_group.value, row.name),
+            'Hi,\n\n{} urgently needs {} unit(s) of {} blood. You are a compatible donor nearby.\n\n'
+            '{}\n\n{}, {}\nPhone: {}\n'.format(
+                row.name, row.quantity, row.blood_group.value, row.message or '',
+                row.address, row.city_or_town, row.phone
+            )
+        )
+        for row in db.session.execute(
+            sa.select(EmergencyRequest.id, EmergencyRequest.blood_group, EmergencyRequest.quantity,
+                      EmergencyRequest.message, Hospital.name, Hospital.address, Hospital.city_or_town,
+                      Hospital.phone)
+            .join(Hospital, Hospital.id == EmergencyRequest.hospital_id)
+            .where(EmergencyRequest.id.in_({row.request_id for row in rows}))
+        )
+    }
+    return [(row.id, row.email, addressed(row.email, templates[row.request_id])) for row in rows]
+
+
+def _record(results, attempts, max_attempts, backoff, now):
+    # attempts: {id: attempts so far}, as returned by the claim.
+    sent = [dict(nid=key) for key, error in results if error is None]
+    failed = [(key, error[:256]) for key, error in results if error is not None]
+    table = EmergencyNotification.__table__
+    by_id = table.c.id == sa.bindparam('nid')
+    if sent:
+        db.session.execute(
+            sa.update(table).where(by_id)
+            .values(status=NotificationStatusEnum.SENT, sent_at=now, claimed_at=None, error=None),
+            sent
+        )
+    if failed:
+        # Back to PENDING, due again after backoff * 2**(attempts - 1)
+        # seconds, until max_attempts; then FAILED.
+        db.session.execute(
+            sa.update(table).where(by_id)
+            .values(status=sa.bindparam('status'), next_attempt_at=sa.bindparam('due'),
+                    claimed_at=None, error=sa.bindparam('error')),
+            [
+                dict(nid=key, error=error, status=NotificationStatusEnum.PENDING,
+                     due=now + timedelta(seconds=backoff * 2 ** (attempts[key] - 1)))
+                if attempts[key] < max_attempts else
+                dict(nid=key, error=error, status=NotificationStatusEnum.FAILED, due=None)
+                for key, error in failed
+            ]
+        )
+    db.session.commit()
+    return len(sent), len(failed)
+
+
+def deliver(request_id=None):
+    # Sends every pending notification that is due (of one request, or
+    # all), claim by claim, until none is left. Failed ones wait out their
+    # backoff for a later run. Returns (sent, failed attempts).
+    config = current_app.config
+    totals = [0, 0]
+
+    def on_batch(results, elapsed):
+        metrics.observe('notification_batch_duration_seconds', (), elapsed)
+
+    while True:
+        attempts = claim_notifications(config['NOTIFY_CLAIM_SIZE'], config['NOTIFY_CLAIM_TIMEOUT'],
+                                       request_id=request_id)
+        db.session.commit()
+        if not attempts:
+            break
+        started = time.perf_counter()
+        results = notifier.send(_messages(list(attempts)), on_batch)
+        sent, failed = _record(results, attempts, config['NOTIFY_MAX_ATTEMPTS'], config['NOTIFY_BACKOFF'],
+                               datetime.now(timezone.utc))
+        metrics.inc('notifications_total', (('outcome', 'sent'),), sent)
+        metrics.inc('notifications_total', (('outcome', 'failed'),), failed)
+        metrics.flush()
+        totals[0] += sent
+        totals[1] += failed
+        elapsed = time.perf_counter() - started
+        logger.info('Sent %d notifications (%d failed) in %.2fs (%.0f/s)', sent, failed, elapsed,
+                    len(results) / elapsed)
+        if failed and not sent:
+            # The gateway is refusing everything; leave the rest for the
+            # next `flask emergency send` instead of spinning.
+            break
+    return tuple(totals)
+
+
+def delivery_status(emergency):
+    counts = dict(db.session.execute(
+        sa.select(EmergencyNotification.status, sa.func.count())
+        .where(EmergencyNotification.request_id == emergency.id)
+        .group_by(EmergencyNotification.status)
+    ).all())
+    return {status: counts.get(status, 0) for status in NotificationStatusEnum}
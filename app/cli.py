@@ -0,0 +1,262 @@
+import os
+import signal
+import asyncio
+import click
+import sqlalchemy as sa
+from flask import Blueprint, current_app
+
+from app import db
+from app import inventory
+from app import media as media_store
+from app import identicons
+from app import importer
+from app import exporter
+from app import geo
+from app import broadcast
+from app.notify import StubSMTPServer
+from app.applications import ApplicationWorker
+from app.identicons import email_digest
+from app.search import include_name
+from app.models import User, Hospital
+from app.enums import BloodGroupEnum, DonorApplicationStatusEnum
+
+# Registered without a group, so the commands stay `flask stock ...` etc.
+bp = Blueprint('cli', __name__, cli_group=None)
+
+
+class MigrateCommands(click.Command):
+    # `flask db`, set up only when it runs: Flask-Migrate imports Alembic,
+    # which was half of what building the app cost every web worker. Click
+    # invokes whatever command the context carries, so the real group takes
+    # over from here.
+    def make_context(self, info_name, args, parent=None, **extra):
+        from flask_migrate import Migrate
+        from flask_migrate.cli import db as commands
+        app = current_app._get_current_object()
+        if 'migrate' not in app.extensions:
+            Migrate(app, db, include_name=include_name)
+        return commands.make_context(info_name, args, parent=parent, **extra)
+
+
+bp.cli.add_command(MigrateCommands('db', help='Perform database migrations.'))
+
+
+@bp.cli.group()
+def stock():
+    """Blood stock maintenance commands."""
+    pass
+
+
+@stock.command()
+@click.option('--repair', is_flag=True, help='Rebuild the rollup table from the ledger.')
+def check(repair):
+    """Compare per-hospital stock counts against the movement ledger."""
+    mismatches = inventory.check_stock()
+    for hospital_id, blood_group, expected, actual in mismatches:
+        click.echo('hospital {} {}: ledger {} rollup {}'.format(
+            hospital_id, blood_group.value, expected, actual
+        ))
+    if not mismatches:
+        click.echo('Stock rollups are consistent with the ledger.')
+    if repair and mismatches:
+        inventory.rebuild_stock()
+        db.session.commit()
+        click.echo('Rebuilt stock rollups from the ledger.')
+
+
+@stock.command()
+def expire():
+    """Mark every unit past its expiry date as expired."""
+    count = inventory.expire_units()
+    db.session.commit()
+    click.echo('Expired {} units.'.format(count))
+
+
+@bp.cli.group()
+def media():
+    """Uploaded media maintenance commands."""
+    pass
+
+
+def _referenced_media():
+    for column in (User.avatar, Hospital.image):
+        yield from db.session.scalars(
+            sa.select(column).where(column.is_not(None)).execution_options(yield_per=1000)
+        )
+
+
+@media.command()
+@click.option('--dry-run', is_flag=True, help='Only list what would be deleted.')
+@click.option('--min-age', default=3600, help='Keep files younger than this many seconds.')
+@click.option('--include-legacy', is_flag=True, help='Also collect unreferenced uploads saved before content addressing.')
+def gc(dry_run, min_age, include_legacy):
+    """Delete uploaded files no user or hospital refers to."""
+    for folder in (current_app.config['AVATAR_UPLOAD_FOLDER'], current_app.config['IMAGE_UPLOAD_FOLDER']):
+        removed = media_store.collect_garbage(
+            folder, _referenced_media(), min_age=min_age,
+            include_legacy=include_legacy, dry_run=dry_run
+        )
+        for path in removed:
+            click.echo(('would remove ' if dry_run else 'removed ') + path)
+        click.echo('{}: {} files {}'.format(folder, len(removed), 'to remove' if dry_run else 'removed'))
+
+
+@bp.cli.group()
+def avatars():
+    """Generated avatar commands."""
+    pass
+
+
+@avatars.command()
+@click.option('--size', 'sizes', type=int, multiple=True, help='Size to render, repeatable. Defaults to IDENTICON_SIZES.')
+@click.option('--workers', type=int, default=None, help='Worker processes, defaults to the number of CPUs.')
+def pregenerate(sizes, workers):
+    """Render missing identicons for every user without an uploaded avatar."""
+    emails = db.session.scalars(
+        sa.select(User.email).where(User.avatar.is_(None)).execution_options(yield_per=1000)
+    )
+    rendered = identicons.pregenerate(
+        (email_digest(email) for email in emails), sizes or identicons.sizes, workers=workers
+    )
+    click.echo('Rendered {} identicons.'.format(rendered))
+
+
+@bp.cli.group()
+def applications():
+    """Donor application commands."""
+    pass
+
+
+@applications.command()
+@click.option('--concurrency', type=int, default=None, help='Worker threads, defaults to APPLICATION_WORKER_CONCURRENCY.')
+@click.option('--batch-size', type=int, default=None, help='Applications claimed at a time.')
+@click.option('--once', is_flag=True, help='Exit once no pending application is left instead of polling.')
+def work(concurrency, batch_size, once):
+    """Run the automated eligibility checks on pending applications."""
+    worker = ApplicationWorker(current_app._get_current_object(), concurrency=concurrency, batch_size=batch_size)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    try:
+        stats = worker.run(once=once)
+    except KeyboardInterrupt:
+        worker.stop()
+        return
+    outcomes = ', '.join('{} {}'.format(count, outcome) for outcome, count in sorted(stats.items())
+                         if outcome not in ('elapsed', 'rate'))
+    click.echo('Processed {} in {:.1f}s ({:.1f}/s).'.format(outcomes or 'nothing', stats['elapsed'], stats['rate']))
+
+
+@bp.cli.group()
+def emergency():
+    """Emergency broadcast commands."""
+    pass
+
+
+@emergency.command()
+@click.option('--request', 'request_id', type=int, default=None, help='Only send notifications of this emergency.')
+def send(request_id):
+    """Send pending emergency notifications, e.g. after a restart."""
+    fanned_out = broadcast.fan_out_pending(request_id)
+    if fanned_out:
+        click.echo('Queued recipients of {} emergencies.'.format(fanned_out))
+    sent, failed = broadcast.deliver(request_id)
+    click.echo('Sent {} notifications, {} failed attempts.'.format(sent, failed))
+
+
+@emergency.command('stub-smtp')
+@click.option('--host', default='127.0.0.1')
+@click.option('--port', type=int, default=8025)
+@click.option('--delay', type=float, default=0.0, help='Seconds to wait before accepting each message.')
+def stub_smtp(host, port, delay):
+    """Run an SMTP server that accepts and discards mail."""
+    server = StubSMTPServer(host, port, delay)
+    click.echo('Accepting mail on {}:{}'.format(host, port))
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        pass
+    click.echo('Received {} messages.'.format(len(server.received)))
+
+
+@bp.cli.group('geo')
+def geo_():
+    """Geographic lookup commands."""
+    pass
+
+
+@geo_.command('load-zips')
+@click.argument('path', required=False, type=click.Path(exists=True, dir_okay=False))
+def load_zips(path):
+    """Load zip code coordinates and locate hospitals and donors in them."""
+    loaded = geo.load_zip_codes(db.session, geo.read_zip_codes(path or current_app.config['ZIP_CODES_FILE']))
+    click.echo('Loaded {} zip codes.'.format(loaded))
+
+
+@bp.cli.group('import')
+def import_():
+    """Bulk import commands."""
+    pass
+
+
+def _run_import(fn, path, fmt, rejects, chunk_size):
+    fmt = fmt or importer.detect_format(path)
+    if rejects is None:
+        root = path[:-3] if path.endswith('.gz') else path
+        rejects = '{}.rejects{}'.format(*os.path.splitext(root))
+    writer = importer.RejectsWriter(rejects, fmt)
+    try:
+        imported = fn(path, writer, fmt=fmt, chunk_size=chunk_size)
+    finally:
+        writer.close()
+    click.echo('Imported {} rows, rejected {}.'.format(imported, writer.count))
+    if writer.count:
+        click.echo('Rejected rows were written to {}'.format(rejects))
+
+
+_import_options = [
+    click.argument('path', type=click.Path(exists=True, dir_okay=False)),
+    click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Defaults to the file extension.'),
+    click.option('--rejects', type=click.Path(dir_okay=False), help='Where to write invalid rows.'),
+    click.option('--chunk-size', default=1000, help='Rows per transaction.'),
+]
+
+
+def import_options(fn):
+    for option in reversed(_import_options):
+        fn = option(fn)
+    return fn
+
+
+@import_.command('hospitals')
+@import_options
+def import_hospitals(path, fmt, rejects, chunk_size):
+    """Import hospitals from a CSV or JSONL file (optionally .gz)."""
+    _run_import(importer.import_hospitals, path, fmt, rejects, chunk_size)
+
+
+@import_.command('users')
+@import_options
+def import_users(path, fmt, rejects, chunk_size):
+    """Import users, with optional donor profiles, from CSV or JSONL."""
+    _run_import(importer.import_users, path, fmt, rejects, chunk_size)
+
+
+@bp.cli.command('export')
+@click.argument('kind', type=click.Choice(list(exporter.EXPORTS)))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default='csv')
+@click.option('--output', '-o', default='-', help='File to write, defaults to stdout.')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output while streaming.')
+@click.option('--state')
+@click.option('--blood-group', type=click.Choice([bg.name for bg in BloodGroupEnum]))
+@click.option('--status', type=click.Choice([status.name for status in DonorApplicationStatusEnum]))
+def export(kind, fmt, output, compress, state, blood_group, status):
+    """Stream hospitals, donors or applications as CSV or JSONL."""
+    try:
+        filters = exporter.parse_filters(kind, {'state': state, 'blood_group': blood_group, 'status': status})
+    except exporter.ExportError as e:
+        raise click.UsageError(str(e))
+    chunks = exporter.iter_export(kind, filters, fmt)
+    if compress:
+        chunks = exporter.gzip_stream(chunks)
+    with click.open_file(output, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
@@ -1 +1,16 @@
-DONOR_APPLICATION_VALID_FOR = 5     # Days
\ No newline at end of file
+DONOR_APPLICATION_VALID_FOR = 5     # Days
+
+# Automated eligibility checks applied by the application worker
+DONOR_MIN_AGE = 18
+DONOR_MAX_AGE = 65
+DONOR_MIN_WEIGHT = 50               # kg
+DONOR_MIN_HEIGHT = 140              # cm
+DONOR_MAX_HEIGHT = 220              # cm
+DONOR_DISQUALIFYING_HABITS = ('drug', 'inject', 'intravenous', 'needle')
+
+# Derived image sizes written next to every upload: name -> (width, height, crop)
+IMAGE_VARIANTS = {
+    'small': (88, 88, True),
+    'medium': (256, 256, True),
+    'web': (1280, 1280, False),
+}
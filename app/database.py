@@ -0,0 +1,76 @@
+import sqlalchemy as sa
+from flask import g, request, has_request_context
+from flask_sqlalchemy.session import Session
+
+REPLICA = 'replica'
+# Only a QueuePool takes these; in-memory SQLite runs on a StaticPool.
+QUEUE_POOL_OPTIONS = ('pool_size', 'max_overflow')
+
+
+class RoutingSession(Session):
+    # Sends plain SELECTs made while handling a read-only request to the
+    # replica bind. Flushes, writes, SELECT ... FOR UPDATE and anything
+    # outside such a request stay on the primary.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and isinstance(clause, sa.Select)
+            and clause._for_update_arg is None
+            and has_request_context()
+            and g.get('read_replica')
+        ):
+            return self._db.engines[REPLICA]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _in_memory(url):
+    url = sa.engine.make_url(url)
+    return url.get_backend_name() == 'sqlite' and (
+        url.database in (None, '', ':memory:') or url.query.get('mode') == 'memory'
+    )
+
+
+def configure_pools(app):
+    # Called before db.init_app(): in-memory SQLite gets a StaticPool,
+    # whose create_engine() rejects the QueuePool sizing, so drop it.
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+    if uri is not None and _in_memory(uri):
+        options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            key: value for key, value in options.items() if key not in QUEUE_POOL_OPTIONS
+        }
+
+
+class EngineTuning:
+    # Applies SQLITE_PRAGMAS to every new SQLite connection (WAL lets
+    # readers carry on while a writer commits) and, when a replica bind is
+    # configured, marks GET requests to READ_REPLICA_ENDPOINTS so that
+    # RoutingSession reads from it. Pool sizing lives in
+    # SQLALCHEMY_ENGINE_OPTIONS.
+    def __init__(self, app=None, db=None):
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.pragmas = dict(app.config['SQLITE_PRAGMAS'])
+        self.endpoints = frozenset(app.config['READ_REPLICA_ENDPOINTS'])
+        with app.app_context():
+            engines = db.engines
+        for engine in engines.values():
+            if engine.dialect.name == 'sqlite':
+                sa.event.listen(engine, 'connect', self._set_pragmas)
+        self.replica = REPLICA in engines
+        if self.replica:
+            app.before_request(self._route)
+
+    def _set_pragmas(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.pragmas.items():
+                cursor.execute('PRAGMA {} = {}'.format(name, value))
+        finally:
+            cursor.close()
+
+    def _route(self):
+        g.read_replica = request.endpoint in self.endpoints and request.method in ('GET', 'HEAD')
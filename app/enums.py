@@ -22,3 +22,24 @@ class DonorApplicationStatusEnum(str, Enum):
      PROCESSING = "Processing"
      APPROVED = "Approved"
      REJECTED = "Rejected"
+     FAILED = "Failed"
+
+
+class StockMovementReasonEnum(str, Enum):
+    RECEIVED = "Received"
+    ISSUED = "Issued"
+    EXPIRED = "Expired"
+    DISCARDED = "Discarded"
+
+class BloodUnitStatusEnum(str, Enum):
+    AVAILABLE = "Available"
+    ISSUED = "Issued"
+    DISCARDED = "Discarded"
+    EXPIRED = "Expired"
+
+
+class NotificationStatusEnum(str, Enum):
+    PENDING = "Pending"
+    SENDING = "Sending"
+    SENT = "Sent"
+    FAILED = "Failed"
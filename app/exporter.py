@@ -0,0 +1,128 @@
+import io
+import csv
+import json
+import zlib
+from enum import Enum
+from datetime import date
+import sqlalchemy as sa
+
+from app import db
+from app.models import User, Profile, Hospital, DonorApplication
+from app.enums import BloodGroupEnum, DonorApplicationStatusEnum
+
+BATCH_SIZE = 1000
+
+# Column labels match what `flask import` reads, so a hospitals export
+# can be fed back in. A donors export cannot as it stands: password
+# hashes never leave the database, and `flask import users` needs a
+# password column added first.
+EXPORTS = {
+    'hospitals': {
+        'columns': [
+            Hospital.id, Hospital.name, Hospital.hrn, Hospital.address, Hospital.city_or_town,
+            Hospital.state, Hospital.zip_code, Hospital.phone, Hospital.email, Hospital.updated_at,
+        ],
+        'filters': {'state': Hospital.state},
+    },
+    'donors': {
+        'columns': [
+            User.id, User.username, User.email, User.phone, Profile.dob, Profile.gender,
+            Profile.address, Profile.state, Profile.zip_code, Profile.blood_group,
+        ],
+        'join': lambda stmt: stmt.join(Profile, Profile.user_id == User.id),
+        'filters': {'state': Profile.state, 'blood_group': Profile.blood_group},
+    },
+    'applications': {
+        'columns': [
+            DonorApplication.id, DonorApplication.user_id, User.username, DonorApplication.height,
+            DonorApplication.wight, DonorApplication.habbits, DonorApplication.uidn,
+            DonorApplication.timestamp, DonorApplication.status, Profile.state, Profile.blood_group,
+        ],
+        'join': lambda stmt: stmt.join(User, User.id == DonorApplication.user_id)
+                                 .outerjoin(Profile, Profile.user_id == User.id),
+        'filters': {'state': Profile.state, 'blood_group': Profile.blood_group, 'status': DonorApplication.status},
+    },
+}
+FILTER_ENUMS = {'blood_group': BloodGroupEnum, 'status': DonorApplicationStatusEnum}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_filters(kind, values):
+    # values: mapping of filter name to raw string, empty ones ignored.
+    allowed = EXPORTS[kind]['filters']
+    filters = {}
+    for name, value in values.items():
+        if not value:
+            continue
+        if name not in allowed:
+            raise ExportError('{} cannot be filtered by {}'.format(kind, name))
+        if name in FILTER_ENUMS:
+            try:
+                value = FILTER_ENUMS[name][value]
+            except KeyError:
+                raise ExportError('Unknown {} {!r}'.format(name, value))
+        filters[name] = value
+    return filters
+
+
+def build_query(kind, filters):
+    export = EXPORTS[kind]
+    columns = export['columns']
+    stmt = sa.select(*columns)
+    if 'join' in export:
+        stmt = export['join'](stmt)
+    for name, value in filters.items():
+        stmt = stmt.where(export['filters'][name] == value)
+    return stmt.order_by(columns[0])
+
+
+def _plain(value):
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+
+def iter_rows(kind, filters):
+    # yield_per streams from a server-side cursor where the driver has one,
+    # and fetches in batches everywhere, so the result is never held whole.
+    result = db.session.execute(build_query(kind, filters).execution_options(yield_per=BATCH_SIZE))
+    for partition in result.partitions():
+        yield [[_plain(value) for value in row] for row in partition]
+
+
+def header(kind):
+    return [column.key for column in EXPORTS[kind]['columns']]
+
+
+def iter_export(kind, filters, fmt):
+    # Yields encoded chunks of roughly BATCH_SIZE rows each.
+    names = header(kind)
+    buffer = io.StringIO()
+    if fmt == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+    for rows in iter_rows(kind, filters):
+        if fmt == 'csv':
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                buffer.write(json.dumps(dict(zip(names, row))) + '\n')
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -1,11 +1,14 @@
 import sqlalchemy as sa
+from flask import current_app
 from flask_wtf import FlaskForm
 from wtforms.validators import (
     DataRequired, 
     ValidationError, 
     Email, 
     EqualTo, 
-    Length
+    Length,
+    NumberRange,
+    Optional
 )
 from wtforms import (
     StringField, 
@@ -16,19 +19,100 @@ from wtforms import (
     SelectField, 
     TextAreaField,
     FileField,
-    HiddenField
+    HiddenField,
+    IntegerField
 )
 
 from app import db
 from app.models import User, Hospital
-from app.enums import GenderEnum, BloodGroupEnum
+from app.enums import GenderEnum, BloodGroupEnum, StockMovementReasonEnum
 from app.validators import (
     PasswordStrength, 
     FileExtensionValidator, 
     FileMimeTypeValidator
 )
 
-class RegistrationForm(FlaskForm):
+class UniqueFieldsMixin:
+    # How uniqueness is enforced is chosen by UNIQUE_CHECKS:
+    #   "select"     one SELECT per field from the validate_<field> methods
+    #   "combined"   a single SELECT ... WHERE a = ? OR b = ? for all fields
+    #   "constraint" no pre-check; the unique indexes reject duplicates on
+    #                commit and map_integrity_error() reports them
+    unique_model = None
+    unique_fields = {}
+
+    def unique_checks(self):
+        return current_app.config['UNIQUE_CHECKS']
+
+    def unique_scope(self, stmt):
+        return stmt
+
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        if self.unique_checks() != 'combined':
+            return True
+
+        values = {
+            name: getattr(self, name).data for name in self.unique_fields
+            if getattr(self, name).data
+        }
+        if not values:
+            return True
+        columns = [getattr(self.unique_model, name) for name in values]
+        stmt = sa.select(*columns).where(sa.or_(*(
+            column == values[column.key] for column in columns
+        ))).limit(len(columns))
+
+        valid = True
+        for row in db.session.execute(self.unique_scope(stmt)):
+            for name, value in values.items():
+                if getattr(row, name) == value and self.unique_fields[name] not in getattr(self, name).errors:
+                    getattr(self, name).errors.append(self.unique_fields[name])
+                    valid = False
+        return valid
+
+    def map_integrity_error(self, error):
+        table = self.unique_model.__table__
+        columns = _unique_columns(table).get(_violated_constraint(error, table))
+        if not columns or len(columns) != 1 or columns[0] not in self.unique_fields:
+            return False
+        field = getattr(self, columns[0])
+        field.errors = list(field.errors) + [self.unique_fields[columns[0]]]
+        return True
+
+
+def _unique_columns(table):
+    # {name: column names} of the table's unique constraints and indexes.
+    found = {index.name: tuple(column.name for column in index.columns) for index in table.indexes if index.unique}
+    for constraint in table.constraints:
+        if isinstance(constraint, sa.UniqueConstraint) and constraint.name:
+            found[constraint.name] = tuple(column.name for column in constraint.columns)
+    return found
+
+
+def _violated_constraint(error, table):
+    # The name of the unique constraint or index an IntegrityError is about.
+    # psycopg reports it; SQLite only lists the columns ("UNIQUE constraint
+    # failed: user.email"), which name exactly one of the table's.
+    name = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)
+    if name:
+        return name
+    prefix = 'UNIQUE constraint failed: '
+    message = str(error.orig)
+    if not message.startswith(prefix):
+        return None
+    qualified = [part.strip().split('.', 1) for part in message[len(prefix):].split(',')]
+    if any(len(part) != 2 or part[0] != table.name for part in qualified):
+        return None
+    columns = tuple(column for _, column in qualified)
+    for name, unique in _unique_columns(table).items():
+        if unique == columns:
+            return name
+    return None
+
+
+class RegistrationForm(UniqueFieldsMixin, FlaskForm):
     username = StringField("Username", validators=[DataRequired()])
     email = StringField("Email", validators=[DataRequired(), Email()])
     phone = StringField("Phone", validators=[DataRequired(), Length(min=10, max=15)])
@@ -36,7 +120,16 @@ class RegistrationForm(FlaskForm):
     password2 = PasswordField("Repeat Password", validators=[DataRequired(), EqualTo("password")])
     submit = SubmitField("Register")
 
+    unique_model = User
+    unique_fields = {
+        'username': "Please use a different username",
+        'email': "Please use a different email address",
+        'phone': "Please use a different phone number",
+    }
+
     def validate_username(self, username):
+        if self.unique_checks() != 'select':
+            return
         user = db.session.scalar(sa.select(User).where(
             User.username == username.data
         ))
@@ -44,6 +137,8 @@ class RegistrationForm(FlaskForm):
             raise ValidationError("Please use a different username")
         
     def validate_email(self, email):
+        if self.unique_checks() != 'select':
+            return
         user = db.session.scalar(sa.select(User).where(
             User.email == email.data
         ))
@@ -51,6 +146,8 @@ class RegistrationForm(FlaskForm):
             raise ValidationError("Please use a different email address")
     
     def validate_phone(self, phone):
+        if self.unique_checks() != 'select':
+            return
         user = db.session.scalar(sa.select(User).where(
             User.phone == phone.data
         ))
@@ -78,7 +175,7 @@ class ProfileForm(FlaskForm):
     blood_group = SelectField("Blood Group", choices=[(bg.name, bg.value) for bg in BloodGroupEnum])
     submit = SubmitField("Update")
 
-class HospitalForm(FlaskForm):
+class HospitalForm(UniqueFieldsMixin, FlaskForm):
     image = FileField('Upload Image', validators=[
         FileExtensionValidator(allowed_extensions={'jpg', 'jpeg', 'png'}),
         FileMimeTypeValidator(allowed_mimetypes={'image/jpeg', 'image/png'})
@@ -94,11 +191,53 @@ class HospitalForm(FlaskForm):
     current_hrn = HiddenField()
     submit = SubmitField("Update")
 
+    unique_model = Hospital
+    unique_fields = {
+        'name': "Please use a different name",
+        'hrn': "Please use a different registration number",
+        'phone': "Please use a different phone number",
+        'email': "Please use a different email address",
+    }
+
+    def unique_scope(self, stmt):
+        if self.current_hrn.data:
+            stmt = stmt.where(Hospital.hrn != self.current_hrn.data)
+        return stmt
 
     def validate_hrn(self, hrn):
+        if self.unique_checks() != 'select':
+            return
         if hrn.data != self.current_hrn.data:
             hospital = db.session.scalar(sa.select(Hospital).where(
                 Hospital.hrn == hrn.data
             ))
             if hospital is not None:
-                raise ValidationError("Please use a different registration number")
\ No newline at end of file
+                raise ValidationError("Please use a different registration number")
+
+class EmergencyRequestForm(FlaskForm):
+    blood_group = SelectField("Blood Group", choices=[(bg.name, bg.value) for bg in BloodGroupEnum])
+    quantity = IntegerField("Units needed", validators=[DataRequired(), NumberRange(min=1, max=1000)])
+    message = TextAreaField("Message", validators=[Optional(), Length(max=512)])
+    submit = SubmitField("Notify donors")
+
+class StockMovementForm(FlaskForm):
+    blood_group = SelectField("Blood Group", choices=[(bg.name, bg.value) for bg in BloodGroupEnum])
+    reason = SelectField("Reason", choices=[
+        (reason.name, reason.value) for reason in StockMovementReasonEnum
+        if reason != StockMovementReasonEnum.EXPIRED
+    ])
+    quantity = IntegerField("Units", validators=[DataRequired(), NumberRange(min=1, max=1000)])
+    expires_at = DateField("Expires on", format='%Y-%m-%d', validators=[Optional()])
+    submit = SubmitField("Record")
+
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        if self.reason.data == StockMovementReasonEnum.RECEIVED.name and not self.expires_at.data:
+            self.expires_at.errors.append("Received units need an expiry date")
+            return False
+        return True
+
+class ApplicationReviewForm(FlaskForm):
+    approve = SubmitField("Approve selected")
+    reject = SubmitField("Reject selected")
@@ -0,0 +1,139 @@
+import os
+import hashlib
+import sqlite3
+import threading
+from markupsafe import Markup
+
+from app.cache import LRUCache
+
+
+class MemoryBackend:
+    # Per-process LRU of tag -> {fragment name: (version, html)}.
+    def __init__(self, maxsize):
+        self.cache = LRUCache(maxsize)
+
+    def get(self, tag, name):
+        return self.cache.get(tag, {}).get(name)
+
+    def set(self, tag, name, version, html):
+        fragments = dict(self.cache.get(tag, {}))
+        fragments[name] = (version, html)
+        self.cache.set(tag, fragments)
+
+    def delete(self, tag):
+        self.cache.delete(tag)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class SQLiteBackend:
+    # A cache file shared by every worker process on the host, so a card
+    # rendered by one worker is reused by the others and an invalidation
+    # in one is seen by all.
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS fragment ('
+                'tag TEXT NOT NULL, name TEXT NOT NULL, version TEXT NOT NULL, html TEXT NOT NULL, '
+                'PRIMARY KEY (tag, name)) WITHOUT ROWID'
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, tag, name):
+        return self._connect().execute(
+            'SELECT version, html FROM fragment WHERE tag = ? AND name = ?', (tag, name)
+        ).fetchone()
+
+    def set(self, tag, name, version, html):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO fragment (tag, name, version, html) VALUES (?, ?, ?, ?)',
+            (tag, name, version, html)
+        )
+
+    def delete(self, tag):
+        self._connect().execute('DELETE FROM fragment WHERE tag = ?', (tag,))
+
+    def clear(self):
+        self._connect().execute('DELETE FROM fragment')
+
+
+class NullBackend:
+    def get(self, tag, name):
+        return None
+
+    def set(self, tag, name, version, html):
+        pass
+
+    def delete(self, tag):
+        pass
+
+    def clear(self):
+        pass
+
+
+def _source_digest(folder):
+    digest = hashlib.sha256()
+    for root, dirs, files in sorted(os.walk(folder)):
+        for name in sorted(files):
+            with open(os.path.join(root, name), 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+class FragmentCache:
+    # Caches rendered template fragments per model instance. Templates wrap
+    # a fragment in {% call cached_fragment(name, obj, *vary) %}. Each
+    # (obj, name) has one slot, valid while obj.updated_at, the extra vary
+    # values and the deployed templates and static assets are unchanged.
+    # Committing a change to obj deletes its slots, see models.py.
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config['FRAGMENT_CACHE_BACKEND']
+        if backend == 'memory':
+            self.backend = MemoryBackend(app.config['FRAGMENT_CACHE_SIZE'])
+        elif backend == 'sqlite':
+            self.backend = SQLiteBackend(app.config['FRAGMENT_CACHE_PATH'])
+        elif backend == 'null':
+            self.backend = NullBackend()
+        else:
+            raise ValueError('Unknown FRAGMENT_CACHE_BACKEND {!r}'.format(backend))
+        assets = app.extensions.get('static_assets')
+        self.release = _source_digest(os.path.join(app.root_path, app.template_folder))
+        if assets is not None:
+            self.release += '-' + hashlib.sha256(repr(sorted((name, digest) for name, (_, digest) in assets.manifest.items())).encode()).hexdigest()[:12]
+        app.add_template_global(self.fragment, 'cached_fragment')
+
+    @staticmethod
+    def tag(obj):
+        return '{}:{}'.format(obj.__tablename__, obj.id)
+
+    def fragment(self, name, obj, *vary, caller):
+        tag = self.tag(obj)
+        version = '|'.join([self.release, obj.updated_at.isoformat(), *map(str, vary)])
+        entry = self.backend.get(tag, name)
+        if entry is not None and entry[0] == version:
+            return Markup(entry[1])
+        html = caller()
+        self.backend.set(tag, name, version, str(html))
+        return Markup(html)
+
+    def invalidate(self, tag):
+        self.backend.delete(tag)
+
+    def clear(self):
+        self.backend.clear()
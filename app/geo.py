@@ -0,0 +1,215 @@
+import csv
+import math
+import itertools
+import sqlalchemy as sa
+
+GEOHASH_PRECISION = 7
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+LOCATION_CACHE_SIZE = 65536
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Sorts after every geohash character, so [prefix, prefix + _END) is the
+# range of all hashes inside the cell `prefix`.
+_END = '~'
+
+_locations = {}
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        span, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (span[0] + span[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            span[0] = middle
+        else:
+            span[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    # (height, width) of a cell in degrees.
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def neighbourhood(latitude, longitude, precision):
+    # The cell containing the point and the (up to) eight around it.
+    height, width = cell_size(precision)
+    cells = set()
+    for dlat in (-height, 0, height):
+        lat = latitude + dlat
+        if not -90 <= lat <= 90:
+            continue
+        for dlon in (-width, 0, width):
+            lon = (longitude + dlon + 180) % 360 - 180
+            cells.add(encode(lat, lon, precision))
+    return sorted(cells)
+
+
+def covered_radius(latitude, longitude, precision):
+    # Every point this close lies in the neighbourhood: the distance to the
+    # nearest edge of the point's own cell plus one more cell.
+    height, width = cell_size(precision)
+    south = (latitude + 90) % height
+    west = (longitude + 180) % width
+    widest = min(90.0, abs(latitude) + 2 * height)
+    return min(
+        height + min(south, height - south),
+        (width + min(west, width - west)) * math.cos(math.radians(widest))
+    ) * KM_PER_DEGREE
+
+
+def _candidates(columns, cells, where, partitions):
+    # One index range scan per partition and cell, glued with UNION ALL:
+    # neither SQLite nor Postgres will turn `a IN (...) AND (range OR
+    # range ...)` into seeks on an (a, geohash) index by themselves.
+    id_, lat_column, lon_column, geohash = columns
+    selects = [
+        sa.select(id_, lat_column, lon_column)
+        .where(*partition, geohash >= cell, geohash < cell + _END, *where)
+        for partition in partitions for cell in cells
+    ]
+    return selects[0] if len(selects) == 1 else sa.union_all(*selects)
+
+
+def haversine(latitude, longitude, latitudes, longitudes):
+    # Distances in km from one point to arrays of points.
+    import numpy as np
+    lat1, lon1 = np.radians(latitude), np.radians(longitude)
+    lat2, lon2 = np.radians(np.asarray(latitudes, dtype=float)), np.radians(np.asarray(longitudes, dtype=float))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _nearest(candidates, latitude, longitude, limit, radius):
+    # candidates: [(id, latitude, longitude), ...]. Returns up to limit
+    # (id, km) pairs no further than radius, nearest first.
+    import numpy as np
+    if not candidates:
+        return []
+    ids, latitudes, longitudes = zip(*candidates)
+    distances = haversine(latitude, longitude, latitudes, longitudes)
+    within = np.flatnonzero(distances <= radius)
+    if len(within) > limit:
+        within = within[np.argpartition(distances[within], limit - 1)[:limit]]
+    within = within[np.argsort(distances[within], kind='stable')]
+    return [(ids[i], float(distances[i])) for i in within]
+
+
+def nearest(session, columns, latitude, longitude, limit, where=(), partitions=((),), max_precision=5):
+    # columns: (id, latitude, longitude, geohash) of an indexed table.
+    # partitions: lists of equality conditions on the columns leading the
+    # geohash index, one scan each; where: any other filter. Starts with
+    # the neighbourhood of small cells and widens one geohash level at a
+    # time until `limit` rows are found within the radius the
+    # neighbourhood is guaranteed to cover.
+    id_, lat_column, lon_column, geohash = columns
+    for precision in range(max_precision, 0, -1):
+        cells = neighbourhood(latitude, longitude, precision)
+        rows = session.execute(_candidates(columns, cells, where, partitions)).all()
+        found = _nearest(rows, latitude, longitude, limit, covered_radius(latitude, longitude, precision))
+        if len(found) >= limit:
+            return found
+    if any(partitions):
+        where = [*where, sa.or_(*(sa.and_(*partition) for partition in partitions))]
+    rows = session.execute(sa.select(id_, lat_column, lon_column).where(geohash.is_not(None), *where)).all()
+    return _nearest(rows, latitude, longitude, limit, math.inf)
+
+
+def within(session, columns, latitude, longitude, radius, where=(), partitions=((),)):
+    # Every row no further than radius km, as (id, km) nearest first. Scans
+    # the neighbourhood of the finest cells that still cover the radius;
+    # a bounding box on the indexed coordinates trims what those coarse
+    # cells bring back before any row leaves the database.
+    id_, lat_column, lon_column, geohash = columns
+    height = radius / KM_PER_DEGREE
+    where = [*where, lat_column.between(latitude - height, latitude + height)]
+    if abs(latitude) + height < 90:
+        width = height / math.cos(math.radians(abs(latitude) + height))
+        if -180 <= longitude - width and longitude + width <= 180:
+            where.append(lon_column.between(longitude - width, longitude + width))
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        if covered_radius(latitude, longitude, precision) >= radius:
+            cells = neighbourhood(latitude, longitude, precision)
+            rows = session.execute(_candidates(columns, cells, where, partitions)).all()
+            break
+    else:
+        if any(partitions):
+            where = [*where, sa.or_(*(sa.and_(*partition) for partition in partitions))]
+        rows = session.execute(sa.select(id_, lat_column, lon_column).where(geohash.is_not(None), *where)).all()
+    return _nearest(rows, latitude, longitude, len(rows), radius)
+
+
+def read_zip_codes(path):
+    # CSV with zip_code, latitude and longitude columns.
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield dict(zip_code=row['zip_code'].strip(), latitude=float(row['latitude']),
+                       longitude=float(row['longitude']))
+
+
+def locate(session, zip_code):
+    # (latitude, longitude, geohash) for a zip code, or Nones if unknown.
+    # Known zip codes are cached; `flask geo load-zips` clears the cache.
+    location = _locations.get(zip_code)
+    if location is None and zip_code:
+        from app.models import ZipCode
+        with session.no_autoflush:
+            row = session.execute(
+                sa.select(ZipCode.latitude, ZipCode.longitude, ZipCode.geohash).where(ZipCode.zip_code == zip_code)
+            ).first()
+        if row is not None:
+            if len(_locations) >= LOCATION_CACHE_SIZE:
+                _locations.clear()
+            location = _locations[zip_code] = tuple(row)
+    return location or (None, None, None)
+
+
+def forget_locations():
+    _locations.clear()
+
+
+def add_locations(session, rows):
+    # Fills latitude, longitude and geohash into row dicts bound for a bulk
+    # insert, which the before_flush hook on the models never sees.
+    for row in rows:
+        row['latitude'], row['longitude'], row['geohash'] = locate(session, row['zip_code'])
+    return rows
+
+
+def load_zip_codes(session, rows, chunk_size=5000):
+    # Replaces the coordinates of every zip code in rows, then re-locates
+    # the hospitals and profiles in them with one UPDATE ... FROM per table
+    # and chunk.
+    from app.models import ZipCode, Hospital, Profile
+    rows = iter(rows)
+    loaded = 0
+    while True:
+        chunk = {row['zip_code']: dict(row, geohash=encode(row['latitude'], row['longitude']))
+                 for row in itertools.islice(rows, chunk_size)}
+        if not chunk:
+            break
+        session.execute(sa.delete(ZipCode).where(ZipCode.zip_code.in_(chunk)))
+        session.execute(sa.insert(ZipCode), list(chunk.values()))
+        for model in (Hospital, Profile):
+            session.execute(
+                sa.update(model)
+                .where(model.zip_code == ZipCode.zip_code, ZipCode.zip_code.in_(chunk))
+                .values(latitude=ZipCode.latitude, longitude=ZipCode.longitude, geohash=ZipCode.geohash)
+                .execution_options(synchronize_session=False)
+            )
+        session.commit()
+        loaded += len(chunk)
+    forget_locations()
+    return loaded
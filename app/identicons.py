@@ -0,0 +1,113 @@
+import os
+import re
+import base64
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from app.cache import LRUCache
+
+FOREGROUND = [
+    "rgb(45,79,255)",
+    "rgb(254,180,44)",
+    "rgb(226,121,234)",
+    "rgb(30,179,253)",
+    "rgb(232,77,65)",
+    "rgb(49,203,115)",
+    "rgb(141,69,170)"
+]
+BACKGROUND = "rgb(256,256,256)"
+DIGEST_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def email_digest(email):
+    # pydenticon treats a hex string of the right length as an already
+    # computed digest. Lower-cased so that one address has one icon.
+    return hashlib.md5(email.lower().encode('utf-8')).hexdigest()
+
+
+def _get_generator():
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                # Imported on first render: pydenticon pulls in PIL.
+                import pydenticon
+                _generator = pydenticon.Generator(
+                    5, 5, digest=hashlib.md5, foreground=FOREGROUND, background=BACKGROUND
+                )
+    return _generator
+
+
+def render_png(digest, size):
+    return _get_generator().generate(digest, size, size, padding=(8, 8, 8, 8), inverted=False, output_format="png")
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = '{}.{}.part'.format(path, os.getpid())
+    with open(partial, 'wb') as f:
+        f.write(data)
+    os.replace(partial, path)
+
+
+def _render_to_file(task):
+    digest, size, path = task
+    _write_atomic(path, render_png(digest, size))
+
+
+class IdenticonService:
+    # Renders identicons once. PNGs are kept in a bounded in-memory LRU in
+    # front of a directory of files, so after a restart they are read back
+    # from disk instead of being drawn again. Only pregenerate() writes to
+    # that directory: any digest can be asked for over HTTP, so what
+    # render() draws itself stays in the LRU.
+    def __init__(self, app=None):
+        self.cache = LRUCache(0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = app.config['IDENTICON_FOLDER']
+        self.sizes = app.config['IDENTICON_SIZES']
+        self.cache = LRUCache(app.config['IDENTICON_CACHE_SIZE'])
+
+    def path(self, digest, size):
+        return os.path.join(self.folder, digest[:2], '{}-{}.png'.format(digest, size))
+
+    def render(self, digest, size):
+        key = (digest, size)
+        png = self.cache.get(key)
+        if png is None:
+            path = self.path(digest, size)
+            try:
+                with open(path, 'rb') as f:
+                    png = f.read()
+            except FileNotFoundError:
+                png = render_png(digest, size)
+            self.cache.set(key, png)
+        return png
+
+    def data_uri(self, digest, size):
+        return base64.b64encode(self.render(digest, size)).decode('ascii')
+
+    def pregenerate(self, digests, sizes, workers=None, batch_size=1000):
+        # Streams digests in batches so memory stays flat however many users
+        # there are; only icons missing on disk are handed to the pool.
+        rendered = 0
+        with ProcessPoolExecutor(workers) as pool:
+            batch = []
+            for digest in digests:
+                for size in sizes:
+                    path = self.path(digest, size)
+                    if not os.path.exists(path):
+                        batch.append((digest, size, path))
+                if len(batch) >= batch_size:
+                    rendered += sum(1 for _ in pool.map(_render_to_file, batch, chunksize=64))
+                    batch = []
+            if batch:
+                rendered += sum(1 for _ in pool.map(_render_to_file, batch, chunksize=64))
+        return rendered
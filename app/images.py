@@ -0,0 +1,91 @@
+import os
+import logging
+import threading
+from flask import url_for
+from concurrent.futures import ThreadPoolExecutor
+
+from app.constants import IMAGE_VARIANTS
+
+logger = logging.getLogger(__name__)
+
+
+def variant_path(path, variant):
+    root, ext = os.path.splitext(path)
+    return '{}.{}{}'.format(root, variant, ext)
+
+
+def _render_variant(source, target, size, crop):
+    # PIL is only imported by the worker that first renders a variant.
+    from PIL import Image, ImageOps
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        if crop:
+            image = ImageOps.fit(image, size, Image.LANCZOS)
+        else:
+            image.thumbnail(size, Image.LANCZOS)
+
+        fmt = 'PNG' if target.lower().endswith('.png') else 'JPEG'
+        options = {'optimize': True}
+        if fmt == 'JPEG':
+            image = image.convert('RGB')
+            options.update(quality=82, progressive=True)
+
+        # Write to a temporary name and rename, so a request never serves a
+        # half-written variant.
+        partial = target + '.part'
+        image.save(partial, fmt, **options)
+        os.replace(partial, target)
+
+
+class ImageProcessor:
+    # Produces resized variants of uploaded images on a background thread
+    # pool. Uploads are saved at full size by the request, which returns
+    # immediately; templates ask image_url() for a variant and fall back to
+    # the original until the worker has written it.
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.workers = app.config['IMAGE_WORKERS']
+        self.static_folder = app.static_folder
+        app.add_template_global(self.url, 'image_url')
+
+    def _get_executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='image-processor')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def process(self, path):
+        for variant, (width, height, crop) in IMAGE_VARIANTS.items():
+            try:
+                _render_variant(path, variant_path(path, variant), (width, height), crop)
+            except Exception:
+                logger.exception('Could not create %s variant of %s', variant, path)
+
+    def submit(self, path, done=None):
+        # done() runs in an app context once the variants are written, for
+        # whatever rendered the original in their place to catch up.
+        def run():
+            self.process(path)
+            if done is not None:
+                with self.app.app_context():
+                    try:
+                        done()
+                    except Exception:
+                        logger.exception('Could not finish processing %s', path)
+        return self._get_executor().submit(run)
+
+    def url(self, filename, variant=None):
+        if variant is not None:
+            candidate = variant_path(filename, variant)
+            if os.path.exists(os.path.join(self.static_folder, candidate)):
+                return url_for('static', filename=candidate)
+        return url_for('static', filename=filename)
@@ -0,0 +1,236 @@
+import csv
+import gzip
+import json
+import itertools
+import sqlalchemy as sa
+from werkzeug.datastructures import MultiDict
+
+from app import db
+from app import passwords
+from app import search
+from app import geo
+from app.models import User, Profile, Hospital
+from app.enums import GenderEnum, BloodGroupEnum
+from app.forms import HospitalForm, RegistrationForm, ProfileForm
+
+HOSPITAL_FIELDS = ('name', 'hrn', 'address', 'city_or_town', 'state', 'zip_code', 'phone', 'email')
+USER_FIELDS = ('username', 'email', 'phone')
+PROFILE_FIELDS = ('dob', 'gender', 'address', 'state', 'zip_code', 'blood_group')
+
+
+# Uniqueness is checked once per chunk below instead of once per row, so
+# the forms only apply their field rules.
+class HospitalImportForm(HospitalForm):
+    def unique_checks(self):
+        return 'constraint'
+
+
+class UserImportForm(RegistrationForm):
+    def unique_checks(self):
+        return 'constraint'
+
+
+class ProfileImportForm(ProfileForm):
+    avatar = None
+    city_or_town = None
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    return 'csv' if name.endswith('.csv') else 'jsonl'
+
+
+def read_rows(f, fmt):
+    # Yields (line number, row dict) one at a time, however large the file.
+    if fmt == 'csv':
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for number, line in enumerate(f, 1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = {'_raw': line.rstrip('\n'), '_error': str(e)}
+                yield number, row if isinstance(row, dict) else {'_error': 'not an object'}
+
+
+class RejectsWriter:
+    # Bad rows are written in the input format with _line and _errors added,
+    # so they can be fixed and fed back in. The file is only created once
+    # there is something to write.
+    def __init__(self, path, fmt):
+        self.path = path
+        self.fmt = fmt
+        self.count = 0
+        self._file = None
+        self._writer = None
+
+    def write(self, number, row, errors):
+        if self._file is None:
+            self._file = open(self.path, 'w', encoding='utf-8', newline='')
+            if self.fmt == 'csv':
+                fields = [name for name in row if not name.startswith('_')] + ['_line', '_errors']
+                self._writer = csv.DictWriter(self._file, fields, extrasaction='ignore')
+                self._writer.writeheader()
+        record = dict(row, _line=number, _errors=json.dumps(errors) if self.fmt == 'csv' else errors)
+        if self.fmt == 'csv':
+            self._writer.writerow(record)
+        else:
+            self._file.write(json.dumps(record, default=str) + '\n')
+        self.count += 1
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+def _formdata(row):
+    return MultiDict({
+        key: str(value) for key, value in row.items()
+        if value is not None and not key.startswith('_')
+    })
+
+
+def _validate(form_class, row):
+    if '_error' in row:
+        return None, {'row': [row['_error']]}
+    form = form_class(formdata=_formdata(row), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    return form, None
+
+
+def _reject_duplicates(model, messages, candidates, reject):
+    # candidates: list of (number, row, values). Drops rows whose unique
+    # values exist in the table or earlier in the same chunk.
+    if not candidates:
+        return []
+    fields = list(messages)
+    existing = {}
+    for name in fields:
+        column = getattr(model, name)
+        wanted = {values[name] for _, _, values in candidates}
+        existing[name] = set(db.session.scalars(sa.select(column).where(column.in_(wanted))))
+
+    accepted = []
+    for number, row, values in candidates:
+        errors = {name: [messages[name]] for name in fields if values[name] in existing[name]}
+        if errors:
+            reject(number, row, errors)
+            continue
+        for name in fields:
+            existing[name].add(values[name])
+        accepted.append((number, row, values))
+    return accepted
+
+
+def _insert_chunk(insert, accepted, reject):
+    # One executemany per chunk, in one transaction. If a concurrent writer
+    # slipped in a duplicate, redo the chunk row by row to find it.
+    try:
+        insert(accepted)
+        db.session.commit()
+        return len(accepted)
+    except sa.exc.IntegrityError:
+        db.session.rollback()
+
+    inserted = 0
+    for item in accepted:
+        try:
+            with db.session.begin_nested():
+                insert([item])
+            inserted += 1
+        except sa.exc.IntegrityError as e:
+            reject(item[0], item[1], {'row': [str(e.orig)]})
+    db.session.commit()
+    return inserted
+
+
+def _run(path, fmt, rejects, chunk_size, validate, insert, model, unique_fields):
+    imported = 0
+    with _open(path) as f:
+        rows = read_rows(f, fmt)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            candidates = []
+            for number, row in chunk:
+                values, errors = validate(row)
+                if errors:
+                    rejects.write(number, row, errors)
+                else:
+                    candidates.append((number, row, values))
+            accepted = _reject_duplicates(model, unique_fields, candidates, rejects.write)
+            if accepted:
+                imported += _insert_chunk(insert, accepted, rejects.write)
+    return imported
+
+
+def import_hospitals(path, rejects, fmt=None, chunk_size=1000):
+    fmt = fmt or detect_format(path)
+
+    def validate(row):
+        form, errors = _validate(HospitalImportForm, row)
+        if errors:
+            return None, errors
+        return {name: getattr(form, name).data for name in HOSPITAL_FIELDS}, None
+
+    def insert(accepted):
+        rows = db.session.execute(
+            sa.insert(Hospital).returning(Hospital.id, *(getattr(Hospital, c) for c in search.SEARCH_COLUMNS)),
+            geo.add_locations(db.session, [dict(values) for _, _, values in accepted])
+        ).mappings().all()
+        search.index_rows(db.session.connection(), rows)
+
+    return _run(path, fmt, rejects, chunk_size, validate, insert, Hospital, HospitalForm.unique_fields)
+
+
+def import_users(path, rejects, fmt=None, chunk_size=1000):
+    # Rows need username, email, phone and password, validated like the
+    # registration form. Donor profile columns are optional; when any is
+    # present the row is validated like the profile form too.
+    fmt = fmt or detect_format(path)
+
+    def validate(row):
+        if '_error' not in row:
+            row = dict(row, password2=row.get('password'))
+        form, errors = _validate(UserImportForm, row)
+        if errors:
+            return None, errors
+        values = {name: getattr(form, name).data for name in USER_FIELDS}
+        values['password'] = form.password.data
+        if any(row.get(name) not in (None, '') for name in PROFILE_FIELDS):
+            profile, errors = _validate(ProfileImportForm, row)
+            if errors:
+                return None, errors
+            values['profile'] = dict(
+                {name: getattr(profile, name).data for name in PROFILE_FIELDS},
+                gender=GenderEnum[profile.gender.data],
+                blood_group=BloodGroupEnum[profile.blood_group.data],
+            )
+        return values, None
+
+    def insert(accepted):
+        hashes = passwords.hash_many([values['password'] for _, _, values in accepted])
+        users = [
+            dict({name: values[name] for name in USER_FIELDS}, password_hash=password_hash, is_admin=False)
+            for (_, _, values), password_hash in zip(accepted, hashes)
+        ]
+        ids = dict(db.session.execute(sa.insert(User).returning(User.username, User.id), users).all())
+        profiles = [
+            dict(values['profile'], user_id=ids[values['username']])
+            for _, _, values in accepted if 'profile' in values
+        ]
+        if profiles:
+            db.session.execute(sa.insert(Profile), geo.add_locations(db.session, profiles))
+
+    return _run(path, fmt, rejects, chunk_size, validate, insert, User, RegistrationForm.unique_fields)
@@ -0,0 +1,215 @@
+import sqlalchemy as sa
+from collections import Counter
+from datetime import datetime, timezone
+from sqlalchemy.dialects import sqlite, postgresql
+
+from app import db
+from app import geo
+from app.enums import BloodGroupEnum, BloodUnitStatusEnum, StockMovementReasonEnum
+from app.models import Hospital, BloodStock, BloodUnit, StockMovement
+
+
+# What allocate() turns the units it takes into, by movement reason.
+ALLOCATION_STATUSES = {
+    StockMovementReasonEnum.ISSUED: BloodUnitStatusEnum.ISSUED,
+    StockMovementReasonEnum.DISCARDED: BloodUnitStatusEnum.DISCARDED,
+}
+
+
+class InsufficientStockError(Exception):
+    pass
+
+
+def _upsert_stock(deltas):
+    # deltas: [(hospital_id, blood_group, quantity), ...]; adds the quantities
+    # onto the rollup rows, creating missing rows, in a single executemany.
+    rows = [dict(hospital_id=h, blood_group=bg, quantity=q) for h, bg, q in deltas]
+    if not rows:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert(BloodStock)
+        db.session.execute(insert.on_conflict_do_update(
+            index_elements=[BloodStock.hospital_id, BloodStock.blood_group],
+            set_={'quantity': BloodStock.quantity + insert.excluded.quantity}
+        ), rows)
+        return
+
+    for row in rows:
+        result = db.session.execute(
+            sa.update(BloodStock)
+            .where(BloodStock.hospital_id == row['hospital_id'], BloodStock.blood_group == row['blood_group'])
+            .values(quantity=BloodStock.quantity + row['quantity'])
+        )
+        if result.rowcount == 0:
+            db.session.execute(sa.insert(BloodStock), [row])
+
+
+def _take_stock(hospital_id, blood_group, quantity):
+    result = db.session.execute(
+        sa.update(BloodStock)
+        .where(
+            BloodStock.hospital_id == hospital_id,
+            BloodStock.blood_group == blood_group,
+            BloodStock.quantity >= quantity
+        )
+        .values(quantity=BloodStock.quantity - quantity)
+    )
+    if result.rowcount == 0:
+        raise InsufficientStockError(
+            'Not enough {} units in stock'.format(BloodGroupEnum(blood_group).value)
+        )
+
+
+def record_movement(hospital, blood_group, quantity, reason):
+    # The ledger row and the rollup change are written in the caller's
+    # transaction, so they commit or roll back together.
+    blood_group = BloodGroupEnum(blood_group)
+    if quantity < 0:
+        _take_stock(hospital.id, blood_group, -quantity)
+    else:
+        _upsert_stock([(hospital.id, blood_group, quantity)])
+    movement = StockMovement(hospital=hospital, blood_group=blood_group, quantity=quantity, reason=reason)
+    db.session.add(movement)
+    return movement
+
+
+def receive(hospital, blood_group, quantity, expires_at, now=None):
+    now = now or datetime.now(timezone.utc)
+    blood_group = BloodGroupEnum(blood_group)
+    db.session.execute(sa.insert(BloodUnit), [
+        dict(hospital_id=hospital.id, blood_group=blood_group, status=BloodUnitStatusEnum.AVAILABLE,
+             received_at=now, expires_at=expires_at)
+        for _ in range(quantity)
+    ])
+    return record_movement(hospital, blood_group, quantity, StockMovementReasonEnum.RECEIVED)
+
+
+def allocate(hospital, blood_group, quantity, reason=StockMovementReasonEnum.ISSUED, now=None):
+    # Claims the units closest to expiry in one UPDATE ... WHERE id IN
+    # (SELECT ... ORDER BY expires_at LIMIT n). Postgres locks the picked
+    # rows with FOR UPDATE SKIP LOCKED so concurrent allocations take
+    # different units; SQLite has no row locks, but the UPDATE holds the
+    # database write lock, which serialises allocators just the same.
+    reason = StockMovementReasonEnum(reason)
+    if reason not in ALLOCATION_STATUSES:
+        raise ValueError('Units cannot be allocated as {}'.format(reason.value))
+    now = now or datetime.now(timezone.utc)
+    blood_group = BloodGroupEnum(blood_group)
+    candidates = (
+        sa.select(BloodUnit.id)
+        .where(
+            BloodUnit.hospital_id == hospital.id,
+            BloodUnit.blood_group == blood_group,
+            BloodUnit.expires_at > now,
+            BloodUnit.status == BloodUnitStatusEnum.AVAILABLE
+        )
+        .order_by(BloodUnit.expires_at, BloodUnit.id)
+        .limit(quantity)
+        .with_for_update(skip_locked=True)
+    )
+    ids = db.session.scalars(
+        sa.update(BloodUnit)
+        .where(BloodUnit.id.in_(candidates), BloodUnit.status == BloodUnitStatusEnum.AVAILABLE)
+        .values(status=ALLOCATION_STATUSES[reason], released_at=now)
+        .returning(BloodUnit.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if len(ids) < quantity:
+        raise InsufficientStockError(
+            'Only {} unexpired {} units available'.format(len(ids), blood_group.value)
+        )
+    record_movement(hospital, blood_group, -quantity, reason)
+    return db.session.scalars(
+        sa.select(BloodUnit).where(BloodUnit.id.in_(ids)).order_by(BloodUnit.expires_at)
+    ).all()
+
+
+def expire_units(now=None):
+    # Set-based sweep: one UPDATE ... RETURNING flags every lapsed unit and
+    # reports which it flagged, and the ledger and rollups are written with
+    # one executemany each.
+    now = now or datetime.now(timezone.utc)
+    expired = Counter(tuple(row) for row in db.session.execute(
+        sa.update(BloodUnit)
+        .where(BloodUnit.status == BloodUnitStatusEnum.AVAILABLE, BloodUnit.expires_at <= now)
+        .values(status=BloodUnitStatusEnum.EXPIRED, released_at=now)
+        .returning(BloodUnit.hospital_id, BloodUnit.blood_group)
+        .execution_options(synchronize_session=False)
+    ))
+    if expired:
+        db.session.execute(sa.insert(StockMovement), [
+            dict(hospital_id=hospital_id, blood_group=blood_group, quantity=-count,
+                 reason=StockMovementReasonEnum.EXPIRED, timestamp=now)
+            for (hospital_id, blood_group), count in expired.items()
+        ])
+        _upsert_stock([(hospital_id, blood_group, -count) for (hospital_id, blood_group), count in expired.items()])
+    return sum(expired.values())
+
+
+def current_stock(hospital):
+    stock = {bg: 0 for bg in BloodGroupEnum}
+    for row in db.session.scalars(hospital.stock.select()):
+        stock[row.blood_group] = row.quantity
+    return stock
+
+
+def _ledger_totals():
+    return (
+        sa.select(
+            StockMovement.hospital_id,
+            StockMovement.blood_group,
+            sa.func.sum(StockMovement.quantity).label('quantity')
+        )
+        .group_by(StockMovement.hospital_id, StockMovement.blood_group)
+        .subquery()
+    )
+
+
+def check_stock():
+    ledger = _ledger_totals()
+    drifted = (
+        sa.select(ledger.c.hospital_id, ledger.c.blood_group, ledger.c.quantity, BloodStock.quantity)
+        .outerjoin(BloodStock, sa.and_(
+            BloodStock.hospital_id == ledger.c.hospital_id,
+            BloodStock.blood_group == ledger.c.blood_group
+        ))
+        .where(sa.func.coalesce(BloodStock.quantity, 0) != ledger.c.quantity)
+    )
+    orphaned = (
+        sa.select(BloodStock.hospital_id, BloodStock.blood_group, sa.literal(0), BloodStock.quantity)
+        .outerjoin(ledger, sa.and_(
+            BloodStock.hospital_id == ledger.c.hospital_id,
+            BloodStock.blood_group == ledger.c.blood_group
+        ))
+        .where(ledger.c.hospital_id.is_(None), BloodStock.quantity != 0)
+    )
+    return db.session.execute(sa.union_all(drifted, orphaned)).all()
+
+
+def rebuild_stock():
+    ledger = _ledger_totals()
+    db.session.execute(sa.delete(BloodStock))
+    db.session.execute(sa.insert(BloodStock).from_select(
+        ['hospital_id', 'blood_group', 'quantity'],
+        sa.select(ledger.c.hospital_id, ledger.c.blood_group, ledger.c.quantity)
+    ))
+
+
+def nearest_hospitals(latitude, longitude, blood_group=None, quantity=1, limit=10):
+    # [(hospital, km), ...] nearest first, optionally only hospitals holding
+    # at least `quantity` units of blood_group.
+    where = []
+    if blood_group is not None:
+        where.append(sa.exists().where(
+            BloodStock.hospital_id == Hospital.id,
+            BloodStock.blood_group == BloodGroupEnum(blood_group),
+            BloodStock.quantity >= quantity
+        ))
+    found = geo.nearest(
+        db.session, (Hospital.id, Hospital.latitude, Hospital.longitude, Hospital.geohash),
+        latitude, longitude, limit, where=where
+    )
+    hospitals = {h.id: h for h in db.session.scalars(sa.select(Hospital).where(Hospital.id.in_([i for i, _ in found])))}
+    return [(hospitals[i], km) for i, km in found]
@@ -0,0 +1,105 @@
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+from app import db
+from app import geo
+from app.enums import BloodGroupEnum
+from app.models import Profile
+from app.pagination import KeysetPage, encode_cursor, decode_cursor, decode_values
+
+_ANTIGENS = {
+    BloodGroupEnum.O_NEGATIVE: frozenset(),
+    BloodGroupEnum.O_POSITIVE: frozenset({'Rh'}),
+    BloodGroupEnum.A_NEGATIVE: frozenset({'A'}),
+    BloodGroupEnum.A_POSITIVE: frozenset({'A', 'Rh'}),
+    BloodGroupEnum.B_NEGATIVE: frozenset({'B'}),
+    BloodGroupEnum.B_POSITIVE: frozenset({'B', 'Rh'}),
+    BloodGroupEnum.AB_NEGATIVE: frozenset({'A', 'B'}),
+    BloodGroupEnum.AB_POSITIVE: frozenset({'A', 'B', 'Rh'}),
+}
+
+# A donor can give to any recipient whose red cells already carry every
+# antigen the donor's cells carry.
+CAN_DONATE_TO = {
+    donor: frozenset(recipient for recipient in BloodGroupEnum if _ANTIGENS[donor] <= _ANTIGENS[recipient])
+    for donor in BloodGroupEnum
+}
+
+# Per recipient, compatible donor groups best-first: the identical group,
+# then the groups that can serve the fewest recipients, so universal donors
+# are only asked once nobody more specific is available.
+COMPATIBLE_DONORS = {
+    recipient: tuple(sorted(
+        (donor for donor in BloodGroupEnum if recipient in CAN_DONATE_TO[donor]),
+        key=lambda donor: (donor != recipient, len(CAN_DONATE_TO[donor]), donor.name)
+    ))
+    for recipient in BloodGroupEnum
+}
+
+
+def is_compatible(donor, recipient):
+    return BloodGroupEnum(recipient) in CAN_DONATE_TO[BloodGroupEnum(donor)]
+
+
+def _tiers(recipient, state=None, zip_code=None):
+    # Each tier is an equality prefix of ix_profile_blood_group_state_zip_code
+    # ordered by the rest of the index, so SQL walks the index in order and
+    # stops after one page instead of sorting every candidate.
+    donors = COMPATIBLE_DONORS[BloodGroupEnum(recipient)]
+    region = [Profile.state == state] if state else []
+    if zip_code:
+        for donor in donors:
+            yield [Profile.blood_group == donor, *region, Profile.zip_code == zip_code], [Profile.id]
+    for donor in donors:
+        where = [Profile.blood_group == donor, *region]
+        if zip_code:
+            where.append(Profile.zip_code != zip_code)
+        order = [Profile.zip_code, Profile.id] if state else [Profile.state, Profile.zip_code, Profile.id]
+        yield where, order
+
+
+def find_donors(recipient, state=None, zip_code=None, cursor=None, per_page=20):
+    tiers = list(_tiers(recipient, state=state, zip_code=zip_code))
+
+    # A cursor is the tier index then that tier's order values; one that
+    # does not fit is ignored, as paginate_keyset does.
+    start, after = 0, None
+    values = decode_cursor(cursor) if cursor else None
+    if values and type(values[0]) is int and 0 <= values[0] < len(tiers):
+        after = decode_values(tiers[values[0]][1], values[1:])
+        if after is not None:
+            start = values[0]
+
+    found = []
+    for tier in range(start, len(tiers)):
+        where, order = tiers[tier]
+        stmt = sa.select(Profile).options(so.joinedload(Profile.user)).where(*where)
+        if tier == start and after:
+            stmt = stmt.where(sa.tuple_(*order) > sa.tuple_(*after))
+        stmt = stmt.order_by(*order).limit(per_page + 1 - len(found))
+        found.extend((tier, profile) for profile in db.session.scalars(stmt))
+        if len(found) > per_page:
+            break
+
+    next_cursor = None
+    if len(found) > per_page:
+        found = found[:per_page]
+        tier, last = found[-1]
+        next_cursor = encode_cursor([tier] + [getattr(last, column.key) for column in tiers[tier][1]])
+    return KeysetPage([profile for _, profile in found], next_cursor, per_page)
+
+
+def nearest_donors(recipient, latitude, longitude, limit=20):
+    # [(profile, km), ...] of compatible donors, nearest first. Distance
+    # comes before how specific the donor's group is here.
+    donors = COMPATIBLE_DONORS[BloodGroupEnum(recipient)]
+    found = geo.nearest(
+        db.session, (Profile.id, Profile.latitude, Profile.longitude, Profile.geohash),
+        latitude, longitude, limit, partitions=[[Profile.blood_group == donor] for donor in donors]
+    )
+    profiles = {
+        p.id: p for p in db.session.scalars(
+            sa.select(Profile).options(so.joinedload(Profile.user)).where(Profile.id.in_([i for i, _ in found]))
+        )
+    }
+    return [(profiles[i], km) for i, km in found]
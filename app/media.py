@@ -0,0 +1,131 @@
+import os
+import re
+import time
+import hashlib
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+BLOB_PATTERN = re.compile(r'^([0-9a-f]{64})(\.[a-z]+)?\.[a-z0-9]+$')
+
+
+class MediaStore:
+    # Content-addressed storage for uploads. A file is stored once under
+    # the SHA-256 of its bytes, in two levels of shard directories
+    # (ab/cd/abcd...) so no single directory grows unbounded. Uploading
+    # bytes that already exist just returns the existing path.
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+
+    def blob_path(self, folder, digest, ext):
+        return os.path.join(folder, digest[:2], digest[2:4], '{}.{}'.format(digest, ext))
+
+    def static_path(self, path):
+        return os.path.relpath(path, self.static_folder).replace(os.sep, '/')
+
+    def save(self, file, folder):
+        ext = os.path.splitext(file.filename or '')[1].lstrip('.').lower()
+        ext = 'jpg' if ext == 'jpeg' else ext or 'bin'
+
+        digest = hashlib.sha256()
+        os.makedirs(folder, exist_ok=True)
+        fd, partial = tempfile.mkstemp(dir=folder, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    out.write(chunk)
+
+            path = self.blob_path(folder, digest.hexdigest(), ext)
+            created = not self._touch(path, digest.hexdigest())
+            if created:
+                # collect_garbage() removes shard directories it empties, so
+                # one may go between makedirs() and replace(); make it again.
+                for attempt in range(3):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    try:
+                        os.replace(partial, path)
+                        break
+                    except FileNotFoundError:
+                        if attempt == 2:
+                            raise
+        finally:
+            if os.path.exists(partial):
+                os.remove(partial)
+        return self.static_path(path), path, created
+
+    def _touch(self, path, digest):
+        # A blob that is uploaded again may be unreferenced right now, and
+        # the row that will reference it is not committed yet. Bumping the
+        # mtime of the blob and its variants keeps collect_garbage() away
+        # from them for another min_age.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        for entry in os.scandir(os.path.dirname(path)):
+            if entry.name.startswith(digest) and entry.path != path:
+                try:
+                    os.utime(entry.path)
+                except FileNotFoundError:
+                    pass
+        return True
+
+    def iter_files(self, folder, include_legacy=False):
+        # Yields (path, digest or None, mtime) without listing whole trees
+        # into memory.
+        for entry in os.scandir(folder):
+            if entry.is_dir() and len(entry.name) == 2:
+                for shard in os.scandir(entry.path):
+                    if not shard.is_dir():
+                        continue
+                    for blob in os.scandir(shard.path):
+                        match = BLOB_PATTERN.match(blob.name)
+                        if match and blob.is_file():
+                            yield blob.path, match.group(1), blob.stat().st_mtime
+            elif include_legacy and entry.is_file():
+                yield entry.path, None, entry.stat().st_mtime
+
+    def collect_garbage(self, folder, referenced, min_age=3600, include_legacy=False, dry_run=False):
+        # referenced: iterable of static paths still stored in the database.
+        # Blobs (and their resized variants) whose digest no path mentions
+        # are removed; files newer than min_age are skipped because their
+        # row may not have been committed yet.
+        digests, legacy = set(), set()
+        for path in referenced:
+            name = os.path.basename(path)
+            match = BLOB_PATTERN.match(name)
+            if match:
+                digests.add(match.group(1))
+            else:
+                legacy.add(name)
+        cutoff = time.time() - min_age
+
+        removed = []
+        for path, digest, mtime in self.iter_files(folder, include_legacy=include_legacy):
+            if mtime > cutoff:
+                continue
+            if digest is not None:
+                if digest in digests:
+                    continue
+            else:
+                root, ext = os.path.splitext(os.path.basename(path))
+                original = os.path.splitext(root)[0] + ext
+                if os.path.basename(path) in legacy or original in legacy:
+                    continue
+            removed.append(path)
+
+        if not dry_run:
+            for path in removed:
+                os.remove(path)
+            for entry in os.scandir(folder):
+                if entry.is_dir() and len(entry.name) == 2:
+                    for shard in os.scandir(entry.path):
+                        if shard.is_dir() and not os.listdir(shard.path):
+                            os.rmdir(shard.path)
+                    if not os.listdir(entry.path):
+                        os.rmdir(entry.path)
+        return removed
@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import atexit
+import threading
+import sqlalchemy as sa
+from collections import defaultdict
+from flask import g, request, has_app_context, before_render_template, template_rendered
+
+# Totals of worker processes that have exited, folded into one file.
+RETIRED_FILE = 'retired.json'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'http_requests_total': ('counter', 'Requests handled, by endpoint, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Time spent handling a request.'),
+    'http_upload_bytes_total': ('counter', 'Bytes received in multipart uploads.'),
+    'db_statements_total': ('counter', 'SQL statements executed while handling requests.'),
+    'db_duration_seconds_total': ('counter', 'Time spent executing SQL while handling requests.'),
+    'template_render_duration_seconds': ('histogram', 'Time spent rendering a template.'),
+    'application_worker_claimed_total': ('counter', 'Donor applications claimed by the worker.'),
+    'application_worker_processed_total': ('counter', 'Donor applications processed, by outcome.'),
+    'application_worker_duration_seconds': ('histogram', 'Time spent checking one donor application.'),
+    'emergency_recipients_total': ('counter', 'Donors queued for an emergency notification.'),
+    'notifications_total': ('counter', 'Notification delivery attempts, by outcome.'),
+    'notification_batch_duration_seconds': ('histogram', 'Time spent sending one batch over one SMTP session.'),
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _combine(snapshots):
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, buckets, counts, total, count in snapshot['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            if key not in histograms:
+                histograms[key] = [buckets, [0] * len(buckets), 0.0, 0]
+            entry = histograms[key]
+            entry[1] = [a + b for a, b in zip(entry[1], counts)]
+            entry[2] += total
+            entry[3] += count
+    return counters, histograms
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, _escape(v)) for k, v in pairs) + '}'
+
+
+class Metrics:
+    # Per-endpoint request metrics in the Prometheus text format. Each
+    # process accumulates in memory; when METRICS_DIR is set it also writes
+    # a snapshot file there (at most every METRICS_FLUSH_INTERVAL seconds),
+    # and /metrics sums the snapshots of every worker. When a worker exits,
+    # or is found dead, its totals are folded into RETIRED_FILE and its own
+    # file removed, so the directory stays one file per live worker and
+    # the sums never go down. Empty METRICS_DIR when the service restarts.
+    # /metrics is off unless METRICS_TOKEN is set, and scrapers send it as
+    # a bearer token.
+    def __init__(self, app=None, db=None):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._last_flush = 0
+        self._file = None
+        self._retired = False
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.directory = app.config['METRICS_DIR']
+        self.flush_interval = app.config['METRICS_FLUSH_INTERVAL']
+        self.token = app.config['METRICS_TOKEN']
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            atexit.unregister(self.retire)
+            atexit.register(self.retire)
+
+        with app.app_context():
+            engines = db.engines
+        for engine in engines.values():
+            sa.event.listen(engine, 'before_cursor_execute', self._before_execute)
+            sa.event.listen(engine, 'after_cursor_execute', self._after_execute)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        app.before_request(self._start)
+        app.after_request(self._record_status)
+        app.teardown_request(self._finish)
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._counters[name, labels] += value
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        with self._lock:
+            entry = self._histograms.get((name, labels))
+            if entry is None:
+                entry = self._histograms[name, labels] = [list(buckets), [0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(entry[0]):
+                if value <= bound:
+                    entry[1][i] += 1
+            entry[2] += value
+            entry[3] += 1
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # The start goes on the execution context, which dies with the
+        # statement: a statement that raises never reaches
+        # after_cursor_execute, and must not leave anything on the pooled
+        # connection for later requests to pick up.
+        if context is not None and has_app_context() and '_metrics_start' in g:
+            context._metrics_query_start = time.perf_counter()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_metrics_query_start', None)
+        if start is not None and has_app_context() and '_metrics_start' in g:
+            g._metrics_db_time += time.perf_counter() - start
+            g._metrics_db_count += 1
+
+    def _before_render(self, sender, template, context, **extra):
+        if '_metrics_start' in g:
+            g._metrics_render_starts.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        if g.get('_metrics_render_starts'):
+            elapsed = time.perf_counter() - g._metrics_render_starts.pop()
+            self.observe('template_render_duration_seconds', (('template', template.name),), elapsed)
+
+    def _start(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_db_time = 0.0
+        g._metrics_db_count = 0
+        g._metrics_render_starts = []
+
+    def _record_status(self, response):
+        g._metrics_status = response.status_code
+        return response
+
+    def _finish(self, exc):
+        start = g.pop('_metrics_start', None)
+        if start is None:
+            return
+        endpoint = (('endpoint', request.endpoint or 'none'),)
+        status = g.pop('_metrics_status', 500)
+        self.observe('http_request_duration_seconds', endpoint, time.perf_counter() - start)
+        self.inc('http_requests_total', (*endpoint, ('method', request.method), ('status', str(status))))
+        self.inc('db_statements_total', endpoint, g._metrics_db_count)
+        self.inc('db_duration_seconds_total', endpoint, g._metrics_db_time)
+        if request.mimetype == 'multipart/form-data' and request.content_length:
+            self.inc('http_upload_bytes_total', endpoint, request.content_length)
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'histograms': [
+                    [name, labels, buckets, list(counts), total, count]
+                    for (name, labels), (buckets, counts, total, count) in self._histograms.items()
+                ],
+            }
+
+    def flush(self):
+        if not self.directory or self._retired:
+            return
+        with self._flush_lock:
+            if self._file is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._file = os.path.join(self.directory, '{}-{}.json'.format(self._pid, uuid.uuid4().hex[:8]))
+            partial = self._file + '.part'
+            with open(partial, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(partial, self._file)
+            self._last_flush = time.monotonic()
+
+    def _locked(self, operation):
+        lock = open(os.path.join(self.directory, '.lock'), 'a')
+        fcntl.flock(lock, operation)
+        return lock
+
+    def _fold(self, paths):
+        # Adds the snapshots at paths to RETIRED_FILE and removes them, under
+        # the lock render() reads with, so no scrape sees a worker twice.
+        retired = os.path.join(self.directory, RETIRED_FILE)
+        with self._locked(fcntl.LOCK_EX):
+            snapshots = [snapshot for snapshot in map(_read, [retired, *paths]) if snapshot]
+            counters, histograms = _combine(snapshots)
+            partial = retired + '.part'
+            with open(partial, 'w') as f:
+                json.dump({
+                    'counters': [[name, labels, value] for (name, labels), value in counters.items()],
+                    'histograms': [[name, labels, *entry] for (name, labels), entry in histograms.items()],
+                }, f)
+            os.replace(partial, retired)
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def retire(self):
+        # Registered with atexit.
+        if not self.directory or self._retired:
+            return
+        self.flush()
+        self._retired = True
+        self._fold([self._file])
+
+    def _snapshots(self):
+        if not self.directory:
+            yield self.snapshot()
+            return
+        self.flush()
+        # Workers killed without running atexit leave their file behind.
+        dead = [
+            entry.path for entry in os.scandir(self.directory)
+            if entry.name.endswith('.json') and entry.name != RETIRED_FILE
+            and entry.name.split('-', 1)[0].isdigit() and not _alive(int(entry.name.split('-', 1)[0]))
+        ]
+        if dead:
+            self._fold(dead)
+        with self._locked(fcntl.LOCK_SH):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.json'):
+                    snapshot = _read(entry.path)
+                    if snapshot is not None:
+                        yield snapshot
+
+    def render(self):
+        counters, histograms = _combine(self._snapshots())
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append('# HELP {} {}'.format(name, help_text))
+            lines.append('# TYPE {} {}'.format(name, kind))
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+            else:
+                for (metric, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, bucket_count in zip(buckets, counts):
+                        lines.append('{}_bucket{} {}'.format(name, _format_labels(labels, [('le', bound)]), bucket_count))
+                    lines.append('{}_bucket{} {}'.format(name, _format_labels(labels, [('le', '+Inf')]), count))
+                    lines.append('{}_sum{} {}'.format(name, _format_labels(labels), total))
+                    lines.append('{}_count{} {}'.format(name, _format_labels(labels), count))
+        return '\n'.join(lines) + '\n'
@@ -1,19 +1,26 @@
-import os
 import sqlalchemy as sa
 from datetime import date
 import sqlalchemy.orm as so
 from typing import Optional
 from flask_login import UserMixin
-import pydenticon, hashlib, base64
 from datetime import datetime, timezone
-from werkzeug.security import generate_password_hash, check_password_hash
 
 from app import db
 from app import login
+from app import passwords
+from app import user_cache
+from app import search
+from app import identicons
+from app import fragments
+from app import geo
+from app.identicons import email_digest
 from app.enums import (
     GenderEnum, 
     BloodGroupEnum, 
-    DonorApplicationStatusEnum
+    DonorApplicationStatusEnum,
+    StockMovementReasonEnum,
+    BloodUnitStatusEnum,
+    NotificationStatusEnum
 )
 
 
@@ -25,39 +32,32 @@ class User(UserMixin, db.Model):
     avatar: so.Mapped[Optional[str]] = so.mapped_column(sa.String(256), nullable=True)
     password_hash: so.Mapped[Optional[str]] = so.mapped_column(sa.String(256))
     is_admin: so.Mapped[Optional[bool]] = so.mapped_column(sa.Boolean, default=False, nullable=False)
+    updated_at: so.Mapped[datetime] = so.mapped_column(
+        default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc)
+    )
     
     profile: so.Mapped['Profile'] = so.relationship('Profile', back_populates='user', uselist=False)
     applications: so.WriteOnlyMapped['DonorApplication'] = so.relationship(back_populates='applicant')
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
+
+    def password_needs_rehash(self):
+        return passwords.needs_rehash(self.password_hash)
+
+    @property
+    def identicon_digest(self):
+        return email_digest(self.email)
 
     def gen_avatar(self, size=36, write_png=True):
-        foreground = [ 
-            "rgb(45,79,255)",
-            "rgb(254,180,44)",
-            "rgb(226,121,234)",
-            "rgb(30,179,253)",
-            "rgb(232,77,65)",
-            "rgb(49,203,115)",
-            "rgb(141,69,170)"
-        ]
-        background = "rgb(256,256,256)"
-
-        digest = hashlib.md5(self.email.lower().encode('utf-8')).hexdigest()
-        basedir = os.path.abspath(os.path.dirname(__file__))
-        pngloc = os.path.join(basedir, 'usercontent', 'identicon', str(digest) + '.png')
-        icongen = pydenticon.Generator(5, 5, digest=hashlib.md5, foreground=foreground, background=background)
-        pngicon = icongen.generate(self.email, size, size, padding=(8, 8, 8, 8), inverted=False, output_format="png")
         if write_png:
-            pngfile = open(pngloc, "wb")
-            pngfile.write(pngicon)
-            pngfile.close()
+            identicons.render(self.identicon_digest, size)
         else:
-            return str(base64.b64encode(pngicon))[2:-1]
+            return identicons.data_uri(self.identicon_digest, size)
+
     def __repr__(self):
         return '<User {}>'.format(self.username)
 
@@ -69,12 +69,23 @@ class Profile(db.Model):
     state: so.Mapped[str] = so.mapped_column(sa.String(100), nullable=False)
     zip_code: so.Mapped[str] = so.mapped_column(sa.String(10), nullable=False)
     blood_group: so.Mapped[BloodGroupEnum] = so.mapped_column(sa.Enum(BloodGroupEnum), nullable=False)
+    latitude: so.Mapped[Optional[float]] = so.mapped_column(sa.Float(), nullable=True)
+    longitude: so.Mapped[Optional[float]] = so.mapped_column(sa.Float(), nullable=True)
+    geohash: so.Mapped[Optional[str]] = so.mapped_column(sa.String(geo.GEOHASH_PRECISION), nullable=True)
+    updated_at: so.Mapped[datetime] = so.mapped_column(
+        default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc)
+    )
 
     user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id), index=True, unique=True, nullable=False)
     user: so.Mapped['User'] = so.relationship('User', back_populates='profile')
 
+    __table_args__ = (
+        sa.Index('ix_profile_blood_group_state_zip_code', 'blood_group', 'state', 'zip_code'),
+        sa.Index('ix_profile_blood_group_geohash', 'blood_group', 'geohash', 'latitude', 'longitude'),
+    )
+
     def __repr__(self):
-        return '<Profile for User {}>'.format(self.user.username)
+        return '<Profile for User {}>'.format(self.user_id)
 
 class DonorApplication(db.Model):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
@@ -90,24 +101,213 @@ class DonorApplication(db.Model):
         nullable=False,
         default=DonorApplicationStatusEnum.PENDING
     )
+    attempts: so.Mapped[int] = so.mapped_column(nullable=False, default=0, server_default='0')
+    claimed_at: so.Mapped[Optional[datetime]] = so.mapped_column(nullable=True)
+    next_attempt_at: so.Mapped[Optional[datetime]] = so.mapped_column(nullable=True)
+    note: so.Mapped[Optional[str]] = so.mapped_column(sa.String(256), nullable=True)
+    updated_at: so.Mapped[datetime] = so.mapped_column(
+        default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc)
+    )
+
+    __table_args__ = (
+        sa.Index('ix_donor_application_status_timestamp', 'status', 'timestamp'),
+    )
+
     def __repr__(self):
-        return '<DonorApplication of User {}>'.format(self.applicant.username)
+        return '<DonorApplication {} of User {}>'.format(self.id, self.user_id)
 
 class Hospital(db.Model):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
-    name: so.Mapped[str] = so.mapped_column(sa.String(64), unique=True, nullable=False)
+    name: so.Mapped[str] = so.mapped_column(sa.String(64), nullable=False)
     image: so.Mapped[Optional[str]] = so.mapped_column(sa.String(256), nullable=True)
     hrn: so.Mapped[str] = so.mapped_column(sa.String(32), index=True, unique=True, nullable=False)
     address: so.Mapped[str] = so.mapped_column(sa.String(120), nullable=False)
     city_or_town: so.Mapped[str] = so.mapped_column(sa.String(100), nullable=False)
     state: so.Mapped[str] = so.mapped_column(sa.String(100), nullable=False)
     zip_code: so.Mapped[str] = so.mapped_column(sa.String(10), nullable=False)
-    phone: so.Mapped[str] = so.mapped_column(sa.String(10), unique=True, nullable=False)
-    email: so.Mapped[str] = so.mapped_column(sa.String(120), unique=True, nullable=False)
+    phone: so.Mapped[str] = so.mapped_column(sa.String(10), nullable=False)
+    email: so.Mapped[str] = so.mapped_column(sa.String(120), nullable=False)
+    latitude: so.Mapped[Optional[float]] = so.mapped_column(sa.Float(), nullable=True)
+    longitude: so.Mapped[Optional[float]] = so.mapped_column(sa.Float(), nullable=True)
+    geohash: so.Mapped[Optional[str]] = so.mapped_column(sa.String(geo.GEOHASH_PRECISION), nullable=True)
+    updated_at: so.Mapped[datetime] = so.mapped_column(
+        default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc)
+    )
+
+    # Write-only collections cannot be loaded to cascade a delete; leave
+    # the rows to the foreign keys instead.
+    stock: so.WriteOnlyMapped['BloodStock'] = so.relationship(back_populates='hospital', passive_deletes=True)
+    movements: so.WriteOnlyMapped['StockMovement'] = so.relationship(back_populates='hospital', passive_deletes=True)
+    units: so.WriteOnlyMapped['BloodUnit'] = so.relationship(back_populates='hospital', passive_deletes=True)
+    emergencies: so.WriteOnlyMapped['EmergencyRequest'] = so.relationship(back_populates='hospital', passive_deletes=True)
+
+    __table_args__ = (
+        # Named as Postgres names them by default, so forms can tell which
+        # one a duplicate hit.
+        sa.UniqueConstraint('name', name='hospital_name_key'),
+        sa.UniqueConstraint('phone', name='hospital_phone_key'),
+        sa.UniqueConstraint('email', name='hospital_email_key'),
+        sa.Index('ix_hospital_state_name', 'state', 'name'),
+        sa.Index('ix_hospital_state_city_or_town_name', 'state', 'city_or_town', 'name'),
+        sa.Index('ix_hospital_city_or_town_name', 'city_or_town', 'name'),
+        sa.Index('ix_hospital_zip_code_name', 'zip_code', 'name'),
+        sa.Index('ix_hospital_geohash', 'geohash', 'latitude', 'longitude'),
+    )
+
+    @classmethod
+    def search(cls, q, limit=50):
+        stmt = search.search_hospitals(cls, db.engine.dialect.name, q, limit=limit)
+        if stmt is None:
+            return []
+        return db.session.scalars(stmt).all()
 
     def __repr__(self):
         return '<Hospital {} - {}>'.format(self.name, self.hrn)
 
+search.install(Hospital)
+
+class StockMovement(db.Model):
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    hospital_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(Hospital.id), nullable=False)
+    blood_group: so.Mapped[BloodGroupEnum] = so.mapped_column(sa.Enum(BloodGroupEnum), nullable=False)
+    quantity: so.Mapped[int] = so.mapped_column(nullable=False)
+    reason: so.Mapped[StockMovementReasonEnum] = so.mapped_column(sa.Enum(StockMovementReasonEnum), nullable=False)
+    timestamp: so.Mapped[datetime] = so.mapped_column(index=True, default=lambda: datetime.now(timezone.utc))
+    hospital: so.Mapped[Hospital] = so.relationship(back_populates='movements')
+
+    __table_args__ = (
+        sa.Index('ix_stock_movement_hospital_id_blood_group', 'hospital_id', 'blood_group'),
+    )
+
+    def __repr__(self):
+        return '<StockMovement {} {:+d} {}>'.format(self.blood_group.value, self.quantity, self.reason.value)
+
+class BloodUnit(db.Model):
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    hospital_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(Hospital.id), nullable=False)
+    blood_group: so.Mapped[BloodGroupEnum] = so.mapped_column(sa.Enum(BloodGroupEnum), nullable=False)
+    status: so.Mapped[BloodUnitStatusEnum] = so.mapped_column(
+        sa.Enum(BloodUnitStatusEnum),
+        nullable=False,
+        default=BloodUnitStatusEnum.AVAILABLE
+    )
+    received_at: so.Mapped[datetime] = so.mapped_column(default=lambda: datetime.now(timezone.utc))
+    expires_at: so.Mapped[datetime] = so.mapped_column(nullable=False)
+    released_at: so.Mapped[Optional[datetime]] = so.mapped_column(nullable=True)
+    hospital: so.Mapped[Hospital] = so.relationship(back_populates='units')
+
+    __table_args__ = (
+        sa.Index('ix_blood_unit_hospital_id_blood_group_expires_at', 'hospital_id', 'blood_group', 'expires_at'),
+        sa.Index('ix_blood_unit_status_expires_at', 'status', 'expires_at'),
+    )
+
+    def __repr__(self):
+        return '<BloodUnit {} {} expires {}>'.format(self.id, self.blood_group.value, self.expires_at)
+
+class BloodStock(db.Model):
+    hospital_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(Hospital.id), primary_key=True)
+    blood_group: so.Mapped[BloodGroupEnum] = so.mapped_column(sa.Enum(BloodGroupEnum), primary_key=True)
+    quantity: so.Mapped[int] = so.mapped_column(nullable=False, default=0)
+    hospital: so.Mapped[Hospital] = so.relationship(back_populates='stock')
+
+    def __repr__(self):
+        return '<BloodStock {} of {}>'.format(self.quantity, self.blood_group.value)
+
+class EmergencyRequest(db.Model):
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    hospital_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(Hospital.id), index=True, nullable=False)
+    blood_group: so.Mapped[BloodGroupEnum] = so.mapped_column(sa.Enum(BloodGroupEnum), nullable=False)
+    quantity: so.Mapped[int] = so.mapped_column(nullable=False)
+    message: so.Mapped[Optional[str]] = so.mapped_column(sa.String(512), nullable=True)
+    recipients: so.Mapped[int] = so.mapped_column(nullable=False, default=0)
+    created_at: so.Mapped[datetime] = so.mapped_column(default=lambda: datetime.now(timezone.utc))
+    # Set once the recipients are queued; NULL while that is still to do.
+    fanned_out_at: so.Mapped[Optional[datetime]] = so.mapped_column(nullable=True)
+    hospital: so.Mapped[Hospital] = so.relationship(back_populates='emergencies')
+    notifications: so.WriteOnlyMapped['EmergencyNotification'] = so.relationship(back_populates='request')
+
+    def __repr__(self):
+        return '<EmergencyRequest {} for {}>'.format(self.id, self.blood_group.value)
+
+class EmergencyNotification(db.Model):
+    id: so.Mapped[int] = so.mapped_column(primary_key=True)
+    request_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(EmergencyRequest.id), nullable=False)
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey(User.id), nullable=False)
+    status: so.Mapped[NotificationStatusEnum] = so.mapped_column(
+        sa.Enum(NotificationStatusEnum),
+        nullable=False,
+        default=NotificationStatusEnum.PENDING
+    )
+    attempts: so.Mapped[int] = so.mapped_column(nullable=False, default=0, server_default='0')
+    created_at: so.Mapped[datetime] = so.mapped_column(nullable=False)
+    claimed_at: so.Mapped[Optional[datetime]] = so.mapped_column(nullable=True)
+    next_attempt_at: so.Mapped[Optional[datetime]] = so.mapped_column(nullable=True)
+    sent_at: so.Mapped[Optional[datetime]] = so.mapped_column(nullable=True)
+    error: so.Mapped[Optional[str]] = so.mapped_column(sa.String(256), nullable=True)
+    request: so.Mapped[EmergencyRequest] = so.relationship(back_populates='notifications')
+
+    __table_args__ = (
+        # One notification per donor per request, whoever fans out.
+        sa.UniqueConstraint('request_id', 'user_id', name='uq_emergency_notification_request_id_user_id'),
+        sa.Index('ix_emergency_notification_status_id', 'status', 'id'),
+        sa.Index('ix_emergency_notification_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+    def __repr__(self):
+        return '<EmergencyNotification {} to User {}>'.format(self.id, self.user_id)
+
+class ZipCode(db.Model):
+    zip_code: so.Mapped[str] = so.mapped_column(sa.String(10), primary_key=True)
+    latitude: so.Mapped[float] = so.mapped_column(sa.Float(), nullable=False)
+    longitude: so.Mapped[float] = so.mapped_column(sa.Float(), nullable=False)
+    geohash: so.Mapped[str] = so.mapped_column(sa.String(geo.GEOHASH_PRECISION), nullable=False)
+
+    def __repr__(self):
+        return '<ZipCode {} ({}, {})>'.format(self.zip_code, self.latitude, self.longitude)
+
 @login.user_loader
 def load_user(id):
-    return db.session.get(User, int(id))
\ No newline at end of file
+    user = user_cache.get(db.session, int(id))
+    if user is None:
+        user = db.session.get(User, int(id), options=[so.joinedload(User.profile)])
+        if user is not None:
+            user_cache.put(user)
+    return user
+
+@sa.event.listens_for(so.Session, 'before_flush')
+def _locate_addresses(session, flush_context, instances):
+    for obj in (*session.new, *session.dirty):
+        if isinstance(obj, (Hospital, Profile)):
+            if obj in session.new or sa.inspect(obj).attrs.zip_code.history.has_changes():
+                obj.latitude, obj.longitude, obj.geohash = geo.locate(session, obj.zip_code)
+
+@sa.event.listens_for(so.Session, 'after_flush')
+def _collect_user_changes(session, flush_context):
+    changed = session.info.setdefault('changed_user_ids', set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+        elif isinstance(obj, Profile):
+            changed.add(obj.user_id)
+
+@sa.event.listens_for(so.Session, 'after_flush')
+def _collect_fragment_changes(session, flush_context):
+    changed = session.info.setdefault('changed_fragment_tags', set())
+    for obj in (*session.dirty, *session.deleted):
+        if isinstance(obj, Hospital):
+            changed.add(fragments.tag(obj))
+
+@sa.event.listens_for(so.Session, 'after_commit')
+def _invalidate_cached_users(session):
+    for user_id in session.info.pop('changed_user_ids', ()):
+        user_cache.invalidate(user_id)
+
+@sa.event.listens_for(so.Session, 'after_commit')
+def _invalidate_cached_fragments(session):
+    for tag in session.info.pop('changed_fragment_tags', ()):
+        fragments.invalidate(tag)
+
+@sa.event.listens_for(so.Session, 'after_soft_rollback')
+def _forget_user_changes(session, previous_transaction):
+    session.info.pop('changed_user_ids', None)
+    session.info.pop('changed_fragment_tags', None)
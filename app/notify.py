@@ -0,0 +1,246 @@
+import os
+import socket
+import asyncio
+import logging
+import threading
+from email.message import EmailMessage
+from email.policy import SMTP
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class SMTPReplyError(Exception):
+    def __init__(self, code, message):
+        super().__init__('{} {}'.format(code, message))
+        self.code = code
+
+
+async def _reply(reader):
+    lines = []
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError('SMTP server closed the connection')
+        lines.append(line[4:].decode('utf-8', 'replace').rstrip())
+        if line[3:4] != b'-':
+            return int(line[:3]), ' '.join(lines)
+
+
+async def _command(reader, writer, line, expected):
+    if line is not None:
+        writer.write(line.encode('utf-8') + b'\r\n')
+        await writer.drain()
+    code, message = await _reply(reader)
+    if code != expected:
+        raise SMTPReplyError(code, message)
+    return message
+
+
+def _dot_stuffed(data):
+    data = data.replace(b'\r\n.', b'\r\n..')
+    if data.startswith(b'.'):
+        data = b'.' + data
+    if not data.endswith(b'\r\n'):
+        data += b'\r\n'
+    return data + b'.\r\n'
+
+
+def build_message(sender, subject, body):
+    # Everything but the To header, which addressed() prepends per
+    # recipient: a broadcast renders the message once, not once per donor.
+    message = EmailMessage(policy=SMTP)
+    message['From'] = sender
+    message['Subject'] = subject
+    message.set_content(body)
+    return message.as_bytes()
+
+
+def addressed(to, message):
+    return b'To: ' + to.encode('utf-8') + b'\r\n' + message
+
+
+class Notifier:
+    # Sends mail through an SMTP gateway from an asyncio loop. Messages are
+    # split into batches, each batch goes over one SMTP session, and at most
+    # NOTIFY_CONCURRENCY sessions are open at once. Work that should not
+    # hold up a request is handed to submit(), which runs it on a
+    # background thread in an app context.
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.host = app.config['NOTIFY_SMTP_HOST']
+        self.port = app.config['NOTIFY_SMTP_PORT']
+        self.sender = app.config['NOTIFY_SENDER']
+        self.concurrency = app.config['NOTIFY_CONCURRENCY']
+        self.batch_size = app.config['NOTIFY_BATCH_SIZE']
+        self.timeout = app.config['NOTIFY_TIMEOUT']
+
+    def _get_executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(1, thread_name_prefix='notifier')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, fn, *args):
+        def run():
+            with self.app.app_context():
+                try:
+                    return fn(*args)
+                except Exception:
+                    logger.exception('Background notification job failed')
+                    raise
+        return self._get_executor().submit(run)
+
+    async def _session(self, batch):
+        # Returns [(key, error or None), ...]. A failed recipient is reset
+        # and the session carries on; a broken connection fails the rest.
+        results = []
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        try:
+            await asyncio.wait_for(_command(reader, writer, None, 220), self.timeout)
+            await asyncio.wait_for(_command(reader, writer, 'EHLO ' + socket.gethostname(), 250), self.timeout)
+            for key, to, data in batch:
+                try:
+                    await asyncio.wait_for(self._send(reader, writer, to, data), self.timeout)
+                    results.append((key, None))
+                except SMTPReplyError as e:
+                    results.append((key, str(e)))
+                    await asyncio.wait_for(_command(reader, writer, 'RSET', 250), self.timeout)
+            try:
+                await asyncio.wait_for(_command(reader, writer, 'QUIT', 221), self.timeout)
+            except (OSError, asyncio.TimeoutError, SMTPReplyError):
+                pass
+        except (OSError, asyncio.TimeoutError, SMTPReplyError) as e:
+            done = {key for key, _ in results}
+            results.extend((key, str(e) or type(e).__name__) for key, _, _ in batch if key not in done)
+        finally:
+            writer.close()
+        return results
+
+    async def _send(self, reader, writer, to, data):
+        await _command(reader, writer, 'MAIL FROM:<{}>'.format(self.sender), 250)
+        await _command(reader, writer, 'RCPT TO:<{}>'.format(to), 250)
+        await _command(reader, writer, 'DATA', 354)
+        writer.write(_dot_stuffed(data))
+        await writer.drain()
+        await _command(reader, writer, None, 250)
+
+    async def _send_all(self, messages, on_batch):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        loop = asyncio.get_running_loop()
+
+        async def run(batch):
+            async with semaphore:
+                started = loop.time()
+                try:
+                    results = await self._session(batch)
+                except (OSError, asyncio.TimeoutError) as e:
+                    results = [(key, str(e) or type(e).__name__) for key, _, _ in batch]
+                if on_batch is not None:
+                    on_batch(results, loop.time() - started)
+                return results
+
+        batches = [messages[i:i + self.batch_size] for i in range(0, len(messages), self.batch_size)]
+        return [result for results in await asyncio.gather(*map(run, batches)) for result in results]
+
+    def send(self, messages, on_batch=None):
+        # messages: [(key, to, data bytes), ...]. Blocks until every message
+        # has been accepted or refused; returns [(key, error or None), ...].
+        if not messages:
+            return []
+        return asyncio.run(self._send_all(messages, on_batch))
+
+
+class StubSMTPServer:
+    # Accepts and counts mail without delivering it, for development and
+    # benchmarks: `flask emergency stub-smtp`.
+    def __init__(self, host='127.0.0.1', port=8025, delay=0.0):
+        self.host = host
+        self.port = port
+        self.delay = delay
+        self.received = []
+        self._server = None
+        self._loop = None
+
+    async def _handle(self, reader, writer):
+        writer.write(b'220 stub ESMTP\r\n')
+        recipients, in_data, data = [], False, []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if in_data:
+                    if line == b'.\r\n':
+                        in_data = False
+                        if self.delay:
+                            await asyncio.sleep(self.delay)
+                        self.received.append((recipients, b''.join(data)))
+                        recipients, data = [], []
+                        writer.write(b'250 OK queued\r\n')
+                    else:
+                        data.append(line[1:] if line.startswith(b'..') else line)
+                    continue
+                verb = line[:4].upper()
+                if verb in (b'EHLO', b'HELO'):
+                    writer.write(b'250-stub\r\n250 8BITMIME\r\n')
+                elif verb == b'RCPT':
+                    recipients.append(line[8:].strip().strip(b'<>').decode())
+                    writer.write(b'250 OK\r\n')
+                elif verb == b'DATA':
+                    in_data = True
+                    writer.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+                elif verb == b'QUIT':
+                    writer.write(b'221 Bye\r\n')
+                    await writer.drain()
+                    break
+                elif verb == b'RSET':
+                    recipients, data = [], []
+                    writer.write(b'250 OK\r\n')
+                else:
+                    writer.write(b'250 OK\r\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start(self):
+        # Serves from a daemon thread; returns once the port is bound.
+        ready = threading.Event()
+
+        def run():
+            async def main():
+                task = asyncio.ensure_future(self.serve())
+                while self._server is None:
+                    await asyncio.sleep(0.01)
+                ready.set()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+            asyncio.run(main())
+
+        threading.Thread(target=run, name='stub-smtp', daemon=True).start()
+        ready.wait(5)
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
@@ -0,0 +1,92 @@
+import json
+import base64
+import sqlalchemy as sa
+from datetime import datetime
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(values):
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def _decode_value(column, value):
+    # Raises ValueError unless value can be compared with column. Keyset
+    # columns are never NULL, and NULL does not compare with anything.
+    if value is None:
+        raise ValueError(value)
+    if isinstance(column.type, sa.DateTime):
+        try:
+            return datetime.fromisoformat(value)
+        except TypeError:
+            raise ValueError(value)
+    if isinstance(column.type, sa.Integer):
+        valid = isinstance(value, int) and not isinstance(value, bool)
+    elif isinstance(column.type, (sa.Float, sa.Numeric)):
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    elif isinstance(column.type, sa.String):
+        valid = isinstance(value, str)
+    else:
+        valid = True
+    if not valid:
+        raise ValueError(value)
+    return value
+
+
+def decode_values(columns, values):
+    # The cursor values for columns, or None if they do not fit them.
+    if not isinstance(values, list) or len(values) != len(columns):
+        return None
+    try:
+        return [_decode_value(column, value) for column, value in zip(columns, values)]
+    except ValueError:
+        return None
+
+
+def decode_cursor(cursor, columns=None):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        return None
+    if not isinstance(values, list):
+        return None
+    if columns is None:
+        return values
+    return decode_values(columns, values)
+
+
+def paginate_keyset(session, stmt, columns, cursor=None, per_page=20, scalars=True):
+    # Seek past the last row of the previous page instead of using OFFSET, so
+    # every page costs one index range scan no matter how deep the client is.
+    if cursor:
+        values = decode_cursor(cursor, columns)
+        if values is not None:
+            if len(columns) == 1:
+                stmt = stmt.where(columns[0] > values[0])
+            else:
+                stmt = stmt.where(sa.tuple_(*columns) > sa.tuple_(*values))
+    stmt = stmt.add_columns(*columns).order_by(*columns).limit(per_page + 1)
+
+    rows = session.execute(stmt).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1][-len(columns):])
+    items = [row[0] if scalars else row[:-len(columns)] for row in rows]
+    return KeysetPage(items, next_cursor, per_page)
@@ -0,0 +1,90 @@
+import os
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+@lru_cache(maxsize=8)
+def _method_prefix(method):
+    # Werkzeug expands defaults ("scrypt" -> "scrypt:32768:8:1"), so hash a
+    # throwaway value once to learn what the configured method looks like.
+    return generate_password_hash('', method=method, salt_length=1).split('$', 1)[0]
+
+
+class PasswordHasher:
+    # Runs hashing and verification on a small dedicated pool. hashlib's
+    # scrypt and pbkdf2 release the GIL, so the pool caps how many cores
+    # login storms can burn, and callers beyond the queue limit are turned
+    # away instead of piling up behind the hashes.
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.salt_length = app.config['PASSWORD_SALT_LENGTH']
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(self.workers + app.config['PASSWORD_HASH_QUEUE_LIMIT'])
+
+    def _get_executor(self):
+        # Created on first use, and again after a fork, because worker
+        # threads do not survive into preforked server processes.
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hasher')
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _submit(self, fn, *args, **kwargs):
+        # The caller holds a slot; it is released when fn finishes.
+        try:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def _run(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy('Too many password operations in flight')
+        future = self._submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            # Drop it if it is still queued; a hash already running keeps
+            # its slot until it finishes.
+            future.cancel()
+            raise PasswordHasherBusy('Password operation timed out') from None
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, method=self.method, salt_length=self.salt_length)
+
+    def hash_many(self, passwords):
+        # For bulk imports: the same pool and slots, but waiting for a free
+        # slot instead of raising PasswordHasherBusy, so an import slows
+        # down under load rather than failing partway through a chunk.
+        futures = []
+        for password in passwords:
+            self._slots.acquire()
+            futures.append(self._submit(generate_password_hash, password, method=self.method,
+                                        salt_length=self.salt_length))
+        return [future.result() for future in futures]
+
+    def verify(self, pwhash, password):
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        return not pwhash or pwhash.split('$', 1)[0] != _method_prefix(self.method)
@@ -0,0 +1,62 @@
+import sqlalchemy as sa
+from flask import current_app, g, has_app_context, request
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryBudget:
+    # Counts the SQL statements each request executes and reports requests
+    # that go over their endpoint's budget, which is how an N+1 lazy load
+    # shows up. SQL_QUERY_BUDGET_ACTION picks what happens: 'raise' (the
+    # default under TESTING), 'log' (the default under DEBUG) or 'off'.
+    def __init__(self, app=None, db=None):
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        # On this app's engines rather than the Engine class, so building
+        # several apps in one process does not count a statement twice.
+        with app.app_context():
+            engines = db.engines
+        for engine in engines.values():
+            if not sa.event.contains(engine, 'before_cursor_execute', self._count):
+                sa.event.listen(engine, 'before_cursor_execute', self._count)
+        app.before_request(self._start)
+        app.after_request(self._check)
+
+    def action(self):
+        action = current_app.config['SQL_QUERY_BUDGET_ACTION']
+        if action is None:
+            if current_app.testing:
+                action = 'raise'
+            elif current_app.debug:
+                action = 'log'
+        return action if action in ('log', 'raise') else None
+
+    def budget(self, endpoint):
+        return current_app.config['SQL_QUERY_BUDGETS'].get(endpoint, current_app.config['SQL_QUERY_BUDGET'])
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany):
+        if has_app_context() and 'sql_queries' in g:
+            g.sql_queries += 1
+
+    def _start(self):
+        if self.action() is not None:
+            g.sql_queries = 0
+
+    def _check(self, response):
+        count = g.pop('sql_queries', None)
+        if count is None:
+            return response
+        response.headers['X-SQL-Queries'] = str(count)
+        budget = self.budget(request.endpoint)
+        if count > budget:
+            message = '{} {} ran {} SQL statements, budget for {} is {}'.format(
+                request.method, request.path, count, request.endpoint, budget
+            )
+            if self.action() == 'raise':
+                raise QueryBudgetExceeded(message)
+            current_app.logger.warning(message)
+        return response
@@ -1,79 +1,149 @@
-import os
+import hmac
+from datetime import datetime, time, timezone
 import sqlalchemy as sa
-from flask import request
+import sqlalchemy.orm as so
+from flask import Blueprint, current_app, request, jsonify, abort, make_response, stream_with_context
 from urllib.parse import urlsplit
-from werkzeug.utils import secure_filename
 from flask import render_template, flash, redirect, url_for
 from flask_login import current_user, login_user, logout_user, login_required
 
 from app import db
-from app import app
+from app import user_cache
+from app import images
+from app import media
+from app import identicons
+from app import metrics
+from app import notifier
+from app.identicons import DIGEST_PATTERN
 from app.models import (
     User, 
     Profile, 
-    Hospital
+    Hospital,
+    EmergencyRequest
 )
+from app import inventory
+from app import exporter
+from app import applications
+from app import geo
+from app import broadcast
+from app.enums import BloodGroupEnum, StockMovementReasonEnum, DonorApplicationStatusEnum
+from app.matching import find_donors, nearest_donors
+from app.pagination import KeysetPage, paginate_keyset
+from app.passwords import PasswordHasherBusy
 from app.forms import (
     RegistrationForm, 
     LoginForm, 
     ProfileForm, 
-    HospitalForm
+    HospitalForm,
+    StockMovementForm,
+    EmergencyRequestForm,
+    ApplicationReviewForm
 )
 
-@app.route('/')
-@app.route('/index')
+bp = Blueprint('main', __name__)
+
+def save_upload(file, folder):
+    path, filename, created = media.save(file, folder)
+    if created:
+        images.submit(filename, lambda: touch_hospitals(path))
+    return path
+
+def touch_hospitals(image):
+    # Cached hospital cards point at the original until the variants exist;
+    # a new updated_at makes them render again.
+    db.session.execute(
+        sa.update(Hospital).where(Hospital.image == image).values(updated_at=datetime.now(timezone.utc))
+    )
+    db.session.commit()
+
+@bp.route('/')
+@bp.route('/index')
 def index():
     return render_template("index.html", title="Home")
 
-@app.route("/register", methods=["GET", "POST"])
+@bp.route("/register", methods=["GET", "POST"])
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
         user = User(username=form.username.data, email=form.email.data, phone=form.phone.data)
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except PasswordHasherBusy:
+            flash("The server is busy, please try again in a moment")
+            return render_template("register.html", title="Register", form=form), 503
         db.session.add(user)
-        db.session.commit()
-        flash("Congratulations, you are now a registered user!")
-        return redirect(url_for("index"))
+        try:
+            db.session.commit()
+        except sa.exc.IntegrityError as e:
+            db.session.rollback()
+            if not form.map_integrity_error(e):
+                raise
+        else:
+            flash("Congratulations, you are now a registered user!")
+            return redirect(url_for("main.index"))
     return render_template("register.html", title="Register", form=form)
 
-@app.route("/login", methods=["GET", "POST"])
+@bp.route("/login", methods=["GET", "POST"])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for("index"))
+        return redirect(url_for("main.index"))
     form = LoginForm()
     if form.validate_on_submit():
         user = db.session.scalar(
             sa.select(User).where(User.username == form.username.data)
         )
-        if user is None or not user.check_password(form.password.data):
-            flash("Invalid username or password")
-            return redirect(url_for("login"))
+        try:
+            if user is None or not user.check_password(form.password.data):
+                flash("Invalid username or password")
+                return redirect(url_for("main.login"))
+            if user.password_needs_rehash():
+                user.set_password(form.password.data)
+                db.session.commit()
+        except PasswordHasherBusy:
+            flash("The server is busy, please try again in a moment")
+            return render_template("login.html", title="Sign In", form=form), 503
         login_user(user, remember=form.remember_me.data)
         next_page = request.args.get("next")
         if not next_page or urlsplit(next_page).netloc != '':
-            next_page = url_for("index")
+            next_page = url_for("main.index")
         return redirect(next_page)
     return render_template("login.html", title="Sign In", form=form)
 
-@app.route("/logout")
+@bp.route("/logout")
 def logout():
     logout_user()
-    return redirect(url_for("index"))
+    return redirect(url_for("main.index"))
 
-@app.route("/user/<username>")
+@bp.route("/user/<username>")
 def user(username):
-    user = db.first_or_404(sa.select(User).where(User.username == username))
+    user = db.first_or_404(
+        sa.select(User).where(User.username == username).options(so.joinedload(User.profile))
+    )
     return render_template("user.html", user=user)
 
-@app.route("/user/<username>/edit", methods=["GET", "POST"])
+@bp.route("/identicon/<digest>/<int:size>.png")
+def identicon(digest, size):
+    # The image is a pure function of the URL, so it can be cached forever.
+    if size not in identicons.sizes or not DIGEST_PATTERN.match(digest):
+        abort(404)
+    response = make_response(identicons.render(digest, size))
+    response.mimetype = 'image/png'
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['ASSET_MAX_AGE']
+    response.cache_control.immutable = True
+    response.set_etag('{}-{}'.format(digest, size))
+    return response.make_conditional(request)
+
+@bp.route("/user/<username>/edit", methods=["GET", "POST"])
 @login_required
 def profile(username):
-    user = db.first_or_404(sa.select(User).where(User.username == username))
+    user = db.first_or_404(
+        sa.select(User).where(User.username == username).options(so.joinedload(User.profile))
+    )
 
     if current_user.is_anonymous or user != current_user and not current_user.is_admin:
         flash('You do not have permission to edit this profile.', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
 
     form = ProfileForm()
 
@@ -89,11 +159,7 @@ def profile(username):
 
     if form.validate_on_submit():
         if form.avatar.data:
-            file = form.avatar.data
-            filename = secure_filename(file.filename)
-            file.save(os.path.join(app.config['AVATAR_UPLOAD_FOLDER'], filename))
-            
-            user.avatar = os.path.join('images', 'avatars', filename)
+            user.avatar = save_upload(form.avatar.data, current_app.config['AVATAR_UPLOAD_FOLDER'])
         user.phone = form.phone.data
         
         if user.profile:
@@ -117,22 +183,61 @@ def profile(username):
 
         db.session.commit()
         flash('Your profile has been updated!', 'success')
-        return redirect(url_for('user', username=user.username))
+        return redirect(url_for('main.user', username=user.username))
 
     return render_template('profile.html', form=form, user=user)
 
-@app.route("/hospitals", methods=["GET", "POST"])
+@bp.route("/hospitals", methods=["GET", "POST"])
 @login_required
 def hospitals():
-    hospitals = db.session.scalars(db.select(Hospital)).all()
-    return render_template("hospitals.html", hospitals=hospitals)
+    filters = {}
+    query = sa.select(Hospital)
+    for field in ('state', 'city_or_town', 'zip_code'):
+        value = request.args.get(field, '').strip()
+        if value:
+            filters[field] = value
+            query = query.where(getattr(Hospital, field) == value)
 
-@app.route("/hospitals/add", methods=["GET", "POST"])
+    page = paginate_keyset(
+        db.session,
+        query,
+        [Hospital.name],
+        cursor=request.args.get('cursor'),
+        per_page=current_app.config['HOSPITALS_PER_PAGE']
+    )
+    next_url = url_for('main.hospitals', cursor=page.next_cursor, **filters) if page.has_next else None
+    return render_template("hospitals.html", hospitals=page.items, filters=filters, next_url=next_url,
+                           blood_groups=BloodGroupEnum)
+
+@bp.route("/hospitals/search")
+@login_required
+def search_hospitals():
+    q = request.args.get('q', '').strip()
+    hospitals = Hospital.search(q, limit=current_app.config['HOSPITAL_SEARCH_LIMIT'])
+    return render_template("hospitals.html", hospitals=hospitals, filters={}, q=q, next_url=None,
+                           blood_groups=BloodGroupEnum)
+
+@bp.route("/hospitals/nearest")
+@login_required
+def nearest_hospitals():
+    near = {field: request.args.get(field, '').strip() for field in ('zip_code', 'blood_group')}
+    latitude, longitude, _ = geo.locate(db.session, near['zip_code'])
+    if latitude is None:
+        flash('Unknown zip code {}'.format(near['zip_code']), 'danger')
+        return redirect(url_for('main.hospitals'))
+    blood_group = near['blood_group'] if near['blood_group'] in BloodGroupEnum._value2member_map_ else None
+    found = inventory.nearest_hospitals(latitude, longitude, blood_group=blood_group,
+                                        limit=current_app.config['NEAREST_LIMIT'])
+    return render_template("hospitals.html", hospitals=[hospital for hospital, _ in found], filters={},
+                           near=near, distances={hospital.id: km for hospital, km in found},
+                           next_url=None, blood_groups=BloodGroupEnum)
+
+@bp.route("/hospitals/add", methods=["GET", "POST"])
 @login_required
 def create_hospital():
     if current_user.is_anonymous or not current_user.is_admin:
         flash('You do not have permission to create hospital record', 'danger')
-        return redirect(url_for('index'))
+        return redirect(url_for('main.index'))
     
     form = HospitalForm()
     if form.validate_on_submit():
@@ -147,27 +252,27 @@ def create_hospital():
             email=form.email.data
         )
         if form.image.data:
-            file = form.image.data
-            filename = secure_filename(file.filename)
-            file.save(os.path.join(app.config['IMAGE_UPLOAD_FOLDER'], filename))
-            
-            hospital.image = os.path.join('images', 'hospitals', filename)
+            hospital.image = save_upload(form.image.data, current_app.config['IMAGE_UPLOAD_FOLDER'])
         db.session.add(hospital)
-        db.session.commit()
-        flash('Hospital added successfully', 'success')
-        return redirect(url_for('hospital_details', hrn=hospital.hrn))
-    else:
-        print(form.errors)
+        try:
+            db.session.commit()
+        except sa.exc.IntegrityError as e:
+            db.session.rollback()
+            if not form.map_integrity_error(e):
+                raise
+        else:
+            flash('Hospital added successfully', 'success')
+            return redirect(url_for('main.hospital_details', hrn=hospital.hrn))
     return render_template("hospital_form.html", form=form, hospital=None)
 
-@app.route("/hospitals/<hrn>/edit", methods=["GET", "POST"])
+@bp.route("/hospitals/<hrn>/edit", methods=["GET", "POST"])
 @login_required
 def edit_hospital(hrn):
     hospital = db.first_or_404(sa.select(Hospital).where(Hospital.hrn == hrn))
 
     if not current_user.is_admin:
         flash('You do not have permission to edit this profile.', 'danger')
-        return redirect(url_for('hospitals'))
+        return redirect(url_for('main.hospitals'))
     
     form = HospitalForm()
 
@@ -194,19 +299,204 @@ def edit_hospital(hrn):
 
         # Only update the image if a new one is uploaded
         if form.image.data:
-            file = form.image.data
-            filename = secure_filename(file.filename)
-            file.save(os.path.join(app.config['IMAGE_UPLOAD_FOLDER'], filename))
-            hospital.image = os.path.join('images', 'hospitals', filename)
+            hospital.image = save_upload(form.image.data, current_app.config['IMAGE_UPLOAD_FOLDER'])
 
-        db.session.commit()
-        flash('Hospital details have been updated!', 'success')
-        return redirect(url_for('hospital_details', hrn=hospital.hrn))
+        try:
+            db.session.commit()
+        except sa.exc.IntegrityError as e:
+            db.session.rollback()
+            if not form.map_integrity_error(e):
+                raise
+        else:
+            flash('Hospital details have been updated!', 'success')
+            return redirect(url_for('main.hospital_details', hrn=hospital.hrn))
     
     return render_template("hospital_form.html", form=form, hospital=hospital)
 
-@app.route("/hospitals/<hrn>/")
+@bp.route("/hospitals/<hrn>/")
 @login_required
 def hospital_details(hrn):
     hospital = db.first_or_404(sa.select(Hospital).where(Hospital.hrn == hrn))
-    return render_template("hospital.html", hospital=hospital)
\ No newline at end of file
+    stock = inventory.current_stock(hospital)
+    form = StockMovementForm() if current_user.is_admin else None
+    emergency_form = EmergencyRequestForm() if current_user.is_admin else None
+    return render_template("hospital.html", hospital=hospital, stock=stock, form=form,
+                           emergency_form=emergency_form)
+
+@bp.route("/hospitals/<hrn>/stock", methods=["POST"])
+@login_required
+def record_stock(hrn):
+    hospital = db.first_or_404(sa.select(Hospital).where(Hospital.hrn == hrn))
+
+    if not current_user.is_admin:
+        flash('You do not have permission to update stock.', 'danger')
+        return redirect(url_for('main.hospital_details', hrn=hospital.hrn))
+
+    form = StockMovementForm()
+    if form.validate_on_submit():
+        blood_group = BloodGroupEnum[form.blood_group.data]
+        reason = StockMovementReasonEnum[form.reason.data]
+        try:
+            if reason == StockMovementReasonEnum.RECEIVED:
+                expires_at = datetime.combine(form.expires_at.data, time.max)
+                inventory.receive(hospital, blood_group, form.quantity.data, expires_at)
+            else:
+                inventory.allocate(hospital, blood_group, form.quantity.data, reason=reason)
+            db.session.commit()
+            flash('Stock updated.', 'success')
+        except inventory.InsufficientStockError as e:
+            db.session.rollback()
+            flash(str(e), 'danger')
+    else:
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, 'danger')
+    return redirect(url_for('main.hospital_details', hrn=hospital.hrn))
+
+@bp.route("/hospitals/<hrn>/emergency", methods=["POST"])
+@login_required
+def create_emergency(hrn):
+    hospital = db.first_or_404(sa.select(Hospital).where(Hospital.hrn == hrn))
+
+    if not current_user.is_admin:
+        flash('You do not have permission to broadcast emergencies.', 'danger')
+        return redirect(url_for('main.hospital_details', hrn=hospital.hrn))
+
+    form = EmergencyRequestForm()
+    if not form.validate_on_submit():
+        for errors in form.errors.values():
+            for error in errors:
+                flash(error, 'danger')
+        return redirect(url_for('main.hospital_details', hrn=hospital.hrn))
+
+    # Only the request is stored here; finding the recipients and sending
+    # happen on the notifier thread (or `flask emergency send`), so the
+    # request returns at once however many donors there are.
+    emergency = broadcast.create_emergency(
+        hospital, BloodGroupEnum[form.blood_group.data], form.quantity.data, form.message.data or None
+    )
+    db.session.commit()
+    notifier.submit(broadcast.broadcast, emergency.id)
+    flash('Notifying compatible donors near {}.'.format(hospital.name), 'success')
+    return redirect(url_for('main.emergency', id=emergency.id))
+
+@bp.route("/emergencies/<int:id>")
+@login_required
+def emergency(id):
+    if not current_user.is_admin:
+        flash('You do not have permission to view emergencies.', 'danger')
+        return redirect(url_for('main.index'))
+    emergency = db.get_or_404(EmergencyRequest, id, options=[so.joinedload(EmergencyRequest.hospital)])
+    return render_template("emergency.html", title="Emergency", emergency=emergency,
+                           status=broadcast.delivery_status(emergency))
+
+@bp.route("/donors")
+@login_required
+def donors():
+    if not current_user.is_admin:
+        flash('You do not have permission to search donors.', 'danger')
+        return redirect(url_for('main.index'))
+
+    filters = {}
+    for field in ('blood_group', 'state', 'zip_code'):
+        value = request.args.get(field, '').strip()
+        if value:
+            filters[field] = value
+
+    page = None
+    next_url = None
+    distances = None
+    if filters.get('blood_group') in BloodGroupEnum._value2member_map_:
+        latitude, longitude, _ = geo.locate(db.session, filters.get('zip_code'))
+        if request.args.get('nearest') and latitude is not None:
+            filters['nearest'] = '1'
+            found = nearest_donors(filters['blood_group'], latitude, longitude,
+                                   limit=current_app.config['DONORS_PER_PAGE'])
+            page = KeysetPage([profile for profile, _ in found], None, current_app.config['DONORS_PER_PAGE'])
+            distances = {profile.id: km for profile, km in found}
+        else:
+            page = find_donors(
+                filters['blood_group'],
+                state=filters.get('state'),
+                zip_code=filters.get('zip_code'),
+                cursor=request.args.get('cursor'),
+                per_page=current_app.config['DONORS_PER_PAGE']
+            )
+            if page.has_next:
+                next_url = url_for('main.donors', cursor=page.next_cursor, **filters)
+    return render_template("donors.html", title="Donors", page=page, filters=filters,
+                           blood_groups=BloodGroupEnum, next_url=next_url, distances=distances)
+
+@bp.route("/admin/applications", methods=["GET", "POST"])
+@login_required
+def application_queue():
+    if not current_user.is_admin:
+        flash('You do not have permission to review applications.', 'danger')
+        return redirect(url_for('main.index'))
+
+    status = request.args.get('status', DonorApplicationStatusEnum.PENDING.name)
+    if status not in DonorApplicationStatusEnum.__members__:
+        abort(404)
+    status = DonorApplicationStatusEnum[status]
+
+    form = ApplicationReviewForm()
+    if form.validate_on_submit():
+        ids = [int(value) for value in request.form.getlist('ids') if value.isdigit()]
+        decision = DonorApplicationStatusEnum.APPROVED if form.approve.data else DonorApplicationStatusEnum.REJECTED
+        from_status = status if status in applications.REVIEWABLE_STATUSES else DonorApplicationStatusEnum.PENDING
+        changed = applications.review_applications(ids, decision, from_status=from_status)
+        db.session.commit()
+        flash('{} of {} applications {}.'.format(changed, len(ids), decision.value.lower()))
+        return redirect(url_for('main.application_queue', status=status.name, cursor=request.args.get('cursor')))
+
+    page = applications.application_queue(
+        status, cursor=request.args.get('cursor'), per_page=current_app.config['APPLICATIONS_PER_PAGE']
+    )
+    next_url = url_for('main.application_queue', status=status.name, cursor=page.next_cursor) if page.has_next else None
+    return render_template("applications.html", title="Applications", page=page, form=form, status=status,
+                           statuses=DonorApplicationStatusEnum, next_url=next_url,
+                           reviewable=status in applications.REVIEWABLE_STATUSES)
+
+@bp.route("/admin/export/<kind>.<fmt>")
+@login_required
+def export(kind, fmt):
+    if not current_user.is_admin:
+        flash('You do not have permission to export data.', 'danger')
+        return redirect(url_for('main.index'))
+    if kind not in exporter.EXPORTS or fmt not in ('csv', 'jsonl'):
+        abort(404)
+    args = request.args.to_dict()
+    compress = args.pop('gzip', '') not in ('', '0')
+    try:
+        filters = exporter.parse_filters(kind, args)
+    except exporter.ExportError as e:
+        return jsonify(error=str(e)), 400
+
+    chunks = exporter.iter_export(kind, filters, fmt)
+    filename = '{}.{}'.format(kind, fmt)
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if compress:
+        chunks = exporter.gzip_stream(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    response = current_app.response_class(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
+
+@bp.route("/admin/stats/user-cache")
+@login_required
+def user_cache_stats():
+    if not current_user.is_admin:
+        flash('You do not have permission to view cache statistics.', 'danger')
+        return redirect(url_for('main.index'))
+    return jsonify(user_cache.stats())
+
+@bp.route("/metrics")
+def metrics_export():
+    if not metrics.token:
+        abort(404)
+    # Bytes, as compare_digest() raises TypeError on non-ASCII str.
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                               ('Bearer ' + metrics.token).encode()):
+        abort(401)
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,114 @@
+import re
+import sqlalchemy as sa
+
+SEARCH_COLUMNS = ('name', 'address', 'city_or_town', 'state')
+
+SQLITE_FTS_TABLE = 'hospital_fts'
+SQLITE_CREATE_FTS = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+    "{columns}, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+).format(table=SQLITE_FTS_TABLE, columns=', '.join(SEARCH_COLUMNS))
+SQLITE_DROP_FTS = "DROP TABLE IF EXISTS {}".format(SQLITE_FTS_TABLE)
+SQLITE_INSERT_FTS = "INSERT INTO {table} (rowid, {columns}) VALUES (:id, {values})".format(
+    table=SQLITE_FTS_TABLE, columns=', '.join(SEARCH_COLUMNS), values=', '.join(':' + c for c in SEARCH_COLUMNS)
+)
+SQLITE_REBUILD_FTS = "INSERT INTO {table} (rowid, {columns}) SELECT id, {columns} FROM hospital".format(
+    table=SQLITE_FTS_TABLE, columns=', '.join(SEARCH_COLUMNS)
+)
+
+# The query has to repeat this expression verbatim for Postgres to pick the
+# GIN index, so both are built from the same string.
+PG_DOCUMENT = "to_tsvector('simple', {})".format(" || ' ' || ".join(SEARCH_COLUMNS))
+PG_CREATE_INDEX = "CREATE INDEX IF NOT EXISTS ix_hospital_search ON hospital USING GIN ({})".format(PG_DOCUMENT)
+PG_DROP_INDEX = "DROP INDEX IF EXISTS ix_hospital_search"
+
+
+def search_terms(q):
+    return re.findall(r'\w+', q or '')[:8]
+
+
+def _sqlite_match(terms):
+    return ' '.join('"{}"*'.format(term) for term in terms)
+
+
+def _pg_query(terms):
+    return ' & '.join('{}:*'.format(term) for term in terms)
+
+
+def search_hospitals(model, dialect, q, limit=50):
+    terms = search_terms(q)
+    if not terms:
+        return None
+
+    if dialect == 'sqlite':
+        fts = sa.table(SQLITE_FTS_TABLE, sa.column('rowid'))
+        return (
+            sa.select(model)
+            .join(fts, fts.c.rowid == model.id)
+            .where(sa.text("{} MATCH :match".format(SQLITE_FTS_TABLE)).bindparams(match=_sqlite_match(terms)))
+            .order_by(sa.text("{}.rank".format(SQLITE_FTS_TABLE)))
+            .limit(limit)
+        )
+
+    if dialect == 'postgresql':
+        query = "to_tsquery('simple', :tsquery)"
+        return (
+            sa.select(model)
+            .where(sa.text("{} @@ {}".format(PG_DOCUMENT, query)).bindparams(tsquery=_pg_query(terms)))
+            .order_by(sa.text("ts_rank({}, {}) DESC".format(PG_DOCUMENT, query)).bindparams(tsquery=_pg_query(terms)))
+            .limit(limit)
+        )
+
+    # No full-text index on other backends, fall back to substring matching.
+    stmt = sa.select(model)
+    for term in terms:
+        # \w keeps _, which LIKE would read as any character.
+        pattern = '%{}%'.format(term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+        stmt = stmt.where(sa.or_(*(getattr(model, column).ilike(pattern, escape='\\') for column in SEARCH_COLUMNS)))
+    return stmt.order_by(model.name).limit(limit)
+
+
+def index_rows(connection, rows):
+    # For bulk inserts that bypass the mapper events below. rows are dicts
+    # holding the new id and the search columns.
+    if connection.dialect.name == 'sqlite' and rows:
+        connection.execute(sa.text(SQLITE_INSERT_FTS), [
+            dict(id=row['id'], **{column: row[column] for column in SEARCH_COLUMNS}) for row in rows
+        ])
+
+
+def _sync_insert(mapper, connection, target):
+    index_rows(connection, [dict(id=target.id, **{column: getattr(target, column) for column in SEARCH_COLUMNS})])
+
+
+def _sync_delete(mapper, connection, target):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(sa.text("DELETE FROM {} WHERE rowid = :id".format(SQLITE_FTS_TABLE)), dict(id=target.id))
+
+
+def _sync_update(mapper, connection, target):
+    state = sa.inspect(target)
+    if any(state.attrs[column].history.has_changes() for column in SEARCH_COLUMNS):
+        _sync_delete(mapper, connection, target)
+        _sync_insert(mapper, connection, target)
+
+
+def install(model):
+    # Postgres indexes the table directly, SQLite needs a shadow FTS5 table
+    # kept in step with every insert/update/delete in the same transaction.
+    table = model.__table__
+    sa.event.listen(table, 'after_create', sa.DDL(SQLITE_CREATE_FTS).execute_if(dialect='sqlite'))
+    sa.event.listen(table, 'after_create', sa.DDL(PG_CREATE_INDEX).execute_if(dialect='postgresql'))
+    sa.event.listen(table, 'before_drop', sa.DDL(SQLITE_DROP_FTS).execute_if(dialect='sqlite'))
+    sa.event.listen(model, 'after_insert', _sync_insert)
+    sa.event.listen(model, 'after_update', _sync_update)
+    sa.event.listen(model, 'after_delete', _sync_delete)
+
+
+def include_name(name, type_, parent_names):
+    # Keep autogenerate from trying to drop the full-text tables and index.
+    if type_ == 'table':
+        return not name.startswith(SQLITE_FTS_TABLE)
+    if type_ == 'index':
+        return name != 'ix_hospital_search'
+    return True
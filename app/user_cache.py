@@ -0,0 +1,58 @@
+import sqlalchemy as sa
+import sqlalchemy.orm as so
+
+from app.cache import LRUCache
+
+
+def _transient_copy(instance):
+    mapper = sa.inspect(instance).mapper
+    return mapper.class_(**{
+        attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs
+    })
+
+
+def _detached_copy(instance, relationships=()):
+    # A private copy that no session owns, so it can be shared between
+    # requests and threads without ever being expired or refreshed.
+    copy = _transient_copy(instance)
+    related = []
+    for name in relationships:
+        value = getattr(instance, name)
+        if value is not None:
+            value = _transient_copy(value)
+            related.append(value)
+        setattr(copy, name, value)
+    for obj in (copy, *related):
+        so.make_transient_to_detached(obj)
+    return copy
+
+
+class UserCache:
+    # Per-process identity cache for the Flask-Login user loader. Entries
+    # are detached snapshots of a user and their profile that are merged
+    # into each request's session with load=False, which costs no SQL.
+    # Local writes invalidate on commit. Other worker processes only see a
+    # change once USER_CACHE_TTL has expired the entry.
+    def __init__(self, app=None):
+        self.cache = LRUCache(0)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.cache = LRUCache(app.config['USER_CACHE_SIZE'], app.config['USER_CACHE_TTL'])
+        self.relationships = ('profile',)
+
+    def get(self, session, user_id):
+        snapshot = self.cache.get(user_id)
+        if snapshot is None:
+            return None
+        return session.merge(snapshot, load=False)
+
+    def put(self, user):
+        self.cache.set(user.id, _detached_copy(user, self.relationships))
+
+    def invalidate(self, user_id):
+        self.cache.delete(user_id)
+
+    def stats(self):
+        return self.cache.stats()
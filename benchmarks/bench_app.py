@@ -0,0 +1,220 @@
+"""End-to-end latency of the main pages through the Flask test client.
+
+    python benchmarks/bench_app.py --users 100000 --hospitals 10000 \
+        --applications 1000000 --threads 8 --requests 500 --output before.json
+
+Seeds a throwaway SQLite database with bulk inserts (reused on later runs
+with the same sizes), then drives each scenario from a thread pool and
+prints p50/p95/p99 latency, throughput and SQL statements per request as
+JSON. Run it on two commits with the same arguments and diff the output.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import statistics
+import subprocess
+import tempfile
+import threading
+from datetime import date, datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SCENARIOS = ['register', 'login', 'user', 'hospitals', 'hospital_details', 'edit_hospital']
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--users', type=int, default=100_000)
+parser.add_argument('--hospitals', type=int, default=10_000)
+parser.add_argument('--applications', type=int, default=1_000_000)
+parser.add_argument('--states', type=int, default=30)
+parser.add_argument('--threads', type=int, default=8)
+parser.add_argument('--requests', type=int, default=500, help='Requests per scenario.')
+parser.add_argument('--warmup', type=int, default=20)
+parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+parser.add_argument('--chunk', type=int, default=50_000)
+parser.add_argument('--seed', type=int, default=42)
+parser.add_argument('--output', help='Also write the JSON report to this file.')
+args = parser.parse_args()
+
+db_path = os.path.join(tempfile.gettempdir(), 'aayudhar-bench-app-{}-{}-{}.db'.format(
+    args.users, args.hospitals, args.applications
+))
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+# Count statements on every request without ever failing one.
+os.environ['SQL_QUERY_BUDGET_ACTION'] = 'log'
+os.environ['SQL_QUERY_BUDGET'] = str(10 ** 9)
+
+import sqlalchemy as sa
+from app import create_app, db, passwords
+from benchmarks.common import percentile
+from app.models import User, Profile, Hospital, DonorApplication
+from app.enums import BloodGroupEnum, GenderEnum, DonorApplicationStatusEnum
+
+app = create_app()
+app.config['WTF_CSRF_ENABLED'] = False
+PASSWORD = 'Bench-Passw0rd!'
+ADMIN = 'user1'
+
+
+def seed():
+    rng = random.Random(args.seed)
+    # Hashing once and sharing the hash keeps seeding fast while logins
+    # still pay the real cost of verifying it.
+    password_hash = passwords.hash(PASSWORD)
+    now = datetime.now(timezone.utc)
+    groups = [bg.name for bg in BloodGroupEnum]
+
+    for start in range(0, args.users, args.chunk):
+        ids = range(start + 1, min(start + args.chunk, args.users) + 1)
+        db.session.execute(sa.insert(User.__table__), [
+            dict(id=i, username='user{}'.format(i), email='user{}@example.com'.format(i),
+                 phone='{:010d}'.format(i), password_hash=password_hash, is_admin=i == 1)
+            for i in ids
+        ])
+        db.session.execute(sa.insert(Profile.__table__), [
+            dict(id=i, user_id=i, dob=date(1990, 1, 1), gender=GenderEnum.OTHER.name, address='Street {}'.format(i),
+                 state='State{}'.format(rng.randrange(args.states)), zip_code='{:06d}'.format(rng.randrange(100000)),
+                 blood_group=rng.choice(groups))
+            for i in ids
+        ])
+        db.session.commit()
+
+    for start in range(0, args.hospitals, args.chunk):
+        ids = range(start + 1, min(start + args.chunk, args.hospitals) + 1)
+        db.session.execute(sa.insert(Hospital.__table__), [
+            dict(id=i, name='Hospital {}'.format(i), hrn='HRN{}'.format(i), address='Road {}'.format(i),
+                 city_or_town='City{}'.format(i % 300), state='State{}'.format(i % args.states),
+                 zip_code='{:06d}'.format(i % 100000), phone='{:010d}'.format(8_000_000_000 + i),
+                 email='hospital{}@example.com'.format(i), updated_at=now)
+            for i in ids
+        ])
+        db.session.commit()
+
+    statuses = [status.name for status in DonorApplicationStatusEnum]
+    for start in range(0, args.applications, args.chunk):
+        ids = range(start + 1, min(start + args.chunk, args.applications) + 1)
+        db.session.execute(sa.insert(DonorApplication.__table__), [
+            dict(id=i, user_id=rng.randint(1, args.users), height=170.0, wight=70.0, habbits='-', uidn='0000',
+                 timestamp=now - timedelta(minutes=i), status=rng.choice(statuses))
+            for i in ids
+        ])
+        db.session.commit()
+
+
+def logged_in_client(username):
+    client = app.test_client()
+    response = client.post('/login', data={'username': username, 'password': PASSWORD})
+    assert response.status_code == 302, response.status_code
+    return client
+
+
+class Scenario:
+    # One request of each kind. Clients are kept per thread so sessions are
+    # not shared between concurrent requests.
+    def __init__(self, name):
+        self.name = name
+        self.rng = random.Random(args.seed)
+        self.counter = itertools.count(args.users + 1)
+        self.clients = {}
+
+    def client(self):
+        key = threading.get_ident()
+        if key not in self.clients:
+            self.clients[key] = logged_in_client(ADMIN)
+        return self.clients[key]
+
+    def __call__(self, _):
+        method = getattr(self, self.name)
+        started = time.perf_counter()
+        response = method()
+        elapsed = time.perf_counter() - started
+        queries = response.headers.get('X-SQL-Queries')
+        return elapsed, response.status_code, int(queries) if queries is not None else None
+
+    def register(self):
+        i = next(self.counter)
+        return app.test_client().post('/register', data={
+            'username': 'bench{}'.format(i), 'email': 'bench{}@example.com'.format(i),
+            'phone': '{:010d}'.format(9_000_000_000 + i), 'password': PASSWORD, 'password2': PASSWORD,
+        })
+
+    def login(self):
+        return app.test_client().post('/login', data={
+            'username': 'user{}'.format(self.rng.randint(1, args.users)), 'password': PASSWORD
+        })
+
+    def user(self):
+        return self.client().get('/user/user{}'.format(self.rng.randint(1, args.users)))
+
+    def hospitals(self):
+        if self.rng.random() < 0.5:
+            return self.client().get('/hospitals')
+        return self.client().get('/hospitals', query_string={'state': 'State{}'.format(self.rng.randrange(args.states))})
+
+    def hospital_details(self):
+        return self.client().get('/hospitals/HRN{}/'.format(self.rng.randint(1, args.hospitals)))
+
+    def edit_hospital(self):
+        i = self.rng.randint(1, args.hospitals)
+        return self.client().post('/hospitals/HRN{}/edit'.format(i), data={
+            'name': 'Hospital {}'.format(i), 'hrn': 'HRN{}'.format(i), 'current_hrn': 'HRN{}'.format(i),
+            'address': 'Road {} rev {}'.format(i, self.rng.randrange(1000)), 'city_or_town': 'City{}'.format(i % 300),
+            'state': 'State{}'.format(i % args.states), 'zip_code': '{:06d}'.format(i % 100000),
+            'phone': '{:010d}'.format(8_000_000_000 + i), 'email': 'hospital{}@example.com'.format(i),
+        })
+
+
+def run(name):
+    scenario = Scenario(name)
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(scenario, range(args.warmup)))
+        started = time.perf_counter()
+        results = list(pool.map(scenario, range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+    timings = [seconds * 1000 for seconds, _, _ in results]
+    queries = [count for _, _, count in results if count is not None]
+    return {
+        'requests': len(results),
+        'errors': sum(1 for _, status, _ in results if status >= 400),
+        'throughput_rps': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentile(timings, 50), 2),
+        'p95_ms': round(percentile(timings, 95), 2),
+        'p99_ms': round(percentile(timings, 99), 2),
+        'mean_ms': round(statistics.mean(timings), 2),
+        'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+with app.app_context():
+    seed_seconds = None
+    if not os.path.exists(db_path):
+        db.create_all()
+        started = time.perf_counter()
+        seed()
+        seed_seconds = round(time.perf_counter() - started, 1)
+
+report = {
+    'revision': git_revision(),
+    'database': app.config['SQLALCHEMY_DATABASE_URI'],
+    'seed_seconds': seed_seconds,
+    'options': {key: value for key, value in vars(args).items() if key != 'output'},
+    'scenarios': {name: run(name) for name in args.scenarios},
+}
+output = json.dumps(report, indent=2)
+print(output)
+if args.output:
+    with open(args.output, 'w') as f:
+        f.write(output + '\n')
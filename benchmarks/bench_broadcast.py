@@ -0,0 +1,135 @@
+"""Cost of an emergency broadcast: the POST, the fan-out and delivery.
+
+    python benchmarks/bench_broadcast.py --donors 50000 --delay 0.001
+
+Seeds a throwaway SQLite database (reused on later runs with the same
+size) with donors spread over --zip-codes zip codes within about 100 km
+of the hospital. Then times, separately, the admin's POST through the
+test client (which must not grow with the number of recipients), and
+the background job it submits: fan_out() queueing the recipients, and
+deliver() against a local stub SMTP server that waits --delay seconds
+per message.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--donors', type=int, default=50_000)
+parser.add_argument('--delay', type=float, default=0.0, help='Stub gateway latency per message.')
+parser.add_argument('--concurrency', type=int)
+parser.add_argument('--batch-size', type=int)
+parser.add_argument('--zip-codes', type=int, default=500)
+parser.add_argument('--chunk', type=int, default=50_000)
+args = parser.parse_args()
+
+db_path = os.path.join(tempfile.gettempdir(), 'aayudhar-bench-broadcast-v2-{}-{}.db'.format(args.donors, args.zip_codes))
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+import sqlalchemy as sa
+from app import create_app, db, notifier
+from app import broadcast
+from app import geo
+from app.notify import StubSMTPServer
+from app.models import User, Profile, Hospital, EmergencyRequest, EmergencyNotification, ZipCode
+from app.enums import BloodGroupEnum, GenderEnum
+
+app = create_app()
+app.config['WTF_CSRF_ENABLED'] = False
+
+STATE = 'Maharashtra'
+CENTRE = (19.0760, 72.8777)
+
+
+def seed():
+    rng = random.Random(42)
+    zip_codes = [
+        dict(zip_code='{:06d}'.format(400000 + i), latitude=CENTRE[0] + rng.uniform(-0.9, 0.9),
+             longitude=CENTRE[1] + rng.uniform(-0.9, 0.9))
+        for i in range(args.zip_codes)
+    ]
+    for row in zip_codes:
+        row['geohash'] = geo.encode(row['latitude'], row['longitude'])
+    db.session.execute(sa.insert(ZipCode.__table__), zip_codes)
+    for start in range(0, args.donors, args.chunk):
+        ids = range(start + 1, min(start + args.chunk, args.donors) + 1)
+        db.session.execute(sa.insert(User.__table__), [
+            dict(id=i, username='user{}'.format(i), email='user{}@example.com'.format(i),
+                 phone='{:010d}'.format(i), is_admin=False)
+            for i in ids
+        ])
+        db.session.execute(sa.insert(Profile.__table__), [
+            dict(id=i, user_id=i, dob=date(1990, 1, 1), gender=GenderEnum.OTHER.name, address='-',
+                 state=STATE, blood_group=rng.choice(list(BloodGroupEnum)).name, **rng.choice(zip_codes))
+            for i in ids
+        ])
+        db.session.commit()
+    db.session.execute(sa.insert(User.__table__), [
+        dict(id=args.donors + 1, username='admin', email='admin@example.com', phone='8000000000', is_admin=True)
+    ])
+    db.session.execute(sa.insert(Hospital.__table__), [
+        dict(id=1, name='Bench Hospital', hrn='HRN1', address='-', city_or_town='Mumbai', state=STATE,
+             zip_code='400001', phone='9000000000', email='hospital@example.com', updated_at=datetime(2026, 1, 1),
+             latitude=CENTRE[0], longitude=CENTRE[1], geohash=geo.encode(*CENTRE))
+    ])
+    db.session.commit()
+
+
+stub = StubSMTPServer(port=0, delay=args.delay).start()
+notifier.host, notifier.port = stub.host, stub.port
+if args.concurrency:
+    notifier.concurrency = args.concurrency
+if args.batch_size:
+    notifier.batch_size = args.batch_size
+
+with app.app_context():
+    if not os.path.exists(db_path):
+        db.create_all()
+        seed()
+    # Start from a clean slate so the cooldown does not filter everyone out.
+    db.session.execute(sa.delete(EmergencyNotification))
+    db.session.execute(sa.text('DELETE FROM emergency_request'))
+    db.session.commit()
+
+    admin_id = db.session.scalar(sa.select(User.id).where(User.username == 'admin'))
+    db.session.remove()
+
+# The route hands its job to notifier.submit(); keep it to run and time
+# after the response instead.
+jobs = []
+notifier.submit = lambda fn, *job_args: jobs.append((fn, job_args))
+client = app.test_client()
+with client.session_transaction() as session:
+    session['_user_id'] = str(admin_id)
+    session['_fresh'] = True
+started = time.perf_counter()
+response = client.post('/hospitals/HRN1/emergency', data={'blood_group': 'AB_POSITIVE', 'quantity': 2,
+                                                          'message': 'Benchmark'})
+post = time.perf_counter() - started
+assert response.status_code == 302 and len(jobs) == 1, response.status_code
+[(_, (request_id,))] = jobs
+
+with app.app_context():
+    emergency = db.session.get(EmergencyRequest, request_id)
+    started = time.perf_counter()
+    broadcast.fan_out(emergency)
+    db.session.commit()
+    fan_out = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sent, failed = broadcast.deliver(request_id)
+    delivery = time.perf_counter() - started
+
+    print('donors={} radius={}km recipients={} post={:.1f}ms fan_out={:.1f}ms delivered={} failed={} in {:.2f}s '
+          '({:.0f}/s) concurrency={} batch_size={} received={}'.format(
+              args.donors, app.config['EMERGENCY_RADIUS_KM'], emergency.recipients, post * 1000, fan_out * 1000,
+              sent, failed, delivery, sent / delivery if delivery else 0, notifier.concurrency, notifier.batch_size,
+              len(stub.received)))
+
+stub.stop()
@@ -0,0 +1,136 @@
+"""Concurrent read/write throughput of SQLite with and without the engine tuning.
+
+    python benchmarks/bench_db.py --readers 8 --writers 2 --seconds 10
+
+Seeds a throwaway SQLite database, then runs itself twice: once with
+SQLite's defaults (rollback journal, synchronous=FULL, default pool) and
+once with SQLITE_PRAGMAS and SQLALCHEMY_ENGINE_OPTIONS from Config. In
+each run reader processes (one per web worker, as under gunicorn) load a
+hospital and its stock the way hospital_details does while writer
+processes record received units, and the reads/s, writes/s and failed
+operations of both runs are printed as JSON.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+import subprocess
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--hospitals', type=int, default=10_000)
+parser.add_argument('--readers', type=int, default=8)
+parser.add_argument('--writers', type=int, default=2)
+parser.add_argument('--seconds', type=float, default=10)
+parser.add_argument('--mode', choices=['baseline', 'tuned'], help='Run one mode in this process.')
+args = parser.parse_args()
+
+db_path = os.path.join(tempfile.gettempdir(), 'aayudhar-bench-db-{}.db'.format(args.hospitals))
+
+if args.mode is None:
+    report = {}
+    for mode in ('baseline', 'tuned'):
+        output = subprocess.run(
+            [sys.executable, __file__, '--mode', mode] + sys.argv[1:],
+            check=True, stdout=subprocess.PIPE, text=True
+        ).stdout
+        report[mode] = json.loads(output.splitlines()[-1])
+    for key in ('reads_per_second', 'writes_per_second'):
+        report['{}_gain'.format(key)] = round(report['tuned'][key] / max(report['baseline'][key], 1e-9), 2)
+    print(json.dumps(report, indent=2))
+    sys.exit()
+
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+if args.mode == 'baseline':
+    # SQLAlchemy's own QueuePool defaults.
+    os.environ.update(DATABASE_POOL_SIZE='5', DATABASE_MAX_OVERFLOW='10', DATABASE_POOL_PRE_PING='0')
+
+import sqlalchemy as sa
+from app import create_app, db, engine_tuning
+from app import inventory
+from app.models import Hospital
+from app.enums import BloodGroupEnum
+
+app = create_app()
+
+if args.mode == 'baseline':
+    # journal_mode sticks to the file, so switch it back explicitly.
+    engine_tuning.pragmas = {'journal_mode': 'DELETE', 'synchronous': 'FULL'}
+
+
+def seed():
+    now = datetime.now(timezone.utc)
+    db.session.execute(sa.insert(Hospital.__table__), [
+        dict(id=i, name='Hospital {}'.format(i), hrn='HRN{}'.format(i), address='Road {}'.format(i),
+             city_or_town='City', state='State', zip_code='{:06d}'.format(i % 100000),
+             phone='{:010d}'.format(8_000_000_000 + i), email='hospital{}@example.com'.format(i), updated_at=now)
+        for i in range(1, args.hospitals + 1)
+    ])
+    db.session.commit()
+
+
+def worker(write, seed, stop, results):
+    rng = random.Random(seed)
+    expires_at = datetime.now(timezone.utc) + timedelta(days=30)
+    done = errors = 0
+    with app.app_context():
+        # Never reuse a connection inherited from the parent.
+        db.engine.dispose(close=False)
+        while not stop.is_set():
+            hrn = 'HRN{}'.format(rng.randint(1, args.hospitals))
+            try:
+                hospital = db.session.scalar(sa.select(Hospital).where(Hospital.hrn == hrn))
+                if write:
+                    inventory.receive(hospital, rng.choice(list(BloodGroupEnum)), 1, expires_at)
+                    db.session.commit()
+                else:
+                    inventory.current_stock(hospital)
+                    db.session.rollback()
+                done += 1
+            except sa.exc.OperationalError:
+                # "database is locked" once busy_timeout runs out.
+                db.session.rollback()
+                errors += 1
+        db.session.remove()
+    results.put((write, done, errors))
+
+
+with app.app_context():
+    if not os.path.exists(db_path):
+        db.create_all()
+        seed()
+    journal_mode = db.session.execute(sa.text('PRAGMA journal_mode')).scalar()
+    pool_size = db.engine.pool.size()
+    db.session.remove()
+    db.engine.dispose()
+
+context = multiprocessing.get_context('fork')
+stop, results = context.Event(), context.Queue()
+processes = [context.Process(target=worker, args=(False, i, stop, results)) for i in range(args.readers)]
+processes += [context.Process(target=worker, args=(True, 1000 + i, stop, results)) for i in range(args.writers)]
+started = time.perf_counter()
+for process in processes:
+    process.start()
+time.sleep(args.seconds)
+stop.set()
+counts = {'reads': 0, 'writes': 0, 'errors': 0}
+for _ in processes:
+    write, done, errors = results.get()
+    counts['writes' if write else 'reads'] += done
+    counts['errors'] += errors
+for process in processes:
+    process.join()
+elapsed = time.perf_counter() - started
+
+print(json.dumps(dict(
+    mode=args.mode, journal_mode=journal_mode, readers=args.readers, writers=args.writers,
+    reads_per_second=round(counts['reads'] / elapsed, 1), writes_per_second=round(counts['writes'] / elapsed, 1),
+    errors=counts['errors'], pool_size=pool_size,
+)))
@@ -0,0 +1,110 @@
+"""Latency of nearest-donor and nearest-hospital lookups.
+
+    python benchmarks/bench_geo.py --profiles 1000000
+
+Seeds a throwaway SQLite database (reused on later runs with the same
+size) with synthetic zip codes scattered over India, donors and hospitals
+in them, and reports p50/p95/p99 of nearest_donors() and
+nearest_hospitals() from random zip codes.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import date, datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--profiles', type=int, default=1_000_000)
+parser.add_argument('--hospitals', type=int, default=20_000)
+parser.add_argument('--zip-codes', type=int, default=20_000)
+parser.add_argument('--queries', type=int, default=500)
+parser.add_argument('--limit', type=int, default=25)
+parser.add_argument('--chunk', type=int, default=50_000)
+args = parser.parse_args()
+
+db_path = os.path.join(tempfile.gettempdir(), 'aayudhar-bench-geo-{}-{}.db'.format(args.profiles, args.zip_codes))
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+import sqlalchemy as sa
+from app import create_app, db
+from benchmarks.common import percentile
+from app import geo
+from app.models import User, Profile, Hospital, BloodStock, ZipCode
+from app.enums import BloodGroupEnum, GenderEnum
+from app.matching import nearest_donors
+from app.inventory import nearest_hospitals
+
+app = create_app()
+
+
+def seed():
+    rng = random.Random(42)
+    zip_codes = [
+        dict(zip_code='{:06d}'.format(i), latitude=rng.uniform(8, 35), longitude=rng.uniform(68, 97))
+        for i in range(args.zip_codes)
+    ]
+    groups = [bg.name for bg in BloodGroupEnum]
+    for start in range(0, args.profiles, args.chunk):
+        ids = range(start + 1, min(start + args.chunk, args.profiles) + 1)
+        db.session.execute(sa.insert(User.__table__), [
+            dict(id=i, username='user{}'.format(i), email='user{}@example.com'.format(i),
+                 phone='{:010d}'.format(i), is_admin=False)
+            for i in ids
+        ])
+        db.session.execute(sa.insert(Profile.__table__), [
+            dict(id=i, user_id=i, dob=date(1990, 1, 1), gender=GenderEnum.OTHER.name, address='-',
+                 state='-', zip_code=rng.choice(zip_codes)['zip_code'], blood_group=rng.choice(groups))
+            for i in ids
+        ])
+        db.session.commit()
+    db.session.execute(sa.insert(Hospital.__table__), [
+        dict(id=i, name='Hospital {}'.format(i), hrn='HRN{}'.format(i), address='-', city_or_town='-',
+             state='-', zip_code=rng.choice(zip_codes)['zip_code'], phone='{:010d}'.format(i),
+             email='hospital{}@example.com'.format(i), updated_at=datetime(2026, 1, 1))
+        for i in range(1, args.hospitals + 1)
+    ])
+    db.session.execute(sa.insert(BloodStock.__table__), [
+        dict(hospital_id=i, blood_group=group, quantity=rng.randrange(0, 5))
+        for i in range(1, args.hospitals + 1) for group in groups
+    ])
+    db.session.commit()
+    # Locates every row the same way `flask geo load-zips` does.
+    geo.load_zip_codes(db.session, zip_codes)
+    return zip_codes
+
+
+def report(name, timings):
+    print('{} profiles={} queries={} p50={:.2f}ms p95={:.2f}ms p99={:.2f}ms mean={:.2f}ms'.format(
+        name, args.profiles, len(timings), percentile(timings, 50), percentile(timings, 95),
+        percentile(timings, 99), statistics.mean(timings)
+    ))
+
+
+with app.app_context():
+    if not os.path.exists(db_path):
+        db.create_all()
+        started = time.perf_counter()
+        seed()
+        print('seeded {} profiles in {:.1f}s'.format(args.profiles, time.perf_counter() - started))
+    points = db.session.execute(sa.select(ZipCode.latitude, ZipCode.longitude)).all()
+
+    rng = random.Random(7)
+    donor_timings, hospital_timings = [], []
+    for _ in range(args.queries):
+        latitude, longitude = rng.choice(points)
+        recipient = rng.choice(list(BloodGroupEnum))
+        started = time.perf_counter()
+        nearest_donors(recipient, latitude, longitude, limit=args.limit)
+        donor_timings.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        nearest_hospitals(latitude, longitude, blood_group=recipient, limit=10)
+        hospital_timings.append((time.perf_counter() - started) * 1000)
+        db.session.rollback()
+
+    report('nearest_donors', donor_timings)
+    report('nearest_hospitals', hospital_timings)
@@ -0,0 +1,93 @@
+"""Latency of donor matching over a large synthetic profile table.
+
+    python benchmarks/bench_matching.py --profiles 1000000
+
+Seeds a throwaway SQLite database (reused on later runs with the same
+size) and reports p50/p95/p99 of find_donors() for random recipients.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--profiles', type=int, default=1_000_000)
+parser.add_argument('--states', type=int, default=30)
+parser.add_argument('--zip-codes', type=int, default=2000)
+parser.add_argument('--queries', type=int, default=500)
+parser.add_argument('--chunk', type=int, default=50_000)
+args = parser.parse_args()
+
+db_path = os.path.join(tempfile.gettempdir(), 'aayudhar-bench-matching-{}.db'.format(args.profiles))
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+
+import sqlalchemy as sa
+from app import create_app, db
+from benchmarks.common import percentile
+from app.models import User, Profile
+from app.enums import BloodGroupEnum, GenderEnum
+from app.matching import find_donors
+
+app = create_app()
+
+# Rough population frequencies so rare groups behave like rare groups.
+GROUP_WEIGHTS = {
+    BloodGroupEnum.O_POSITIVE: 37, BloodGroupEnum.A_POSITIVE: 29, BloodGroupEnum.B_POSITIVE: 22,
+    BloodGroupEnum.AB_POSITIVE: 6, BloodGroupEnum.O_NEGATIVE: 2, BloodGroupEnum.A_NEGATIVE: 2,
+    BloodGroupEnum.B_NEGATIVE: 1, BloodGroupEnum.AB_NEGATIVE: 1,
+}
+
+
+def seed():
+    rng = random.Random(42)
+    groups = [bg.name for bg in GROUP_WEIGHTS]
+    weights = list(GROUP_WEIGHTS.values())
+    for start in range(0, args.profiles, args.chunk):
+        ids = range(start + 1, min(start + args.chunk, args.profiles) + 1)
+        db.session.execute(sa.insert(User.__table__), [
+            dict(id=i, username='user{}'.format(i), email='user{}@example.com'.format(i),
+                 phone='{:010d}'.format(i), is_admin=False)
+            for i in ids
+        ])
+        db.session.execute(sa.insert(Profile.__table__), [
+            dict(id=i, user_id=i, dob=date(1990, 1, 1), gender=GenderEnum.OTHER.name, address='-',
+                 state='state{}'.format(rng.randrange(args.states)),
+                 zip_code='{:06d}'.format(rng.randrange(args.zip_codes)),
+                 blood_group=rng.choices(groups, weights)[0])
+            for i in ids
+        ])
+        db.session.commit()
+
+
+with app.app_context():
+    if not os.path.exists(db_path):
+        db.create_all()
+        started = time.perf_counter()
+        seed()
+        print('seeded {} profiles in {:.1f}s'.format(args.profiles, time.perf_counter() - started))
+
+    rng = random.Random(7)
+    timings = []
+    for _ in range(args.queries):
+        recipient = rng.choice(list(BloodGroupEnum))
+        state = 'state{}'.format(rng.randrange(args.states))
+        zip_code = '{:06d}'.format(rng.randrange(args.zip_codes))
+        started = time.perf_counter()
+        page = find_donors(recipient, state=state, zip_code=zip_code, per_page=25)
+        timings.append((time.perf_counter() - started) * 1000)
+        if page.next_cursor:
+            started = time.perf_counter()
+            find_donors(recipient, state=state, zip_code=zip_code, cursor=page.next_cursor, per_page=25)
+            timings.append((time.perf_counter() - started) * 1000)
+        db.session.rollback()
+
+    print('profiles={} queries={} p50={:.2f}ms p95={:.2f}ms p99={:.2f}ms mean={:.2f}ms'.format(
+        args.profiles, len(timings), percentile(timings, 50), percentile(timings, 95),
+        percentile(timings, 99), statistics.mean(timings)
+    ))
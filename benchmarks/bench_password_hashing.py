@@ -0,0 +1,67 @@
+"""Login throughput at different password hashing costs.
+
+    python benchmarks/bench_password_hashing.py --threads 8 --logins 200
+
+For every method a user is registered with that method, then logged in
+repeatedly through the test client from a thread pool. Reports logins per
+second and latency percentiles per method.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--methods', nargs='+', default=[
+    'pbkdf2:sha256:100000', 'pbkdf2:sha256:600000',
+    'scrypt:16384:8:1', 'scrypt:32768:8:1', 'scrypt:65536:8:1',
+])
+parser.add_argument('--threads', type=int, default=8)
+parser.add_argument('--workers', type=int, default=os.cpu_count())
+parser.add_argument('--logins', type=int, default=200)
+args = parser.parse_args()
+
+db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+os.environ['DATABASE_URL'] = 'sqlite:///' + db_path
+os.environ['PASSWORD_HASH_WORKERS'] = str(args.workers)
+os.environ['PASSWORD_HASH_QUEUE_LIMIT'] = str(args.threads * 2)
+
+from app import create_app, db, passwords
+from benchmarks.common import percentile
+from app.models import User
+
+app = create_app()
+app.config['WTF_CSRF_ENABLED'] = False
+PASSWORD = 'Bench-Passw0rd!'
+
+
+def login(username):
+    client = app.test_client()
+    started = time.perf_counter()
+    response = client.post('/login', data={'username': username, 'password': PASSWORD})
+    assert response.status_code == 302, response.status_code
+    return time.perf_counter() - started
+
+
+with app.app_context():
+    db.create_all()
+    for number, method in enumerate(args.methods):
+        passwords.method = method
+        user = User(username='bench{}'.format(number), email='bench{}@example.com'.format(number),
+                    phone='{:010d}'.format(number))
+        user.set_password(PASSWORD)
+        db.session.add(user)
+        db.session.commit()
+
+        with ThreadPoolExecutor(args.threads) as pool:
+            started = time.perf_counter()
+            timings = list(pool.map(login, [user.username] * args.logins))
+            elapsed = time.perf_counter() - started
+        print('{:<24} {:>7.1f} logins/s  p50={:.1f}ms p95={:.1f}ms p99={:.1f}ms'.format(
+            method, args.logins / elapsed, percentile(timings, 50) * 1000,
+            percentile(timings, 95) * 1000, percentile(timings, 99) * 1000
+        ))
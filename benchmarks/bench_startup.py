@@ -0,0 +1,64 @@
+"""Startup cost of a worker: importing the app and building it with create_app().
+
+    python benchmarks/bench_startup.py --budget-ms 1200
+
+Runs `python -X importtime -c "from app import create_app; create_app()"`
+a few times in fresh interpreters, prints the median wall time and the
+slowest imports (cumulative) of the fastest run, and exits with status 1
+when the median goes over --budget-ms or a --forbid module was imported:
+pydenticon and PIL should only load on first use, and Alembic only for
+`flask db`.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CODE = 'from app import create_app; create_app()'
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--runs', type=int, default=5)
+parser.add_argument('--top', type=int, default=15)
+parser.add_argument('--budget-ms', type=float, default=1500)
+parser.add_argument('--forbid', nargs='*', default=['pydenticon', 'PIL', 'numpy', 'alembic'])
+args = parser.parse_args()
+
+
+def run():
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', CODE], cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+    elapsed = (time.perf_counter() - started) * 1000
+    imports = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            imports[match.group(4)] = (int(match.group(1)) / 1000, int(match.group(2)) / 1000, len(match.group(3)))
+    return elapsed, imports
+
+
+runs = sorted((run() for _ in range(args.runs)), key=lambda r: r[0])
+median = statistics.median(elapsed for elapsed, _ in runs)
+_, imports = runs[0]
+
+print('startup median={:.0f}ms min={:.0f}ms max={:.0f}ms runs={} budget={:.0f}ms'.format(
+    median, runs[0][0], runs[-1][0], len(runs), args.budget_ms))
+print('slowest imports (cumulative ms, self ms):')
+top_level = [(name, entry) for name, entry in imports.items() if entry[2] <= 3]
+for name, (own, cumulative, _) in sorted(top_level, key=lambda item: -item[1][1])[:args.top]:
+    print('  {:>8.1f} {:>8.1f}  {}'.format(cumulative, own, name))
+
+failed = False
+loaded = sorted(name for name in args.forbid if name in imports)
+if loaded:
+    print('FAIL: imported at startup: {}'.format(', '.join(loaded)))
+    failed = True
+if median > args.budget_ms:
+    print('FAIL: median startup {:.0f}ms is over the {:.0f}ms budget'.format(median, args.budget_ms))
+    failed = True
+sys.exit(1 if failed else 0)
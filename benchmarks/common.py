@@ -0,0 +1,8 @@
+"""Helpers shared by the benchmark scripts."""
+import math
+
+
+def percentile(samples, pct):
+    # Nearest-rank percentile; pct in 0-100.
+    samples = sorted(samples)
+    return samples[max(0, math.ceil(len(samples) * pct / 100) - 1)]
@@ -5,6 +5,70 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(basedir, 'app.db')
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_size': int(os.environ.get('DATABASE_POOL_SIZE') or 10),
+        'max_overflow': int(os.environ.get('DATABASE_MAX_OVERFLOW') or 20),
+        'pool_pre_ping': (os.environ.get('DATABASE_POOL_PRE_PING') or '1') == '1',
+        'pool_recycle': int(os.environ.get('DATABASE_POOL_RECYCLE') or 1800),
+    }
+    SQLALCHEMY_BINDS = {'replica': os.environ['REPLICA_DATABASE_URL']} if os.environ.get('REPLICA_DATABASE_URL') else {}
+    READ_REPLICA_ENDPOINTS = ('main.user', 'main.hospitals', 'main.hospital_details',
+                              'api.user', 'api.hospitals', 'api.hospital')
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000),
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,
+    }
     AVATAR_UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static', 'images', 'avatars')
     IMAGE_UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static', 'images', 'hospitals')
-    MAX_CONTENT_LENGTH = 1 * 1024 * 1024
\ No newline at end of file
+    MAX_CONTENT_LENGTH = 1 * 1024 * 1024
+    ASSET_MAX_AGE = 31536000
+    IDENTICON_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'usercontent', 'identicon')
+    IDENTICON_SIZES = (36, 120)
+    IDENTICON_CACHE_SIZE = int(os.environ.get('IDENTICON_CACHE_SIZE') or 2048)
+    FRAGMENT_CACHE_BACKEND = os.environ.get('FRAGMENT_CACHE_BACKEND') or 'memory'
+    FRAGMENT_CACHE_SIZE = int(os.environ.get('FRAGMENT_CACHE_SIZE') or 4096)
+    FRAGMENT_CACHE_PATH = os.environ.get('FRAGMENT_CACHE_PATH') or os.path.join(basedir, 'fragments.db')
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS') or 2)
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt'
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS') or os.cpu_count() or 2)
+    PASSWORD_HASH_QUEUE_LIMIT = int(os.environ.get('PASSWORD_HASH_QUEUE_LIMIT') or 32)
+    PASSWORD_HASH_TIMEOUT = 10
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE') or 1024)
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL') or 60)
+    UNIQUE_CHECKS = os.environ.get('UNIQUE_CHECKS') or 'select'
+    ZIP_CODES_FILE = os.environ.get('ZIP_CODES_FILE') or os.path.join(basedir, 'app', 'data', 'zip_codes.csv')
+    NEAREST_LIMIT = 10
+    HOSPITALS_PER_PAGE = 25
+    HOSPITAL_SEARCH_LIMIT = 50
+    DONORS_PER_PAGE = 25
+    APPLICATIONS_PER_PAGE = 100
+    API_PER_PAGE = 50
+    API_MAX_PER_PAGE = 200
+    APPLICATION_WORKER_CONCURRENCY = int(os.environ.get('APPLICATION_WORKER_CONCURRENCY') or 4)
+    APPLICATION_WORKER_BATCH_SIZE = int(os.environ.get('APPLICATION_WORKER_BATCH_SIZE') or 50)
+    APPLICATION_WORKER_POLL_INTERVAL = 5
+    APPLICATION_WORKER_MAX_ATTEMPTS = 5
+    APPLICATION_WORKER_BACKOFF = 30
+    APPLICATION_WORKER_CLAIM_TIMEOUT = 600
+    NOTIFY_SMTP_HOST = os.environ.get('NOTIFY_SMTP_HOST') or 'localhost'
+    NOTIFY_SMTP_PORT = int(os.environ.get('NOTIFY_SMTP_PORT') or 25)
+    NOTIFY_SENDER = os.environ.get('NOTIFY_SENDER') or 'no-reply@aayudhar.local'
+    NOTIFY_CONCURRENCY = int(os.environ.get('NOTIFY_CONCURRENCY') or 10)
+    NOTIFY_BATCH_SIZE = int(os.environ.get('NOTIFY_BATCH_SIZE') or 100)
+    NOTIFY_TIMEOUT = 10
+    NOTIFY_CLAIM_SIZE = 5000
+    NOTIFY_MAX_ATTEMPTS = 3
+    NOTIFY_CLAIM_TIMEOUT = 600
+    NOTIFY_BACKOFF = 60
+    EMERGENCY_COOLDOWN = 12 * 3600
+    EMERGENCY_RADIUS_KM = float(os.environ.get('EMERGENCY_RADIUS_KM') or 25)
+    SQL_QUERY_BUDGET_ACTION = os.environ.get('SQL_QUERY_BUDGET_ACTION')
+    SQL_QUERY_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET') or 10)
+    SQL_QUERY_BUDGETS = {}
+    METRICS_DIR = os.environ.get('METRICS_DIR')
+    METRICS_FLUSH_INTERVAL = 5
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
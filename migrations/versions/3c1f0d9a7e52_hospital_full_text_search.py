@@ -0,0 +1,44 @@
+"""hospital full text search
+
+Revision ID: 3c1f0d9a7e52
+Revises: 289f67cdeb7d
+Create Date: 2026-10-18 11:02:14.519306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c1f0d9a7e52'
+down_revision = '289f67cdeb7d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Spelled out rather than imported from app.search so this revision
+    # keeps creating the same schema whatever the app code becomes.
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS hospital_fts USING fts5("
+            "name, address, city_or_town, state, tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+        op.execute(
+            "INSERT INTO hospital_fts (rowid, name, address, city_or_town, state) "
+            "SELECT id, name, address, city_or_town, state FROM hospital"
+        )
+    elif dialect == 'postgresql':
+        op.execute(
+            "CREATE INDEX IF NOT EXISTS ix_hospital_search ON hospital USING GIN "
+            "(to_tsvector('simple', name || ' ' || address || ' ' || city_or_town || ' ' || state))"
+        )
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TABLE IF EXISTS hospital_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_hospital_search")
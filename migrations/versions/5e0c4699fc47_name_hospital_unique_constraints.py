@@ -0,0 +1,31 @@
+"""name hospital unique constraints
+
+Revision ID: 5e0c4699fc47
+Revises: 4d4d55c45620
+Create Date: 2026-10-18 12:24:16.061723
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e0c4699fc47'
+down_revision = '4d4d55c45620'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Postgres already named them <table>_<column>_key. SQLite reflects
+    # them unnamed; the naming convention names them the same way and the
+    # table is rebuilt with the names.
+    if op.get_bind().dialect.name == 'sqlite':
+        with op.batch_alter_table('hospital', recreate='always',
+                                  naming_convention={'uq': '%(table_name)s_%(column_0_name)s_key'}):
+            pass
+
+
+def downgrade():
+    # The names change nothing the earlier schema relied on.
+    pass
@@ -0,0 +1,28 @@
+"""donor application failed status
+
+Revision ID: d2b7e41c9a30
+Revises: 9e2cc4773de6
+Create Date: 2026-10-18 14:02:41.118306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2b7e41c9a30'
+down_revision = '9e2cc4773de6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Non-native enums are plain strings that already fit FAILED.
+    if op.get_bind().dialect.name == 'postgresql':
+        with op.get_context().autocommit_block():
+            op.execute("ALTER TYPE donorapplicationstatusenum ADD VALUE IF NOT EXISTS 'FAILED'")
+
+
+def downgrade():
+    # Postgres cannot drop an enum value; hand the rows back to reviewers.
+    op.execute(sa.text("UPDATE donor_application SET status = 'PENDING' WHERE status = 'FAILED'"))
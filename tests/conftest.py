@@ -0,0 +1,93 @@
+import zlib
+from datetime import date
+
+import pytest
+
+from config import Config
+from app import create_app, db
+from app.models import User, Profile, Hospital
+from app.enums import BloodGroupEnum, GenderEnum
+
+PASSWORD = 'Passw0rd!'
+
+
+@pytest.fixture
+def config(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        WTF_CSRF_ENABLED = False
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + str(tmp_path / 'test.db')
+        SQLALCHEMY_BINDS = {}
+        # Cheap enough that every test can log in.
+        PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'
+        AVATAR_UPLOAD_FOLDER = str(tmp_path / 'avatars')
+        IMAGE_UPLOAD_FOLDER = str(tmp_path / 'hospitals')
+        IDENTICON_FOLDER = str(tmp_path / 'identicon')
+        FRAGMENT_CACHE_BACKEND = 'memory'
+        METRICS_DIR = None
+        METRICS_TOKEN = None
+
+    return TestConfig
+
+
+@pytest.fixture
+def app(config):
+    app = create_app(config)
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+@pytest.fixture
+def ctx(app):
+    # For tests that work on the database directly. Requests made through
+    # the client get their own app context, so use one or the other.
+    with app.app_context():
+        yield
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def make_user(username, admin=False, password=PASSWORD, **profile):
+    user = User(username=username, email='{}@example.com'.format(username),
+                phone='9{:09d}'.format(zlib.crc32(username.encode()) % 10 ** 9), is_admin=admin)
+    user.set_password(password)
+    db.session.add(user)
+    if profile:
+        profile.setdefault('dob', date(1990, 1, 1))
+        profile.setdefault('gender', GenderEnum.OTHER)
+        profile.setdefault('address', '1 Main Road')
+        profile.setdefault('state', 'Maharashtra')
+        profile.setdefault('zip_code', '400001')
+        profile.setdefault('blood_group', BloodGroupEnum.O_POSITIVE)
+        db.session.add(Profile(user=user, **profile))
+    db.session.commit()
+    return user
+
+
+def make_hospital(name, **fields):
+    slug = name.lower().replace(' ', '-')
+    fields.setdefault('hrn', 'HRN-' + slug)
+    fields.setdefault('address', '1 Hospital Road')
+    fields.setdefault('city_or_town', 'Mumbai')
+    fields.setdefault('state', 'Maharashtra')
+    fields.setdefault('zip_code', '400001')
+    fields.setdefault('phone', '8{:09d}'.format(zlib.crc32(name.encode()) % 10 ** 9))
+    fields.setdefault('email', '{}@hospital.example.com'.format(slug))
+    hospital = Hospital(name=name, **fields)
+    db.session.add(hospital)
+    db.session.commit()
+    return hospital
+
+
+def log_in(client, user_id):
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
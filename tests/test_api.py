@@ -0,0 +1,112 @@
+import pytest
+import sqlalchemy as sa
+
+from app import db
+from app.enums import BloodGroupEnum as BG
+from app.models import User, Hospital
+from conftest import make_user, make_hospital, log_in
+
+
+@pytest.fixture
+def seeded(app):
+    with app.app_context():
+        make_hospital('Apollo Hospital', state='Tamil Nadu')
+        make_hospital('Breach Candy Hospital')
+        make_hospital('Cooper Hospital')
+        make_user('donor', blood_group=BG.O_NEGATIVE)
+        return {
+            'admin': make_user('admin', admin=True).id,
+            'user': make_user('user').id,
+        }
+
+
+@pytest.fixture
+def reader(client, seeded):
+    log_in(client, seeded['user'])
+    return client
+
+
+@pytest.fixture
+def admin(client, seeded):
+    log_in(client, seeded['admin'])
+    return client
+
+
+def names(response):
+    return [item['name'] for item in response.json['items']]
+
+
+def test_anonymous_and_non_admin_requests_are_refused(client, seeded):
+    response = client.get('/api/v1/hospitals')
+    assert response.status_code == 401 and 'error' in response.json
+    log_in(client, seeded['user'])
+    assert client.get('/api/v1/users').status_code == 403
+    assert client.get('/api/v1/applications').status_code == 403
+    assert client.get('/api/v1/users/donor').json['blood_group'] == 'O_NEGATIVE'
+
+
+def test_fields_pick_what_is_returned(reader):
+    response = reader.get('/api/v1/hospitals?fields=name,hrn,name')
+    assert response.json['items'][0] == {'name': 'Apollo Hospital', 'hrn': 'HRN-apollo-hospital'}
+    response = reader.get('/api/v1/hospitals?fields=name,secret')
+    assert response.status_code == 400 and response.json['error'] == 'Unknown fields: secret'
+
+
+def test_filters(reader, admin):
+    assert names(reader.get('/api/v1/hospitals?state=Maharashtra')) == ['Breach Candy Hospital', 'Cooper Hospital']
+    assert reader.get('/api/v1/hospitals?colour=red').status_code == 400
+    response = admin.get('/api/v1/users?blood_group=O_NEGATIVE&fields=username')
+    assert response.json['items'] == [{'username': 'donor'}]
+    assert admin.get('/api/v1/users?blood_group=Z').status_code == 400
+
+
+def test_pages_follow_the_keyset_cursor(reader):
+    first = reader.get('/api/v1/hospitals?limit=2&fields=name')
+    assert names(first) == ['Apollo Hospital', 'Breach Candy Hospital']
+    assert first.json['next_cursor'] and 'cursor=' in first.json['next']
+    second = reader.get(first.json['next'])
+    assert names(second) == ['Cooper Hospital']
+    assert second.json['next_cursor'] is None and second.json['next'] is None
+    assert reader.get('/api/v1/hospitals?limit=0').status_code == 400
+    # A cursor that cannot be read starts over, as on the HTML pages.
+    assert names(reader.get('/api/v1/hospitals?limit=1&cursor=garbage')) == ['Apollo Hospital']
+
+
+def test_unchanged_collections_are_answered_with_304(app, reader):
+    response = reader.get('/api/v1/hospitals')
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified'] and 'private' in response.headers['Cache-Control']
+
+    cached = reader.get('/api/v1/hospitals', headers={'If-None-Match': etag})
+    assert cached.status_code == 304 and cached.data == b''
+    assert cached.headers['ETag'] == etag
+    # The 304 never selects the fields themselves.
+    assert int(cached.headers['X-SQL-Queries']) < int(response.headers['X-SQL-Queries'])
+    # Another projection is another representation.
+    assert reader.get('/api/v1/hospitals?fields=name', headers={'If-None-Match': etag}).status_code == 200
+
+    with app.app_context():
+        hospital = db.session.scalar(sa.select(Hospital).where(Hospital.name == 'Cooper Hospital'))
+        hospital.phone = '8000000000'
+        db.session.commit()
+    changed = reader.get('/api/v1/hospitals', headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['ETag'] != etag
+
+
+def test_single_resources_are_conditional_too(app, reader):
+    response = reader.get('/api/v1/hospitals/HRN-cooper-hospital')
+    assert response.json['name'] == 'Cooper Hospital'
+    headers = {'If-Modified-Since': response.headers['Last-Modified']}
+    assert reader.get('/api/v1/hospitals/HRN-cooper-hospital', headers=headers).status_code == 304
+    assert reader.get('/api/v1/hospitals/HRN-nowhere').status_code == 404
+
+    # A profile edit changes the user it belongs to.
+    with app.app_context():
+        make_user('donor2', blood_group=BG.A_POSITIVE)
+    etag = reader.get('/api/v1/users/donor2').headers['ETag']
+    with app.app_context():
+        user = db.session.scalar(sa.select(User).where(User.username == 'donor2'))
+        user.profile.state = 'Goa'
+        db.session.commit()
+    response = reader.get('/api/v1/users/donor2', headers={'If-None-Match': etag})
+    assert response.status_code == 200 and response.json['state'] == 'Goa'
@@ -0,0 +1,155 @@
+from datetime import date, datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import sqlalchemy as sa
+
+from app import db
+from app import applications
+from app.enums import DonorApplicationStatusEnum as Status
+from app.models import DonorApplication
+from conftest import make_user, log_in
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def apply(user, minutes=0, **fields):
+    fields.setdefault('height', 170)
+    fields.setdefault('wight', 70)
+    fields.setdefault('habbits', '')
+    application = DonorApplication(applicant=user, uidn='1234', timestamp=START + timedelta(minutes=minutes), **fields)
+    db.session.add(application)
+    db.session.commit()
+    return application
+
+
+def statuses():
+    return dict(db.session.execute(sa.select(DonorApplication.id, DonorApplication.status)).all())
+
+
+def test_queue_is_oldest_first_per_status(ctx):
+    user = make_user('donor', blood_group='O+')
+    late, early, other = apply(user, 10), apply(user, 0), apply(user, 5, status=Status.APPROVED)
+    apply(user, 20)
+    first = applications.application_queue(Status.PENDING, per_page=2)
+    second = applications.application_queue(Status.PENDING, cursor=first.next_cursor, per_page=2)
+    assert [a.id for a in first] == [early.id, late.id]
+    assert len(second) == 1 and not second.has_next
+    assert [a.id for a in applications.application_queue(Status.APPROVED)] == [other.id]
+
+
+def test_review_only_changes_applications_still_pending(ctx):
+    user = make_user('donor')
+    pending, decided = apply(user), apply(user, status=Status.REJECTED)
+    ids = [pending.id, decided.id, pending.id, 999]
+    assert applications.review_applications(ids, Status.APPROVED) == 1
+    assert applications.review_applications(ids, Status.REJECTED) == 0
+    db.session.commit()
+    assert statuses() == {pending.id: Status.APPROVED, decided.id: Status.REJECTED}
+
+
+def test_review_in_batches(ctx, monkeypatch):
+    monkeypatch.setattr(applications, 'REVIEW_BATCH_SIZE', 2)
+    user = make_user('donor')
+    ids = [apply(user, i).id for i in range(5)]
+    assert applications.review_applications(ids, Status.APPROVED) == 5
+
+
+def test_admin_queue_page(app, client):
+    with app.app_context():
+        admin_id = make_user('admin', admin=True).id
+        user = make_user('donor', blood_group='AB-')
+        ids = [apply(user, i, habbits='habit {}'.format(i)).id for i in range(3)]
+    log_in(client, admin_id)
+
+    response = client.get('/admin/applications')
+    assert response.status_code == 200
+    assert b'habit 0' in response.data and b'AB-' in response.data
+
+    response = client.post('/admin/applications?status=PENDING',
+                           data={'ids': [str(ids[0]), str(ids[1])], 'approve': 'Approve selected'})
+    assert response.status_code == 302
+    with app.app_context():
+        assert statuses() == {ids[0]: Status.APPROVED, ids[1]: Status.APPROVED, ids[2]: Status.PENDING}
+    assert client.get('/admin/applications?status=BOGUS').status_code == 404
+
+
+def test_eligibility_reasons(ctx):
+    user = make_user('donor', dob=date(2015, 1, 1))
+    application = DonorApplication(height=120, wight=40, habbits='Needle sharing')
+    assert len(applications.check_eligibility(application, user.profile, date(2026, 1, 1))) == 4
+    assert applications.check_eligibility(application, None, date(2026, 1, 1))[0] == 'No donor profile'
+
+
+def test_worker_decides_pending_applications(app, ctx):
+    eligible, young = make_user('eligible', blood_group='O+'), make_user('young', dob=date.today())
+    ok, too_young, light = apply(eligible), apply(young), apply(eligible, 1, wight=40)
+    stats = applications.ApplicationWorker(app, concurrency=2).run(once=True)
+    assert stats['approved'] == 1 and stats['rejected'] == 2
+    db.session.expire_all()
+    assert statuses() == {ok.id: Status.APPROVED, too_young.id: Status.REJECTED, light.id: Status.REJECTED}
+    assert 'Weight below' in db.session.get(DonorApplication, light.id).note
+
+
+def test_failures_back_off_then_go_to_reviewers(app, ctx, monkeypatch):
+    def broken(application_id, today=None):
+        raise RuntimeError('checker down')
+
+    monkeypatch.setattr(applications, 'process_application', broken)
+    app.config.update(APPLICATION_WORKER_MAX_ATTEMPTS=2, APPLICATION_WORKER_BACKOFF=60)
+    application = apply(make_user('donor'))
+    worker = applications.ApplicationWorker(app)
+
+    assert worker.run(once=True)['retry'] == 1
+    db.session.expire_all()
+    assert application.status == Status.PENDING and application.attempts == 1
+    assert 'checker down' in application.note
+    # Not due again until the backoff has passed.
+    assert worker.run(once=True).get('retry') is None
+    application.next_attempt_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.session.commit()
+
+    assert worker.run(once=True)['failed'] == 1
+    db.session.expire_all()
+    assert application.status == Status.FAILED and application.attempts == 2
+    assert applications.claim_applications(10, 2, 600) == []
+    assert applications.review_applications([application.id], Status.APPROVED, from_status=Status.FAILED) == 1
+
+
+def test_an_application_that_cannot_be_released_stays_claimed(app, ctx, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('database went away')
+
+    monkeypatch.setattr(applications, 'process_application', broken)
+    monkeypatch.setattr(applications, 'release_application', broken)
+    application = apply(make_user('donor'))
+    assert applications.ApplicationWorker(app).run_batch(pool=ThreadPoolExecutor(1)) == ['error']
+    db.session.expire_all()
+    assert application.status == Status.PROCESSING and application.claimed_at is not None
+
+
+def test_abandoned_claims_are_retried_a_bounded_number_of_times(ctx):
+    user = make_user('donor')
+    now = datetime.now(timezone.utc)
+    stale = now - timedelta(seconds=700)
+    retried = apply(user, status=Status.PROCESSING, claimed_at=stale, attempts=1)
+    exhausted = apply(user, 1, status=Status.PROCESSING, claimed_at=stale, attempts=3)
+    busy = apply(user, 2, status=Status.PROCESSING, claimed_at=now, attempts=1)
+
+    assert applications.fail_abandoned(3, 600, now=now) == 1
+    assert applications.claim_applications(10, 3, 600, now=now) == [retried.id]
+    db.session.commit()
+    db.session.expire_all()
+    assert (retried.status, retried.attempts) == (Status.PROCESSING, 2)
+    assert exhausted.status == Status.FAILED and 'abandoned' in exhausted.note
+    assert busy.status == Status.PROCESSING and busy.attempts == 1
+
+
+def test_failed_applications_can_be_picked_in_the_queue(app, client):
+    with app.app_context():
+        admin_id = make_user('admin', admin=True).id
+        failed = apply(make_user('donor'), status=Status.FAILED).id
+    log_in(client, admin_id)
+    assert 'value="{}"'.format(failed).encode() in client.get('/admin/applications?status=FAILED').data
+    client.post('/admin/applications?status=FAILED', data={'ids': [str(failed)], 'reject': 'Reject selected'})
+    with app.app_context():
+        assert statuses() == {failed: Status.REJECTED}
@@ -0,0 +1,51 @@
+import os
+
+from flask import url_for
+
+from app import assets
+from app.assets import file_digest
+
+
+def test_static_urls_carry_the_content_hash(app):
+    with app.test_request_context():
+        url = url_for('static', filename='css/styles.css')
+    digest = file_digest(os.path.join(app.static_folder, 'css', 'styles.css'))
+    assert url == '/static/css/styles.css?v=' + digest
+
+
+def test_only_the_current_hash_is_cached_for_good(app, client):
+    with app.test_request_context():
+        url = url_for('static', filename='css/styles.css')
+
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.cache_control.immutable and response.cache_control.max_age == app.config['ASSET_MAX_AGE']
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+    for stale in ('/static/css/styles.css', '/static/css/styles.css?v=0000000000000000'):
+        response = client.get(stale)
+        assert response.status_code == 200
+        assert not response.cache_control.immutable
+
+
+def test_an_edited_file_gets_a_new_hash(app, client, tmp_path):
+    (tmp_path / 'site.css').write_text('body { color: red; }')
+    assets.static_folder = str(tmp_path)
+    assets.manifest = assets.build_manifest()
+    with app.test_request_context():
+        old = url_for('static', filename='site.css')
+
+    (tmp_path / 'site.css').write_text('body { color: blue; }')
+    os.utime(tmp_path / 'site.css', ns=(0, 0))
+    assert not client.get(old).cache_control.immutable
+    with app.test_request_context():
+        new = url_for('static', filename='site.css')
+    assert new != old
+    response = client.get(new)
+    assert response.cache_control.immutable and b'blue' in response.data
+
+
+def test_uploads_are_fingerprinted_by_their_name(app):
+    digest = 'ab' * 32
+    with app.test_request_context():
+        assert assets.lookup('images/avatars/ab/ab/{}.small.jpg'.format(digest)) == (digest + '.small', True)
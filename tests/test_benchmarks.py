@@ -0,0 +1,11 @@
+from benchmarks.common import percentile
+
+
+def test_percentile_is_nearest_rank():
+    samples = list(range(100, 0, -1))
+    assert percentile(samples, 50) == 50
+    assert percentile(samples, 95) == 95
+    assert percentile(samples, 99.5) == 100
+    assert percentile(samples, 0) == 1
+    assert percentile([3.0, 1.0, 2.0, 4.0], 50) == 2.0
+    assert percentile([7], 99) == 7
@@ -0,0 +1,186 @@
+import socket
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+import sqlalchemy as sa
+
+from app import db
+from app import geo
+from app import notifier
+from app import broadcast
+from app.enums import BloodGroupEnum as BG, NotificationStatusEnum as Status
+from app.models import User, EmergencyNotification
+from app.notify import StubSMTPServer
+from conftest import make_user, make_hospital, log_in
+
+
+@pytest.fixture(autouse=True)
+def zip_codes(app):
+    geo.forget_locations()
+    with app.app_context():
+        geo.load_zip_codes(db.session, [
+            dict(zip_code='400001', latitude=18.9388, longitude=72.8354),  # Mumbai
+            dict(zip_code='400050', latitude=19.0544, longitude=72.8406),  # Bandra, ~13 km
+            dict(zip_code='411001', latitude=18.5204, longitude=73.8567),  # Pune, ~120 km
+        ])
+    yield
+    geo.forget_locations()
+
+
+@pytest.fixture
+def stub():
+    server = StubSMTPServer(port=0).start()
+    notifier.host, notifier.port = server.host, server.port
+    yield server
+    server.stop()
+
+
+def donors():
+    make_user('o-neg-bandra', blood_group=BG.O_NEGATIVE, zip_code='400050')
+    make_user('a-pos-mumbai', blood_group=BG.A_POSITIVE, zip_code='400001')
+    make_user('b-pos-mumbai', blood_group=BG.B_POSITIVE, zip_code='400001')
+    make_user('o-neg-pune', blood_group=BG.O_NEGATIVE, zip_code='411001')
+    make_user('o-neg-child', blood_group=BG.O_NEGATIVE, zip_code='400001', dob=date.today() - timedelta(days=3650))
+    return make_hospital('KEM Hospital')
+
+
+def recipients(emergency):
+    return sorted(db.session.scalars(
+        sa.select(EmergencyNotification.user_id).where(EmergencyNotification.request_id == emergency.id)
+    ))
+
+
+def usernames(emergency):
+    return sorted(db.session.scalars(sa.select(User.username).where(User.id.in_(recipients(emergency)))))
+
+
+def statuses():
+    return db.session.scalars(sa.select(EmergencyNotification.status)).all()
+
+
+def raise_emergency(hospital, blood_group, quantity, message=None):
+    # What the request stores, then the fan-out its background job runs.
+    emergency = broadcast.create_emergency(hospital, blood_group, quantity, message)
+    db.session.commit()
+    broadcast.fan_out(emergency)
+    db.session.commit()
+    return emergency
+
+
+def test_the_request_only_stores_the_emergency(ctx):
+    emergency = broadcast.create_emergency(donors(), BG.A_POSITIVE, 2)
+    db.session.commit()
+    assert emergency.fanned_out_at is None and emergency.recipients == 0
+    assert statuses() == []
+
+
+def test_compatible_adult_donors_in_the_radius_are_queued(ctx):
+    emergency = raise_emergency(donors(), BG.A_POSITIVE, 2)
+    assert emergency.recipients == 2 and emergency.fanned_out_at is not None
+    assert usernames(emergency) == ['a-pos-mumbai', 'o-neg-bandra']
+    assert set(statuses()) == {Status.PENDING}
+
+
+def test_recent_recipients_are_left_alone(app, ctx):
+    hospital = donors()
+    raise_emergency(hospital, BG.O_NEGATIVE, 1)
+    assert raise_emergency(hospital, BG.A_POSITIVE, 1).recipients == 1
+    app.config['EMERGENCY_COOLDOWN'] = 0
+    assert raise_emergency(hospital, BG.A_POSITIVE, 1).recipients == 2
+
+
+def test_an_unlocated_hospital_falls_back_to_its_state(ctx):
+    donors()
+    emergency = raise_emergency(make_hospital('Rural Hospital', zip_code='999999'), BG.O_NEGATIVE, 1)
+    assert usernames(emergency) == ['o-neg-bandra', 'o-neg-pune']
+
+
+def test_pending_notifications_are_delivered_once(ctx, stub):
+    emergency = raise_emergency(donors(), BG.A_POSITIVE, 2, 'Ward 4')
+    assert broadcast.deliver(emergency.id) == (2, 0)
+    assert sorted(to for (to,), _ in stub.received) == ['a-pos-mumbai@example.com', 'o-neg-bandra@example.com']
+    assert b'A+ blood needed at KEM Hospital' in stub.received[0][1]
+    assert b'Ward 4' in stub.received[0][1]
+    assert broadcast.delivery_status(emergency)[Status.SENT] == 2
+    assert broadcast.deliver() == (0, 0)
+    assert len(stub.received) == 2
+
+
+def test_failed_sends_back_off_then_give_up(app, ctx):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        notifier.host, notifier.port = s.getsockname()
+    app.config.update(NOTIFY_MAX_ATTEMPTS=2, NOTIFY_BACKOFF=60)
+    emergency = raise_emergency(donors(), BG.O_NEGATIVE, 1)
+
+    started = datetime.now(timezone.utc)
+    assert broadcast.deliver() == (0, 1)
+    notification = db.session.scalar(sa.select(EmergencyNotification))
+    assert (notification.status, notification.attempts) == (Status.PENDING, 1)
+    assert notification.next_attempt_at.replace(tzinfo=timezone.utc) >= started + timedelta(seconds=60)
+    assert notification.error
+    # Not due yet.
+    assert broadcast.deliver() == (0, 0)
+
+    notification.next_attempt_at = started
+    db.session.commit()
+    assert broadcast.deliver() == (0, 1)
+    db.session.refresh(notification)
+    assert (notification.status, notification.attempts) == (Status.FAILED, 2)
+    assert broadcast.delivery_status(emergency)[Status.FAILED] == 1
+
+
+def test_abandoned_sends_are_reclaimed(ctx):
+    raise_emergency(donors(), BG.O_NEGATIVE, 1)
+    now = datetime.now(timezone.utc)
+    first = broadcast.claim_notifications(10, 600, now=now)
+    db.session.commit()
+    assert list(first.values()) == [1]
+    assert broadcast.claim_notifications(10, 600, now=now + timedelta(seconds=60)) == {}
+    assert broadcast.claim_notifications(10, 600, now=now + timedelta(seconds=700)) == {
+        key: 2 for key in first
+    }
+
+
+def test_each_emergency_is_fanned_out_once(app, ctx, stub):
+    emergency = raise_emergency(donors(), BG.A_POSITIVE, 2)
+    assert broadcast.fan_out(emergency) is None
+    assert broadcast.fan_out_pending() == 0
+    assert len(statuses()) == 2
+
+
+def test_send_picks_up_emergencies_left_unfanned(app, ctx, stub):
+    # As if the process died before the background job ran.
+    broadcast.create_emergency(donors(), BG.A_POSITIVE, 2)
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['emergency', 'send'])
+    assert result.exit_code == 0, result.output
+    assert 'Queued recipients of 1 emergencies.' in result.output
+    assert 'Sent 2 notifications, 0 failed attempts.' in result.output
+
+
+def test_admins_broadcast_from_the_hospital_page(app, client, stub, monkeypatch):
+    submitted = []
+    monkeypatch.setattr(notifier, 'submit', lambda fn, *args: submitted.append((fn, args)))
+    with app.app_context():
+        donors()
+        admin_id = make_user('admin', admin=True).id
+        user_id = make_user('user').id
+
+    log_in(client, user_id)
+    client.post('/hospitals/HRN-kem-hospital/emergency', data={'blood_group': 'A_POSITIVE', 'quantity': 2})
+    assert submitted == []
+
+    log_in(client, admin_id)
+    response = client.post('/hospitals/HRN-kem-hospital/emergency',
+                           data={'blood_group': 'A_POSITIVE', 'quantity': 2}, follow_redirects=True)
+    assert response.status_code == 200 and b'Notifying compatible donors near KEM Hospital.' in response.data
+    assert b'finding donors' in response.data
+    [(fn, (request_id,))] = submitted
+    assert fn is broadcast.broadcast
+    with app.app_context():
+        # The request queued no notifications itself.
+        assert statuses() == []
+        assert fn(request_id) == (2, 0)
+    assert len(stub.received) == 2
+    assert b'finding donors' not in client.get('/emergencies/{}'.format(request_id)).data
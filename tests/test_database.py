@@ -0,0 +1,70 @@
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+
+from app import create_app, db
+from app.database import REPLICA
+from app.models import User, Hospital
+from conftest import make_user, make_hospital, log_in
+
+
+def test_sqlite_connections_get_the_pragmas(app, ctx):
+    with db.engine.connect() as connection:
+        assert connection.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal'
+        assert connection.exec_driver_sql('PRAGMA busy_timeout').scalar() == 5000
+        assert connection.exec_driver_sql('PRAGMA synchronous').scalar() == 1
+    assert db.engine.pool.size() == app.config['SQLALCHEMY_ENGINE_OPTIONS']['pool_size']
+
+
+def test_in_memory_sqlite_drops_the_pool_sizing(config):
+    class MemoryConfig(config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite://'
+
+    app = create_app(MemoryConfig)
+    assert 'pool_size' not in app.config['SQLALCHEMY_ENGINE_OPTIONS']
+    assert 'pool_size' in config.SQLALCHEMY_ENGINE_OPTIONS
+    with app.app_context():
+        assert isinstance(db.engine.pool, StaticPool)
+        db.create_all()
+        make_user('memory')
+        assert db.session.scalar(sa.select(User.username)) == 'memory'
+
+
+@pytest.fixture
+def replica_app(config, tmp_path):
+    class ReplicaConfig(config):
+        SQLALCHEMY_BINDS = {REPLICA: 'sqlite:///' + str(tmp_path / 'replica.db')}
+
+    app = create_app(ReplicaConfig)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        for engine in db.engines.values():
+            engine.dispose()
+    # init_app registers a metadata per bind on the shared db, which every
+    # later create_all() would look for.
+    db.metadatas.pop(REPLICA, None)
+
+
+def test_read_only_requests_go_to_the_replica(replica_app):
+    app = replica_app
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines[REPLICA])
+        user_id = make_user('admin', admin=True).id
+        make_hospital('Replicated Hospital')
+        # Copy what has replicated so far; the next hospital lags behind.
+        with db.engines[REPLICA].begin() as connection:
+            for table in (User.__table__, Hospital.__table__):
+                connection.execute(sa.insert(table), db.session.execute(sa.select(table)).mappings().all())
+        make_hospital('Lagging Hospital')
+        # Outside a request everything reads from the primary.
+        assert db.session.scalar(sa.select(sa.func.count()).select_from(Hospital)) == 2
+
+    client = app.test_client()
+    log_in(client, user_id)
+    response = client.get('/hospitals')
+    assert b'Replicated Hospital' in response.data and b'Lagging Hospital' not in response.data
+    assert client.get('/hospitals/HRN-lagging-hospital/').status_code == 404
+    # Endpoints not listed in READ_REPLICA_ENDPOINTS stay on the primary.
+    assert b'Lagging Hospital' in client.get('/admin/export/hospitals.csv').data
@@ -0,0 +1,88 @@
+import csv
+import gzip
+import io
+import json
+
+import sqlalchemy as sa
+
+from app import db
+from app import exporter
+from app import importer
+from app.models import Hospital
+from app.enums import BloodGroupEnum
+from conftest import make_user, make_hospital, log_in
+
+
+def seed(app, client):
+    with app.app_context():
+        admin_id = make_user('admin', admin=True).id
+        make_user('o-neg', blood_group=BloodGroupEnum.O_NEGATIVE)
+        make_user('a-pos', blood_group=BloodGroupEnum.A_POSITIVE, state='Goa')
+        make_hospital('KEM Hospital')
+        make_hospital('Goa Medical College', state='Goa')
+    log_in(client, admin_id)
+
+
+def test_csv_export_has_a_header_and_every_row(app, client):
+    seed(app, client)
+    response = client.get('/admin/export/hospitals.csv')
+    assert response.status_code == 200 and response.mimetype == 'text/csv'
+    assert response.headers['Content-Disposition'] == 'attachment; filename="hospitals.csv"'
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert list(rows[0]) == exporter.header('hospitals')
+    assert [row['name'] for row in rows] == ['KEM Hospital', 'Goa Medical College']
+
+
+def test_jsonl_export_filters_and_names_enums(app, client):
+    seed(app, client)
+    response = client.get('/admin/export/donors.jsonl?blood_group=O_NEGATIVE')
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [(row['username'], row['blood_group'], row['dob']) for row in rows] == [('o-neg', 'O_NEGATIVE', '1990-01-01')]
+    response = client.get('/admin/export/donors.jsonl?state=Goa')
+    assert [json.loads(line)['username'] for line in response.text.splitlines()] == ['a-pos']
+
+
+def test_gzip_export_decompresses_to_the_plain_one(app, client):
+    seed(app, client)
+    plain = client.get('/admin/export/donors.csv').data
+    response = client.get('/admin/export/donors.csv?gzip=1')
+    assert response.mimetype == 'application/gzip'
+    assert response.headers['Content-Disposition'].endswith('donors.csv.gz"')
+    assert gzip.decompress(response.data) == plain
+
+
+def test_bad_requests(app, client):
+    seed(app, client)
+    assert client.get('/admin/export/users.csv').status_code == 404
+    assert client.get('/admin/export/donors.xml').status_code == 404
+    response = client.get('/admin/export/hospitals.csv?blood_group=O_NEGATIVE')
+    assert response.status_code == 400 and 'cannot be filtered' in response.json['error']
+    assert client.get('/admin/export/donors.csv?blood_group=Z').status_code == 400
+
+
+def test_exports_are_for_admins(app, client):
+    with app.app_context():
+        user_id = make_user('user').id
+    log_in(client, user_id)
+    assert client.get('/admin/export/donors.csv').status_code == 302
+
+
+def test_rows_are_streamed_in_batches(ctx, monkeypatch):
+    monkeypatch.setattr(exporter, 'BATCH_SIZE', 2)
+    for i in range(5):
+        make_hospital('Hospital {}'.format(i))
+    chunks = list(exporter.iter_export('hospitals', {}, 'jsonl'))
+    assert [chunk.count(b'\n') for chunk in chunks] == [2, 2, 1]
+
+
+def test_a_hospitals_export_imports_back(ctx, tmp_path):
+    for i in range(3):
+        make_hospital('Hospital {}'.format(i))
+    path = tmp_path / 'hospitals.csv'
+    path.write_bytes(b''.join(exporter.iter_export('hospitals', {}, 'csv')))
+    for hospital in db.session.scalars(sa.select(Hospital)).all():
+        db.session.delete(hospital)
+    db.session.commit()
+    rejects = importer.RejectsWriter(str(tmp_path / 'rejects.csv'), 'csv')
+    assert importer.import_hospitals(str(path), rejects) == 3
+    rejects.close()
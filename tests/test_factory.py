@@ -0,0 +1,53 @@
+import os
+import sys
+import subprocess
+
+from flask import url_for
+
+from app import create_app
+from conftest import make_user, log_in
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ('alembic', 'flask_migrate', 'PIL', 'pydenticon', 'numpy')
+
+
+def test_building_the_app_leaves_heavy_modules_unimported(tmp_path):
+    code = 'import sys; from app import create_app; create_app(); print(" ".join(m for m in {!r} if m in sys.modules))'
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + str(tmp_path / 'app.db'))
+    env.pop('METRICS_DIR', None)
+    result = subprocess.run([sys.executable, '-c', code.format(HEAVY)], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ''
+
+
+def test_each_app_gets_its_own_config(config):
+    class OtherConfig(config):
+        NEAREST_LIMIT = 3
+
+    first, second = create_app(config), create_app(OtherConfig)
+    assert first is not second
+    assert second.config['NEAREST_LIMIT'] == 3 != first.config['NEAREST_LIMIT']
+
+
+def test_views_live_on_the_main_blueprint(app, client):
+    with app.test_request_context():
+        assert url_for('main.hospitals') == '/hospitals'
+    response = client.get('/hospitals')
+    assert response.status_code == 302 and response.location.startswith('/login')
+    with app.app_context():
+        user_id = make_user('reader').id
+    log_in(client, user_id)
+    assert client.get('/hospitals').status_code == 200
+
+
+def test_migrate_commands_are_set_up_when_run(app, ctx, monkeypatch):
+    # `flask` pushes an app context before looking the command up; the
+    # test runner goes straight to app.cli, hence ctx.
+    monkeypatch.chdir(ROOT)
+    runner = app.test_cli_runner()
+    assert 'migrate' not in app.extensions
+    result = runner.invoke(args=['db', 'heads'])
+    assert result.exit_code == 0, result.output
+    assert 'c8d2f4a6b913 (head)' in result.output
+    assert 'migrate' in app.extensions
+    assert 'upgrade' in runner.invoke(args=['db', '--help']).output
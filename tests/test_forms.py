@@ -0,0 +1,79 @@
+import pytest
+import sqlalchemy as sa
+
+from app import db
+from app.models import User, Hospital
+from conftest import PASSWORD, make_user, make_hospital, log_in
+
+MODES = ['select', 'combined', 'constraint']
+
+
+def register(client, **fields):
+    data = dict(username='new', email='new@example.com', phone='9876543210', password=PASSWORD, password2=PASSWORD)
+    data.update(fields)
+    return client.post('/register', data=data)
+
+
+def count(app, model):
+    with app.app_context():
+        return db.session.scalar(sa.select(sa.func.count()).select_from(model))
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('field, value, message', [
+    ('username', 'taken', b'Please use a different username'),
+    ('email', 'taken@example.com', b'Please use a different email address'),
+])
+def test_registration_rejects_duplicates(app, client, mode, field, value, message):
+    app.config['UNIQUE_CHECKS'] = mode
+    with app.app_context():
+        make_user('taken')
+    response = register(client, **{field: value})
+    assert response.status_code == 200
+    assert message in response.data
+    assert count(app, User) == 1
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_registration_succeeds_without_duplicates(app, client, mode):
+    app.config['UNIQUE_CHECKS'] = mode
+    with app.app_context():
+        make_user('taken')
+    assert register(client).status_code == 302
+    assert count(app, User) == 2
+
+
+@pytest.mark.parametrize('mode', MODES)
+@pytest.mark.parametrize('field, message', [
+    ('name', b'Please use a different name'),
+    ('phone', b'Please use a different phone number'),
+    ('email', b'Please use a different email address'),
+])
+def test_hospital_form_rejects_duplicates(app, client, mode, field, message):
+    app.config['UNIQUE_CHECKS'] = mode
+    with app.app_context():
+        admin_id = make_user('admin', admin=True).id
+        taken = make_hospital('Taken Hospital')
+        taken = {name: getattr(taken, name) for name in ('name', 'phone', 'email')}
+    log_in(client, admin_id)
+    data = dict(name='New Hospital', hrn='HRN-new', address='1 Road', city_or_town='Mumbai',
+                state='Maharashtra', zip_code='400001', phone='8000000001', email='new@hospital.example.com')
+    data[field] = taken[field]
+    response = client.post('/hospitals/add', data=data)
+    assert response.status_code == 200
+    assert message in response.data
+    assert count(app, Hospital) == 1
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_hospital_keeps_its_own_values_on_edit(app, client, mode):
+    app.config['UNIQUE_CHECKS'] = mode
+    with app.app_context():
+        admin_id = make_user('admin', admin=True).id
+        hospital = make_hospital('Taken Hospital')
+        data = {name: getattr(hospital, name) for name in
+                ('name', 'hrn', 'address', 'city_or_town', 'state', 'zip_code', 'phone', 'email')}
+    log_in(client, admin_id)
+    data.update(current_hrn=data['hrn'], address='2 New Road')
+    response = client.post('/hospitals/{}/edit'.format(data['hrn']), data=data)
+    assert response.status_code == 302
@@ -0,0 +1,87 @@
+import io
+
+import pytest
+import sqlalchemy as sa
+
+from app import db, fragments, images
+from app.fragments import FragmentCache, SQLiteBackend
+from app.models import Hospital
+from conftest import make_user, make_hospital, log_in
+from test_images import png
+
+
+def render(hospital, *vary):
+    calls = []
+
+    def caller():
+        calls.append(1)
+        return '<p>{}</p>'.format(hospital.name)
+
+    return str(fragments.fragment('card', hospital, *vary, caller=caller)), len(calls)
+
+
+def test_fragments_render_once_per_version(ctx):
+    hospital = make_hospital('KEM Hospital')
+    assert render(hospital) == ('<p>KEM Hospital</p>', 1)
+    assert render(hospital) == ('<p>KEM Hospital</p>', 0)
+    assert render(hospital, 'small') == ('<p>KEM Hospital</p>', 1)
+
+
+def test_committing_a_change_drops_the_fragments(ctx):
+    hospital = make_hospital('KEM Hospital')
+    render(hospital)
+    hospital.name = 'KEM Hospital Parel'
+    db.session.flush()
+    assert fragments.backend.get(fragments.tag(hospital), 'card') is not None
+    db.session.commit()
+    assert fragments.backend.get(fragments.tag(hospital), 'card') is None
+    assert render(hospital) == ('<p>KEM Hospital Parel</p>', 1)
+
+
+def test_sqlite_backend_is_shared_between_caches(tmp_path):
+    first, second = SQLiteBackend(str(tmp_path / 'f.db')), SQLiteBackend(str(tmp_path / 'f.db'))
+    first.set('hospital:1', 'card', 'v1', '<p>x</p>')
+    assert second.get('hospital:1', 'card') == ('v1', '<p>x</p>')
+    second.delete('hospital:1')
+    assert first.get('hospital:1', 'card') is None
+
+
+def test_unknown_backend_is_refused(app):
+    app.config['FRAGMENT_CACHE_BACKEND'] = 'redis'
+    with pytest.raises(ValueError):
+        FragmentCache(app)
+
+
+def test_hospital_page_shows_an_edit_at_once(app, client):
+    with app.app_context():
+        user_id = make_user('reader').id
+        make_hospital('KEM Hospital')
+    log_in(client, user_id)
+    assert b'KEM Hospital' in client.get('/hospitals').data
+
+    with app.app_context():
+        hospital = db.session.scalar(sa.select(Hospital))
+        hospital.city_or_town = 'Navi Mumbai'
+        db.session.commit()
+    assert b'Navi Mumbai' in client.get('/hospitals').data
+    assert b'Navi Mumbai' in client.get('/hospitals/HRN-kem-hospital/').data
+
+
+def test_cards_catch_up_once_the_thumbnail_is_written(app, client, monkeypatch):
+    submit, submitted = images.submit, []
+    monkeypatch.setattr(images, 'submit', lambda *args: submitted.append(args))
+    with app.app_context():
+        admin_id = make_user('admin', admin=True).id
+        hospital = make_hospital('KEM Hospital')
+        data = {name: getattr(hospital, name) for name in
+                ('name', 'hrn', 'address', 'city_or_town', 'state', 'zip_code', 'phone', 'email')}
+    log_in(client, admin_id)
+    data.update(current_hrn=data['hrn'], image=(io.BytesIO(png()), 'kem.png', 'image/png'))
+    response = client.post('/hospitals/HRN-kem-hospital/edit', data=data, content_type='multipart/form-data')
+    assert response.status_code == 302
+    assert b'.medium.png' not in client.get('/hospitals').data
+
+    [(path, done)] = submitted
+    submit(path, done).result()
+    assert b'.medium.png' in client.get('/hospitals').data
+    assert b'.medium.png' in client.get('/hospitals/HRN-kem-hospital/').data
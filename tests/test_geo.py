@@ -0,0 +1,115 @@
+import pytest
+import sqlalchemy as sa
+
+from app import db
+from app import geo
+from app import inventory
+from app.enums import BloodGroupEnum as BG, StockMovementReasonEnum as Reason
+from app.matching import nearest_donors
+from app.models import Hospital
+from conftest import make_user, make_hospital, log_in
+
+ZIP_CODES = {
+    '400001': (18.9388, 72.8354),  # Mumbai
+    '411001': (18.5204, 73.8567),  # Pune
+    '380001': (23.0225, 72.5714),  # Ahmedabad
+    '110001': (28.6328, 77.2197),  # Delhi
+}
+PUNE = ZIP_CODES['411001']
+
+
+@pytest.fixture(autouse=True)
+def forget_locations():
+    # The location cache is module level and would outlive each database.
+    geo.forget_locations()
+    yield
+    geo.forget_locations()
+
+
+def load_zip_codes():
+    return geo.load_zip_codes(db.session, [dict(zip_code=zip_code, latitude=latitude, longitude=longitude)
+                                           for zip_code, (latitude, longitude) in ZIP_CODES.items()])
+
+
+def hospitals():
+    for name, zip_code in [('Mumbai', '400001'), ('Pune', '411001'), ('Ahmedabad', '380001'), ('Delhi', '110001')]:
+        make_hospital(name + ' Hospital', zip_code=zip_code)
+
+
+def names(found):
+    return [hospital.name.split()[0] for hospital, _ in found]
+
+
+def test_encode_and_cells():
+    assert geo.encode(57.64911, 10.40744, 11) == 'u4pruydqqvj'
+    assert geo.encode(*PUNE).startswith(geo.encode(*PUNE, precision=4))
+    cells = geo.neighbourhood(*PUNE, precision=5)
+    assert len(cells) == 9 and geo.encode(*PUNE, precision=5) in cells
+    assert len(geo.neighbourhood(89.99, 0.0, 3)) == 6
+
+
+def test_loading_zip_codes_locates_existing_rows(ctx):
+    hospitals()
+    assert db.session.scalar(sa.select(sa.func.count()).where(Hospital.geohash.is_not(None))) == 0
+    assert load_zip_codes() == 4
+    db.session.expire_all()
+    pune = db.session.scalar(sa.select(Hospital).where(Hospital.zip_code == '411001'))
+    assert (pune.latitude, pune.longitude, pune.geohash) == (*PUNE, geo.encode(*PUNE))
+    # New rows are located as they are flushed.
+    assert make_hospital('Sassoon Hospital', zip_code='411001').geohash == pune.geohash
+    assert make_hospital('Nowhere Hospital', zip_code='999999').geohash is None
+
+
+def test_nearest_hospitals_in_distance_order(ctx):
+    load_zip_codes()
+    hospitals()
+    found = inventory.nearest_hospitals(*PUNE, limit=3)
+    assert names(found) == ['Pune', 'Mumbai', 'Ahmedabad']
+    assert found[0][1] == pytest.approx(0, abs=1e-6)
+    assert found[1][1] == pytest.approx(120, abs=5)
+    # Asking for more than there are falls back to a full scan.
+    assert names(inventory.nearest_hospitals(*PUNE, limit=10)) == ['Pune', 'Mumbai', 'Ahmedabad', 'Delhi']
+
+
+def test_nearest_hospitals_with_stock(ctx):
+    load_zip_codes()
+    hospitals()
+    for name, quantity in [('Ahmedabad Hospital', 3), ('Mumbai Hospital', 1)]:
+        hospital = db.session.scalar(sa.select(Hospital).where(Hospital.name == name))
+        inventory.record_movement(hospital, BG.O_NEGATIVE, quantity, Reason.RECEIVED)
+    db.session.commit()
+    assert names(inventory.nearest_hospitals(*PUNE, blood_group='O-', limit=5)) == ['Mumbai', 'Ahmedabad']
+    assert names(inventory.nearest_hospitals(*PUNE, blood_group='O-', quantity=2, limit=5)) == ['Ahmedabad']
+
+
+def test_within_a_radius(ctx):
+    load_zip_codes()
+    hospitals()
+    columns = (Hospital.id, Hospital.latitude, Hospital.longitude, Hospital.geohash)
+    ids = {h.name.split()[0]: h.id for h in db.session.scalars(sa.select(Hospital))}
+    assert [i for i, _ in geo.within(db.session, columns, *PUNE, 200)] == [ids['Pune'], ids['Mumbai']]
+    assert [i for i, _ in geo.within(db.session, columns, *PUNE, 10)] == [ids['Pune']]
+    assert len(geo.within(db.session, columns, *PUNE, 5000)) == 4
+
+
+def test_nearest_compatible_donors(ctx):
+    load_zip_codes()
+    make_user('a-pos-pune', blood_group=BG.A_POSITIVE, zip_code='411001')
+    make_user('o-neg-mumbai', blood_group=BG.O_NEGATIVE, zip_code='400001')
+    make_user('b-pos-pune', blood_group=BG.B_POSITIVE, zip_code='411001')
+    make_user('a-neg-delhi', blood_group=BG.A_NEGATIVE, zip_code='110001')
+    found = nearest_donors('A+', *PUNE, limit=2)
+    assert [profile.user.username for profile, _ in found] == ['a-pos-pune', 'o-neg-mumbai']
+
+
+def test_nearest_hospitals_page(app, client):
+    with app.app_context():
+        load_zip_codes()
+        hospitals()
+        user_id = make_user('reader').id
+    log_in(client, user_id)
+    response = client.get('/hospitals/nearest?zip_code=411001')
+    assert response.status_code == 200
+    assert response.text.index('Pune Hospital') < response.text.index('Mumbai Hospital')
+    assert '0.0 km' in response.text
+    assert client.get('/hospitals/nearest?zip_code=999999').status_code == 302
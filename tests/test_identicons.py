@@ -0,0 +1,49 @@
+import os
+
+from app import identicons
+from app.identicons import email_digest
+from conftest import make_user
+
+DIGEST = email_digest('someone@example.com')
+
+
+def test_digest_ignores_case():
+    assert email_digest('Someone@Example.COM') == DIGEST
+
+
+def test_route_serves_an_immutable_png_without_writing_it(app, client):
+    response = client.get('/identicon/{}/36.png'.format(DIGEST))
+    assert response.status_code == 200
+    assert response.mimetype == 'image/png' and response.data.startswith(b'\x89PNG')
+    assert 'immutable' in response.headers['Cache-Control']
+    assert not os.path.exists(app.config['IDENTICON_FOLDER'])
+
+    again = client.get('/identicon/{}/36.png'.format(DIGEST), headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_route_refuses_unknown_sizes_and_digests(client):
+    assert client.get('/identicon/{}/37.png'.format(DIGEST)).status_code == 404
+    assert client.get('/identicon/{}/36.png'.format('g' * 32)).status_code == 404
+    assert client.get('/identicon/{}/36.png'.format(DIGEST.upper())).status_code == 404
+
+
+def test_pregenerated_files_are_read_back(app):
+    path = identicons.path(DIGEST, 36)
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(b'pregenerated')
+    assert identicons.render(DIGEST, 36) == b'pregenerated'
+
+
+def test_pregenerate_command_renders_missing_icons(app):
+    with app.app_context():
+        user = make_user('someone')
+        digest = user.identicon_digest
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['avatars', 'pregenerate', '--size', '36', '--workers', '1'])
+    assert 'Rendered 1 identicons.' in result.output
+    with open(identicons.path(digest, 36), 'rb') as f:
+        assert f.read().startswith(b'\x89PNG')
+    result = runner.invoke(args=['avatars', 'pregenerate', '--size', '36', '--workers', '1'])
+    assert 'Rendered 0 identicons.' in result.output
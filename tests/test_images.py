@@ -0,0 +1,66 @@
+import io
+import os
+import time
+
+import sqlalchemy as sa
+from PIL import Image
+
+from app import db, images
+from app.images import variant_path
+from app.models import User
+from conftest import make_user, log_in
+
+
+def png(size=(600, 400), color=(200, 30, 30)):
+    data = io.BytesIO()
+    Image.new('RGB', size, color).save(data, 'PNG')
+    return data.getvalue()
+
+
+def test_variants_are_cropped_or_fitted(tmp_path):
+    path = tmp_path / 'upload.png'
+    path.write_bytes(png((2000, 1000)))
+    images.process(str(path))
+    with Image.open(variant_path(str(path), 'small')) as small:
+        assert small.size == (88, 88)
+    with Image.open(variant_path(str(path), 'web')) as web:
+        assert web.size == (1280, 640)
+    assert not any(name.endswith('.part') for name in os.listdir(tmp_path))
+
+
+def test_a_broken_upload_does_not_raise(tmp_path):
+    path = tmp_path / 'upload.png'
+    path.write_bytes(b'not an image')
+    images.process(str(path))
+    assert os.listdir(tmp_path) == ['upload.png']
+
+
+def test_url_falls_back_to_the_original(app, tmp_path):
+    images.static_folder = str(tmp_path)
+    (tmp_path / 'photo.png').write_bytes(png())
+    with app.test_request_context():
+        assert images.url('photo.png', 'medium').startswith('/static/photo.png')
+        images.process(str(tmp_path / 'photo.png'))
+        assert images.url('photo.png', 'medium').startswith('/static/photo.medium.png')
+        assert images.url('photo.png').startswith('/static/photo.png')
+
+
+def test_avatar_upload_is_resized_in_the_background(app, client):
+    with app.app_context():
+        user_id = make_user('uploader').id
+    log_in(client, user_id)
+    response = client.post('/user/uploader/edit', data=dict(
+        phone='9123456780', dob='1990-01-01', gender='OTHER', address='1 Main Road', city_or_town='Mumbai',
+        state='Maharashtra', zip_code='400001', blood_group='O_POSITIVE',
+        avatar=(io.BytesIO(png()), 'me.png', 'image/png'),
+    ), content_type='multipart/form-data')
+    assert response.status_code == 302
+
+    with app.app_context():
+        avatar = db.session.scalar(sa.select(User.avatar).where(User.id == user_id))
+    path = os.path.join(app.static_folder, avatar)
+    assert os.path.exists(path)
+    deadline = time.monotonic() + 10
+    while not os.path.exists(variant_path(path, 'medium')) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert os.path.exists(variant_path(path, 'medium'))
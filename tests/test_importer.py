@@ -0,0 +1,96 @@
+import csv
+import gzip
+import json
+import threading
+
+import sqlalchemy as sa
+
+from app import db, passwords
+from app import importer
+from app.enums import BloodGroupEnum
+from app.models import User, Hospital
+from conftest import PASSWORD, make_hospital
+
+
+def hospital(i, **fields):
+    row = dict(name='Hospital {}'.format(i), hrn='HRN{}'.format(i), address='{} Road'.format(i),
+               city_or_town='Pune', state='Maharashtra', zip_code='411001',
+               phone='80000000{:02d}'.format(i), email='h{}@example.com'.format(i))
+    row.update(fields)
+    return row
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def test_hospitals_are_imported_in_chunks_and_bad_rows_rejected(ctx, tmp_path):
+    make_hospital('Hospital 0', hrn='HRN-existing')
+    rows = [hospital(i) for i in range(1, 6)] + [
+        hospital(6, email='not an email'),
+        hospital(7, hrn='HRN1'),
+        hospital(0),
+    ]
+    rejects = importer.RejectsWriter(str(tmp_path / 'rejects.csv'), 'csv')
+    imported = importer.import_hospitals(write_csv(tmp_path / 'hospitals.csv', rows), rejects, chunk_size=3)
+    rejects.close()
+
+    assert imported == 5
+    assert db.session.scalar(sa.select(sa.func.count()).select_from(Hospital)) == 6
+    with open(rejects.path) as f:
+        rejected = {row['_line']: json.loads(row['_errors']) for row in csv.DictReader(f)}
+    assert set(rejected) == {'7', '8', '9'}
+    assert 'email' in rejected['7'] and 'hrn' in rejected['8'] and 'name' in rejected['9']
+    # Bulk inserts bypass the mapper, so the full-text index is fed directly.
+    assert [h.name for h in Hospital.search('hospital 3')] == ['Hospital 3']
+
+
+def test_users_get_hashed_passwords_and_optional_profiles(ctx, tmp_path):
+    path = tmp_path / 'users.jsonl.gz'
+    with gzip.open(path, 'wt') as f:
+        f.write(json.dumps(dict(username='plain', email='plain@example.com', phone='9000000001',
+                                password=PASSWORD)) + '\n')
+        f.write(json.dumps(dict(username='donor', email='donor@example.com', phone='9000000002',
+                                password=PASSWORD, dob='1990-01-01', gender='FEMALE', address='1 Road',
+                                state='Goa', zip_code='403001', blood_group='B_NEGATIVE')) + '\n')
+        f.write(json.dumps(dict(username='weak', email='weak@example.com', phone='9000000003',
+                                password='short')) + '\n')
+        f.write('{not json\n')
+    rejects = importer.RejectsWriter(str(tmp_path / 'rejects.jsonl'), 'jsonl')
+    assert importer.import_users(str(path), rejects) == 2
+    rejects.close()
+
+    users = {u.username: u for u in db.session.scalars(sa.select(User))}
+    assert set(users) == {'plain', 'donor'}
+    assert passwords.verify(users['donor'].password_hash, PASSWORD)
+    assert users['plain'].profile is None
+    assert users['donor'].profile.blood_group == BloodGroupEnum.B_NEGATIVE
+    with open(rejects.path) as f:
+        assert [json.loads(line)['_line'] for line in f] == [3, 4]
+
+
+def test_import_command_writes_rejects_next_to_the_input(app, tmp_path):
+    path = write_csv(tmp_path / 'hospitals.csv', [hospital(1), hospital(2, phone='x')])
+    result = app.test_cli_runner().invoke(args=['import', 'hospitals', path])
+    assert result.exit_code == 0, result.output
+    assert 'Imported 1 rows, rejected 1.' in result.output
+    assert (tmp_path / 'hospitals.rejects.csv').exists()
+
+
+def test_a_busy_hasher_slows_an_import_down_instead_of_failing_it(ctx, tmp_path):
+    # Someone else holds the only slot for a moment.
+    passwords._slots = threading.BoundedSemaphore(1)
+    passwords._slots.acquire()
+    threading.Timer(0.05, passwords._slots.release).start()
+    path = tmp_path / 'users.jsonl'
+    with open(path, 'w') as f:
+        for i in range(6):
+            f.write(json.dumps(dict(username='user{}'.format(i), email='user{}@example.com'.format(i),
+                                    phone='900000001{}'.format(i), password=PASSWORD)) + '\n')
+    rejects = importer.RejectsWriter(str(tmp_path / 'rejects.jsonl'), 'jsonl')
+    assert importer.import_users(str(path), rejects, chunk_size=4) == 6
+    rejects.close()
@@ -0,0 +1,120 @@
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+import sqlalchemy as sa
+
+from app import db
+from app import inventory
+from app.enums import BloodGroupEnum as BG, BloodUnitStatusEnum, StockMovementReasonEnum as Reason
+from app.models import Hospital, BloodStock, BloodUnit, StockMovement
+from conftest import make_user, make_hospital, log_in
+
+
+def test_movements_keep_rollups_in_step_with_the_ledger(ctx):
+    hospital = make_hospital('KEM Hospital')
+    inventory.record_movement(hospital, BG.O_POSITIVE, 5, Reason.RECEIVED)
+    inventory.record_movement(hospital, BG.O_POSITIVE, -2, Reason.ISSUED)
+    inventory.record_movement(hospital, BG.A_NEGATIVE, 1, Reason.RECEIVED)
+    db.session.commit()
+
+    stock = inventory.current_stock(hospital)
+    assert stock[BG.O_POSITIVE] == 3 and stock[BG.A_NEGATIVE] == 1 and stock[BG.B_POSITIVE] == 0
+    assert db.session.scalar(sa.select(sa.func.count()).select_from(StockMovement)) == 3
+    assert inventory.check_stock() == []
+
+
+def test_taking_more_than_the_rollup_holds_fails(ctx):
+    hospital = make_hospital('KEM Hospital')
+    inventory.record_movement(hospital, BG.O_POSITIVE, 1, Reason.RECEIVED)
+    db.session.commit()
+    with pytest.raises(inventory.InsufficientStockError):
+        inventory.record_movement(hospital, BG.O_POSITIVE, -2, Reason.ISSUED)
+    with pytest.raises(inventory.InsufficientStockError):
+        inventory.record_movement(hospital, BG.B_NEGATIVE, -1, Reason.ISSUED)
+    db.session.rollback()
+    assert inventory.current_stock(hospital)[BG.O_POSITIVE] == 1
+    assert inventory.check_stock() == []
+
+
+def test_check_finds_drift_and_rebuild_repairs_it(app, ctx):
+    hospital = make_hospital('KEM Hospital')
+    inventory.record_movement(hospital, BG.O_POSITIVE, 4, Reason.RECEIVED)
+    db.session.execute(sa.insert(BloodStock), [dict(hospital_id=hospital.id, blood_group=BG.AB_POSITIVE, quantity=2)])
+    db.session.execute(sa.update(BloodStock).where(BloodStock.blood_group == BG.O_POSITIVE).values(quantity=7))
+    db.session.commit()
+    assert {tuple(row[1:]) for row in inventory.check_stock()} == {(BG.O_POSITIVE, 4, 7), (BG.AB_POSITIVE, 0, 2)}
+
+    result = app.test_cli_runner().invoke(args=['stock', 'check'])
+    assert 'O+: ledger 4 rollup 7' in result.output
+
+    inventory.rebuild_stock()
+    db.session.commit()
+    assert inventory.check_stock() == []
+    assert inventory.current_stock(hospital)[BG.O_POSITIVE] == 4
+
+
+def test_stock_form_records_a_movement(app, client):
+    with app.app_context():
+        admin_id = make_user('admin', admin=True).id
+        make_hospital('KEM Hospital')
+    log_in(client, admin_id)
+    expires = (date.today() + timedelta(days=30)).isoformat()
+    response = client.post('/hospitals/HRN-kem-hospital/stock', data=dict(
+        blood_group=BG.O_NEGATIVE.name, quantity=3, reason=Reason.RECEIVED.name, expires_at=expires
+    ))
+    assert response.status_code == 302
+    response = client.post('/hospitals/HRN-kem-hospital/stock', data=dict(
+        blood_group=BG.O_NEGATIVE.name, quantity=5, reason=Reason.ISSUED.name
+    ))
+    assert response.status_code == 302
+    with app.app_context():
+        hospital = db.session.scalar(sa.select(Hospital))
+        assert inventory.current_stock(hospital)[BG.O_NEGATIVE] == 3
+        assert inventory.check_stock() == []
+
+
+def test_allocate_takes_units_closest_to_expiry(ctx):
+    hospital = make_hospital('KEM Hospital')
+    now = datetime(2026, 6, 1, tzinfo=timezone.utc)
+    for days in (20, 5, 10, -1):
+        inventory.receive(hospital, BG.B_POSITIVE, 1, now + timedelta(days=days), now=now - timedelta(days=30))
+    db.session.commit()
+
+    units = inventory.allocate(hospital, BG.B_POSITIVE, 2, now=now)
+    db.session.commit()
+    assert [unit.expires_at.date() for unit in units] == [date(2026, 6, 6), date(2026, 6, 11)]
+    assert all(unit.status == BloodUnitStatusEnum.ISSUED for unit in units)
+
+    # Only the unit expiring in 20 days is left; the lapsed one never counts.
+    with pytest.raises(inventory.InsufficientStockError):
+        inventory.allocate(hospital, BG.B_POSITIVE, 2, now=now)
+    db.session.rollback()
+    assert inventory.allocate(hospital, BG.B_POSITIVE, 1, reason=Reason.DISCARDED, now=now)[0].status \
+        == BloodUnitStatusEnum.DISCARDED
+
+
+def test_allocate_only_issues_or_discards(ctx):
+    hospital = make_hospital('KEM Hospital')
+    inventory.receive(hospital, BG.B_POSITIVE, 1, datetime.now(timezone.utc) + timedelta(days=1))
+    for reason in (Reason.RECEIVED, Reason.EXPIRED):
+        with pytest.raises(ValueError):
+            inventory.allocate(hospital, BG.B_POSITIVE, 1, reason=reason)
+
+
+def test_expire_units_flags_lapsed_units_once(ctx):
+    first, second = make_hospital('KEM Hospital'), make_hospital('Sion Hospital')
+    now = datetime(2026, 6, 1, tzinfo=timezone.utc)
+    inventory.receive(first, BG.O_POSITIVE, 3, now - timedelta(hours=1), now=now - timedelta(days=30))
+    inventory.receive(first, BG.O_POSITIVE, 2, now + timedelta(days=1), now=now - timedelta(days=30))
+    inventory.receive(second, BG.A_POSITIVE, 1, now - timedelta(days=2), now=now - timedelta(days=30))
+    db.session.commit()
+
+    assert inventory.expire_units(now=now) == 4
+    assert inventory.expire_units(now=now) == 0
+    db.session.commit()
+    assert inventory.current_stock(first)[BG.O_POSITIVE] == 2
+    assert inventory.current_stock(second)[BG.A_POSITIVE] == 0
+    assert db.session.scalar(
+        sa.select(sa.func.count()).where(BloodUnit.status == BloodUnitStatusEnum.EXPIRED)
+    ) == 4
+    assert inventory.check_stock() == []
@@ -0,0 +1,69 @@
+from app.enums import BloodGroupEnum as BG
+from app.matching import COMPATIBLE_DONORS, CAN_DONATE_TO, is_compatible, find_donors
+from app.pagination import encode_cursor
+from conftest import make_user, log_in
+
+
+def test_compatibility_follows_the_antigens():
+    assert CAN_DONATE_TO[BG.O_NEGATIVE] == frozenset(BG)
+    assert CAN_DONATE_TO[BG.AB_POSITIVE] == {BG.AB_POSITIVE}
+    assert is_compatible('O+', 'A+') and is_compatible('A-', 'AB-')
+    assert not is_compatible('A+', 'A-') and not is_compatible('B-', 'A+')
+
+
+def test_identical_group_first_universal_donor_last():
+    assert COMPATIBLE_DONORS[BG.A_POSITIVE] == (BG.A_POSITIVE, BG.A_NEGATIVE, BG.O_POSITIVE, BG.O_NEGATIVE)
+    assert COMPATIBLE_DONORS[BG.O_NEGATIVE] == (BG.O_NEGATIVE,)
+
+
+def donors(rows):
+    for name, group, zip_code in rows:
+        make_user(name, blood_group=group, zip_code=zip_code)
+
+
+def usernames(page):
+    return [profile.user.username for profile in page]
+
+
+def test_same_zip_code_then_best_group(ctx):
+    donors([
+        ('o-neg-far', BG.O_NEGATIVE, '411001'),
+        ('a-pos-far', BG.A_POSITIVE, '411001'),
+        ('o-neg-near', BG.O_NEGATIVE, '400001'),
+        ('b-pos-near', BG.B_POSITIVE, '400001'),
+        ('a-pos-near', BG.A_POSITIVE, '400001'),
+    ])
+    page = find_donors('A+', state='Maharashtra', zip_code='400001')
+    assert usernames(page) == ['a-pos-near', 'o-neg-near', 'a-pos-far', 'o-neg-far']
+    assert not page.has_next
+
+
+def test_cursor_continues_across_tiers(ctx):
+    donors([('a{}'.format(i), BG.A_POSITIVE, '400001') for i in range(3)]
+           + [('o{}'.format(i), BG.O_NEGATIVE, '400002') for i in range(3)])
+    seen, cursor = [], None
+    while True:
+        page = find_donors('A+', cursor=cursor, per_page=2)
+        seen += usernames(page)
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+    assert seen == ['a0', 'a1', 'a2', 'o0', 'o1', 'o2']
+
+
+def test_cursor_that_does_not_fit_is_ignored(ctx):
+    donors([('a{}'.format(i), BG.A_POSITIVE, '400001') for i in range(3)])
+    first = usernames(find_donors('A+', per_page=2))
+    for cursor in ('garbage', encode_cursor([99, 'x']), encode_cursor([0, 1, 2, 3]),
+                   encode_cursor([0, 5, 'Maharashtra', '400001']), encode_cursor([True, 'Maharashtra', '400001', 1])):
+        assert usernames(find_donors('A+', cursor=cursor, per_page=2)) == first
+
+
+def test_donor_search_page(app, client):
+    with app.app_context():
+        admin_id = make_user('admin', admin=True).id
+        donors([('match', BG.O_NEGATIVE, '400001'), ('no-match', BG.AB_POSITIVE, '400001')])
+    log_in(client, admin_id)
+    response = client.get('/donors?blood_group=O-')
+    assert response.status_code == 200
+    assert b'match' in response.data and b'no-match' not in response.data
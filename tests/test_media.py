@@ -0,0 +1,102 @@
+import io
+import os
+import time
+
+from werkzeug.datastructures import FileStorage
+
+from app import db, media
+from conftest import make_user
+
+
+def upload(data, filename='photo.JPEG'):
+    return FileStorage(io.BytesIO(data), filename=filename)
+
+
+def age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_same_bytes_are_stored_once(app, tmp_path):
+    folder = str(tmp_path)
+    first, path, created = media.save(upload(b'same bytes'), folder)
+    again, again_path, again_created = media.save(upload(b'same bytes', 'other.jpg'), folder)
+    other, other_path, other_created = media.save(upload(b'other bytes'), folder)
+
+    assert created and not again_created and other_created
+    assert (again, again_path) == (first, path) and other_path != path
+    digest = os.path.basename(path).split('.')[0]
+    assert path == os.path.join(folder, digest[:2], digest[2:4], digest + '.jpg')
+    assert not [name for name in os.listdir(folder) if name.endswith('.part')]
+
+
+def test_a_shard_removed_by_the_collector_is_made_again(app, tmp_path, monkeypatch):
+    replace, calls = os.replace, []
+
+    def collected(src, dst):
+        calls.append(dst)
+        if len(calls) == 1:
+            # As collect_garbage() would, between save()'s makedirs and here.
+            os.rmdir(os.path.dirname(dst))
+        replace(src, dst)
+
+    monkeypatch.setattr(os, 'replace', collected)
+    _, path, created = media.save(upload(b'raced bytes'), str(tmp_path))
+    assert created and os.path.exists(path)
+    assert calls == [path, path]
+
+
+def test_a_repeated_upload_refreshes_the_blob_and_its_variants(app, tmp_path):
+    _, path, _ = media.save(upload(b'same bytes'), str(tmp_path))
+    variant = path.replace('.jpg', '.small.jpg')
+    open(variant, 'wb').close()
+    for p in (path, variant):
+        age(p, 7200)
+
+    media.save(upload(b'same bytes'), str(tmp_path))
+    assert time.time() - os.path.getmtime(path) < 60
+    assert time.time() - os.path.getmtime(variant) < 60
+    assert media.collect_garbage(str(tmp_path), [], min_age=3600) == []
+
+
+def test_gc_removes_old_unreferenced_blobs_with_their_variants(app, tmp_path):
+    folder = str(tmp_path)
+    kept, kept_path, _ = media.save(upload(b'kept'), folder)
+    _, orphan_path, _ = media.save(upload(b'orphan'), folder)
+    _, young_path, _ = media.save(upload(b'young'), folder)
+    orphan_variant = orphan_path.replace('.jpg', '.medium.jpg')
+    open(orphan_variant, 'wb').close()
+    for p in (kept_path, orphan_path, orphan_variant):
+        age(p, 7200)
+
+    assert sorted(media.collect_garbage(folder, [kept], dry_run=True)) == sorted([orphan_path, orphan_variant])
+    assert os.path.exists(orphan_path)
+
+    media.collect_garbage(folder, [kept])
+    assert os.path.exists(kept_path) and os.path.exists(young_path)
+    assert not os.path.exists(orphan_path) and not os.path.exists(orphan_variant)
+    assert not os.path.exists(os.path.dirname(orphan_path))
+
+
+def test_legacy_uploads_only_go_when_asked(tmp_path):
+    legacy = tmp_path / 'old-upload.png'
+    legacy.write_bytes(b'legacy')
+    age(legacy, 7200)
+    assert media.collect_garbage(str(tmp_path), []) == []
+    assert media.collect_garbage(str(tmp_path), ['images/avatars/old-upload.png'], include_legacy=True) == []
+    assert media.collect_garbage(str(tmp_path), [], include_legacy=True) == [str(legacy)]
+
+
+def test_gc_command_keeps_what_users_refer_to(app):
+    folder = app.config['AVATAR_UPLOAD_FOLDER']
+    with app.app_context():
+        kept, kept_path, _ = media.save(upload(b'kept'), folder)
+        _, orphan_path, _ = media.save(upload(b'orphan'), folder)
+        user = make_user('uploader')
+        user.avatar = kept
+        db.session.commit()
+    os.makedirs(app.config['IMAGE_UPLOAD_FOLDER'])
+
+    result = app.test_cli_runner().invoke(args=['media', 'gc', '--min-age', '0'])
+    assert result.exit_code == 0, result.output
+    assert os.path.exists(kept_path) and not os.path.exists(orphan_path)
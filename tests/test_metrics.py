@@ -0,0 +1,97 @@
+import os
+import json
+import atexit
+
+import pytest
+import sqlalchemy as sa
+from flask import g
+
+from app import create_app, db
+from app import metrics
+from app.metrics import Metrics, RETIRED_FILE
+
+REQUESTS = 'http_requests_total{endpoint="main.index",method="GET",status="200"}'
+
+
+@pytest.fixture
+def shared(config, tmp_path):
+    class SharedConfig(config):
+        METRICS_DIR = str(tmp_path / 'metrics')
+        METRICS_TOKEN = 'secret'
+
+    return create_app(SharedConfig)
+
+
+def scrape(client, token='secret'):
+    return client.get('/metrics', headers={'Authorization': 'Bearer ' + token})
+
+
+def requests(client):
+    # Counters live as long as the process, so tests compare before/after.
+    for line in scrape(client).text.splitlines():
+        if line.startswith(REQUESTS + ' '):
+            return float(line.split()[-1])
+    return 0.0
+
+
+def test_endpoint_is_off_without_a_token(client):
+    assert client.get('/metrics').status_code == 404
+
+
+def test_endpoint_wants_the_bearer_token(config):
+    class TokenConfig(config):
+        METRICS_TOKEN = 'secret'
+
+    client = create_app(TokenConfig).test_client()
+    assert client.get('/metrics').status_code == 401
+    assert scrape(client, 'wrong').status_code == 401
+    assert scrape(client, 'sécret').status_code == 401
+
+    before = requests(client)
+    client.get('/')
+    response = scrape(client)
+    assert response.status_code == 200
+    assert '{} {}'.format(REQUESTS, before + 1) in response.text
+    assert 'http_request_duration_seconds_bucket{endpoint="main.index",le="+Inf"}' in response.text
+
+
+def test_dead_workers_are_folded_once(shared):
+    directory = shared.config['METRICS_DIR']
+    client = shared.test_client()
+    before = requests(client)
+    dead = os.path.join(directory, '999999999-0badf00d.json')
+    with open(dead, 'w') as f:
+        json.dump({'counters': [['http_requests_total', [['endpoint', 'main.index'], ['method', 'GET'],
+                                                         ['status', '200']], 3]], 'histograms': []}, f)
+    assert requests(client) == before + 3
+    assert not os.path.exists(dead)
+    assert os.path.exists(os.path.join(directory, RETIRED_FILE))
+
+    client.get('/')
+    assert requests(client) == before + 4
+
+
+def test_an_exiting_worker_folds_its_own_totals(shared):
+    directory = shared.config['METRICS_DIR']
+    worker = Metrics(shared, db)
+    atexit.unregister(worker.retire)
+    worker.inc('notifications_total', (('outcome', 'sent'),), 5)
+    worker.flush()
+    assert os.path.exists(worker._file)
+
+    worker.retire()
+    assert not os.path.exists(worker._file)
+    with open(os.path.join(directory, RETIRED_FILE)) as f:
+        assert json.load(f)['counters'] == [['notifications_total', [['outcome', 'sent']], 5]]
+    worker.flush()
+    assert not os.path.exists(worker._file)
+
+
+def test_a_failing_statement_leaves_no_timer_on_the_connection(app):
+    with app.test_request_context(), db.engine.connect() as connection:
+        metrics._start()
+        with pytest.raises(sa.exc.OperationalError):
+            connection.exec_driver_sql('SELECT * FROM no_such_table')
+        assert not [key for key in connection.info if key.startswith('_metrics')]
+        connection.exec_driver_sql('SELECT 1')
+        assert g._metrics_db_count == 1
@@ -0,0 +1,99 @@
+import pytest
+import sqlalchemy as sa
+
+from app import db
+from app.models import Hospital, User
+from app.pagination import paginate_keyset, encode_cursor, decode_cursor
+from conftest import make_user, make_hospital, log_in
+
+
+def test_pages_walk_every_row_once_in_order(ctx):
+    for i in range(7):
+        make_hospital('Hospital {}'.format(i))
+    names, cursor = [], None
+    while True:
+        page = paginate_keyset(db.session, sa.select(Hospital), [Hospital.name], cursor=cursor, per_page=3)
+        names += [hospital.name for hospital in page]
+        if not page.has_next:
+            break
+        cursor = page.next_cursor
+    assert names == ['Hospital {}'.format(i) for i in range(7)]
+
+
+def test_composite_keyset_breaks_ties(ctx):
+    for i, city in enumerate(['Pune', 'Mumbai', 'Pune', 'Mumbai']):
+        make_hospital('Hospital {}'.format(i), city_or_town=city)
+    columns = [Hospital.city_or_town, Hospital.name]
+    first = paginate_keyset(db.session, sa.select(Hospital), columns, per_page=2)
+    second = paginate_keyset(db.session, sa.select(Hospital), columns, cursor=first.next_cursor, per_page=2)
+    assert [h.name for h in first] == ['Hospital 1', 'Hospital 3']
+    assert [h.name for h in second] == ['Hospital 0', 'Hospital 2']
+    assert not second.has_next
+
+
+def test_cursor_that_does_not_fit_starts_over(ctx):
+    for i in range(3):
+        make_hospital('Hospital {}'.format(i))
+    for cursor in ('not base64!', encode_cursor([1]), encode_cursor(['a', 'b']), encode_cursor([None])):
+        page = paginate_keyset(db.session, sa.select(Hospital), [Hospital.name], cursor=cursor, per_page=2)
+        assert [h.name for h in page] == ['Hospital 0', 'Hospital 1']
+
+
+def test_decode_cursor_checks_types_against_columns():
+    assert decode_cursor(encode_cursor(['x', 3]), [User.username, User.id]) == ['x', 3]
+    assert decode_cursor(encode_cursor([3, 'x']), [User.username, User.id]) is None
+    assert decode_cursor(encode_cursor([True]), [User.id]) is None
+    assert decode_cursor(encode_cursor(['yesterday']), [User.updated_at]) is None
+
+
+def test_directory_filters_and_links_the_next_page(app, client):
+    with app.app_context():
+        user_id = make_user('reader').id
+        for i in range(3):
+            make_hospital('Pune {}'.format(i), city_or_town='Pune')
+        make_hospital('Mumbai 0')
+    app.config['HOSPITALS_PER_PAGE'] = 2
+    log_in(client, user_id)
+
+    response = client.get('/hospitals?city_or_town=Pune')
+    assert response.status_code == 200
+    assert b'Pune 0' in response.data and b'Pune 1' in response.data
+    assert b'Pune 2' not in response.data and b'Mumbai' not in response.data
+    assert b'Next page' in response.data
+
+
+@pytest.mark.parametrize('filters', [
+    {}, {'state': 'Goa'}, {'city_or_town': 'Panaji'}, {'zip_code': '403001'},
+    {'state': 'Goa', 'city_or_town': 'Panaji'}, {'state': 'Goa', 'zip_code': '403001'},
+    {'city_or_town': 'Panaji', 'zip_code': '403001'},
+    {'state': 'Goa', 'city_or_town': 'Panaji', 'zip_code': '403001'},
+])
+def test_every_directory_filter_pages_off_an_index(app, client, filters):
+    with app.app_context():
+        user_id = make_user('reader').id
+        for i in range(3):
+            make_hospital('Hospital {}'.format(i), state='Goa', city_or_town='Panaji', zip_code='403001')
+    app.config['HOSPITALS_PER_PAGE'] = 1
+    log_in(client, user_id)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM hospital' in statement and 'ORDER BY hospital.name' in statement:
+            statements.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    sa.event.listen(engine, 'before_cursor_execute', record)
+    try:
+        first = client.get('/hospitals', query_string=filters)
+        cursor = first.text.split('cursor=')[1].split('&')[0].split('"')[0]
+        client.get('/hospitals', query_string=dict(filters, cursor=cursor))
+    finally:
+        sa.event.remove(engine, 'before_cursor_execute', record)
+
+    assert len(statements) == 2
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = ' '.join(row[-1] for row in connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement,
+                                                                           parameters))
+            assert 'TEMP B-TREE' not in plan and 'USING INDEX' in plan, plan
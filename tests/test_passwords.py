@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+import sqlalchemy as sa
+from werkzeug.security import generate_password_hash
+
+from app import db, passwords
+from app.models import User
+from app.passwords import PasswordHasherBusy
+from conftest import PASSWORD, make_user
+
+
+def test_hashes_with_the_configured_method(ctx):
+    pwhash = passwords.hash(PASSWORD)
+    assert pwhash.startswith('pbkdf2:sha256:1000$')
+    assert passwords.verify(pwhash, PASSWORD)
+    assert not passwords.verify(pwhash, 'wrong')
+    assert not passwords.verify(None, PASSWORD)
+    assert not passwords.needs_rehash(pwhash)
+    assert passwords.needs_rehash(generate_password_hash(PASSWORD, method='pbkdf2:sha256:2000'))
+
+
+def test_login_rehashes_a_password_hashed_with_old_parameters(app, client):
+    with app.app_context():
+        user = make_user('old')
+        user.password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:2000')
+        db.session.commit()
+
+    response = client.post('/login', data=dict(username='old', password=PASSWORD))
+    assert response.status_code == 302
+    with app.app_context():
+        pwhash = db.session.scalar(sa.select(User.password_hash).where(User.username == 'old'))
+        assert pwhash.startswith('pbkdf2:sha256:1000$')
+
+
+def test_wrong_password_keeps_the_old_hash(app, client):
+    with app.app_context():
+        user = make_user('old')
+        old = user.password_hash = generate_password_hash(PASSWORD, method='pbkdf2:sha256:2000')
+        db.session.commit()
+
+    client.post('/login', data=dict(username='old', password='wrong'))
+    with app.app_context():
+        assert db.session.scalar(sa.select(User.password_hash).where(User.username == 'old')) == old
+
+
+def test_full_queue_turns_logins_away(app, client):
+    with app.app_context():
+        make_user('someone')
+    passwords._slots = threading.BoundedSemaphore(1)
+    passwords._slots.acquire()
+    response = client.post('/login', data=dict(username='someone', password=PASSWORD))
+    assert response.status_code == 503
+
+
+def test_timeout_is_reported_as_busy(ctx):
+    release = threading.Event()
+    passwords.timeout = 0.05
+    try:
+        with pytest.raises(PasswordHasherBusy):
+            passwords._run(release.wait, 5)
+    finally:
+        release.set()
+
+
+def test_bulk_hashing_waits_for_a_slot(ctx):
+    passwords._slots = threading.BoundedSemaphore(1)
+    passwords._slots.acquire()
+    with pytest.raises(PasswordHasherBusy):
+        passwords.hash(PASSWORD)
+    threading.Timer(0.05, passwords._slots.release).start()
+    hashes = passwords.hash_many([PASSWORD, 'other password'])
+    assert passwords.verify(hashes[0], PASSWORD) and passwords.verify(hashes[1], 'other password')
@@ -0,0 +1,56 @@
+import logging
+
+import pytest
+
+from app import create_app
+from app.enums import BloodGroupEnum
+from app.query_budget import QueryBudgetExceeded
+from conftest import make_user, log_in
+
+
+@pytest.fixture
+def reader(app, client):
+    with app.app_context():
+        user_id = make_user('reader').id
+    log_in(client, user_id)
+
+
+def test_statements_are_counted_per_request(app, client, reader):
+    first = int(client.get('/hospitals').headers['X-SQL-Queries'])
+    assert 1 <= first <= app.config['SQL_QUERY_BUDGET']
+    assert int(client.get('/hospitals').headers['X-SQL-Queries']) <= first
+
+
+def test_going_over_budget_raises_under_testing(app, client, reader):
+    app.config['SQL_QUERY_BUDGETS'] = {'main.hospitals': 0}
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/hospitals')
+
+
+def test_log_and_off_actions(app, client, reader, caplog):
+    app.config['SQL_QUERY_BUDGETS'] = {'main.hospitals': 0}
+    app.config['SQL_QUERY_BUDGET_ACTION'] = 'log'
+    with caplog.at_level(logging.WARNING):
+        assert client.get('/hospitals').status_code == 200
+    assert 'budget for main.hospitals is 0' in caplog.text
+
+    app.config['SQL_QUERY_BUDGET_ACTION'] = 'off'
+    assert 'X-SQL-Queries' not in client.get('/hospitals').headers
+
+
+def test_donor_list_does_not_load_users_one_by_one(app, client):
+    with app.app_context():
+        admin_id = make_user('admin', admin=True).id
+        donors = app.config['SQL_QUERY_BUDGET'] + 5
+        for i in range(donors):
+            make_user('donor{}'.format(i), blood_group=BloodGroupEnum.O_NEGATIVE)
+    log_in(client, admin_id)
+    response = client.get('/donors?blood_group=O-')
+    assert response.status_code == 200
+    assert 'donor{}'.format(donors - 1).encode() in response.data
+
+
+def test_each_app_counts_a_statement_once(config, app, client, reader):
+    single = client.get('/hospitals').headers['X-SQL-Queries']
+    create_app(config)
+    assert client.get('/hospitals').headers['X-SQL-Queries'] == single
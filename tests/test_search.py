@@ -0,0 +1,59 @@
+from app import db
+from app.models import Hospital
+from app.search import search_terms, search_hospitals
+from conftest import make_user, make_hospital, log_in
+
+
+def names(q):
+    return sorted(hospital.name for hospital in Hospital.search(q))
+
+
+def test_index_follows_inserts_updates_and_deletes(ctx):
+    lilavati = make_hospital('Lilavati Hospital', address='Bandra Reclamation')
+    make_hospital('Ruby Hall Clinic', city_or_town='Pune')
+    assert names('bandra') == ['Lilavati Hospital']
+    assert names('pune') == ['Ruby Hall Clinic']
+
+    lilavati.address = 'Andheri West'
+    db.session.commit()
+    assert names('bandra') == []
+    assert names('andheri') == ['Lilavati Hospital']
+
+    db.session.delete(lilavati)
+    db.session.commit()
+    assert names('andheri') == []
+    assert names('lilavati') == []
+
+
+def test_prefixes_and_diacritics_match(ctx):
+    make_hospital('Sahyadri Hospital', city_or_town='Pimpri-Chinchwad')
+    make_hospital('Hôpital Saint Louis', city_or_town='Pondicherry')
+    assert names('sahy') == ['Sahyadri Hospital']
+    assert names('pimpri chin') == ['Sahyadri Hospital']
+    assert names('hopital') == ['Hôpital Saint Louis']
+
+
+def test_query_syntax_is_not_passed_through(ctx):
+    make_hospital('Jaslok Hospital')
+    assert search_terms('"jaslok" OR -x*') == ['jaslok', 'OR', 'x']
+    assert names('jaslok)(*') == ['Jaslok Hospital']
+    assert names('  ') == []
+
+
+def test_the_substring_fallback_escapes_wildcards(ctx):
+    make_hospital('St_Mary Hospital')
+    make_hospital('St-Mary Hospital')
+    found = db.session.scalars(search_hospitals(Hospital, 'default', 'st_mary')).all()
+    assert [hospital.name for hospital in found] == ['St_Mary Hospital']
+
+
+def test_search_page(app, client):
+    with app.app_context():
+        user_id = make_user('reader').id
+        make_hospital('Kokilaben Hospital', city_or_town='Andheri')
+        make_hospital('Breach Candy Hospital')
+    log_in(client, user_id)
+    response = client.get('/hospitals/search?q=kokila')
+    assert response.status_code == 200
+    assert b'Kokilaben Hospital' in response.data
+    assert b'Breach Candy' not in response.data
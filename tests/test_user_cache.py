@@ -0,0 +1,90 @@
+import time
+
+import sqlalchemy as sa
+
+from app import db, user_cache
+from app.cache import LRUCache
+from app.models import load_user
+from conftest import make_user, log_in
+
+
+def count_statements(fn):
+    statements = []
+
+    def listener(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sa.event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        result = fn()
+    finally:
+        sa.event.remove(db.engine, 'before_cursor_execute', listener)
+    return result, len(statements)
+
+
+def test_lru_evicts_oldest_and_expires_entries():
+    cache = LRUCache(2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    assert cache.stats()['evictions'] == 1
+
+    cache = LRUCache(2, ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+
+
+def test_second_load_costs_no_sql(ctx):
+    user_id = make_user('cached', blood_group='O+').id
+    db.session.remove()
+    user, first = count_statements(lambda: load_user(str(user_id)))
+    assert first >= 1
+    db.session.remove()
+    user, second = count_statements(lambda: load_user(str(user_id)))
+    assert second == 0
+    assert user.username == 'cached' and user.profile.blood_group.value == 'O+'
+
+
+def test_commit_invalidates_the_snapshot(ctx):
+    user_id = make_user('cached', blood_group='O+').id
+    db.session.remove()
+    load_user(str(user_id))
+    db.session.remove()
+
+    user = load_user(str(user_id))
+    user.phone = '9000000009'
+    user.profile.state = 'Goa'
+    db.session.commit()
+    db.session.remove()
+
+    user, statements = count_statements(lambda: load_user(str(user_id)))
+    assert statements >= 1
+    assert user.phone == '9000000009' and user.profile.state == 'Goa'
+
+
+def test_rolled_back_changes_do_not_invalidate(ctx):
+    user_id = make_user('cached').id
+    db.session.remove()
+    load_user(str(user_id))
+    db.session.remove()
+    user = load_user(str(user_id))
+    user.phone = '9000000009'
+    db.session.flush()
+    db.session.rollback()
+    db.session.commit()
+    assert user_cache.cache.get(user_id) is not None
+
+
+def test_stats_are_for_admins(app, client):
+    with app.app_context():
+        admin_id = make_user('admin', admin=True).id
+        user_id = make_user('user').id
+    log_in(client, user_id)
+    assert client.get('/admin/stats/user-cache').status_code == 302
+    log_in(client, admin_id)
+    response = client.get('/admin/stats/user-cache')
+    assert response.status_code == 200
+    assert set(response.json) == {'size', 'maxsize', 'hits', 'misses', 'evictions'}